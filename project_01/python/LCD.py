@@ -59,6 +59,22 @@ setCursor(column,row)
 getCursor()
 - gets the current cursor position
 
+flash(text, col, row, period=1.0)
+- Flashes the text at (col, row) every period seconds without blocking
+  (a timer of the shared timer wheel); the rest of the display can be
+  written while it flashes
+- Returns the timer of the flash
+
+endFlash(text, col, row)
+- Stops flashing and shows the text
+
+stopFlash()
+- Stops flashing and leaves the display as it is
+
+The display can be written from several threads (e.g. a flash on the
+timer wheel thread):  every command and message holds the lock of the
+display.
+
 --------------------------------------------------------------------------
 Sof
 
@@ -77,8 +93,11 @@ Background Information:
         
 """
 import Adafruit_BBIO.GPIO as GPIO
+import threading
 import time
 
+import timer_wheel as TIMER_WHEEL
+
 # ------------------------------------------------------------------------
 # Constants
 # ------------------------------------------------------------------------
@@ -151,6 +170,10 @@ class LCD():
         self._d6 = d6
         self._d7 = d7
         
+        # Commands of different threads must not interleave
+        self._lock = threading.RLock()
+        self._flash_timer = None
+        
         self.setup()
         #initializes display
         self.write8(0x33)
@@ -176,8 +199,10 @@ class LCD():
         
     def clear(self):
         """clears the LCD display"""
-        self.write8(LCD_CLEARDISPLAY) #command to clear display
-        self._delay_microseconds(3000)
+        with self._lock:
+            self.write8(LCD_CLEARDISPLAY) #command to clear display
+            self._delay_microseconds(3000)
+            self.cursor_position = (0,0)
         
         
     def setCursor(self, col, row):
@@ -190,16 +215,17 @@ class LCD():
             row = 0
         
         if col >= self._cols:
-            row = self._cols - 1
+            col = self._cols - 1
         
         if col < 0:
             col = 0
             
-        # Set location.
-        self.write8(LCD_SETDDRAMADDR | (col + LCD_ROW_OFFSETS[row]))
-        
-        #get location
-        self.cursor_position = (col,row)
+        with self._lock:
+            # Set location.
+            self.write8(LCD_SETDDRAMADDR | (col + LCD_ROW_OFFSETS[row]))
+            
+            #get location
+            self.cursor_position = (col,row)
     
     def scroll_left(self):
         row = self.cursor_position[1]
@@ -260,31 +286,59 @@ class LCD():
     
     def message(self, text):
         """Write text to display.  Note that text can include newlines."""
-        row = 0
-        # Iterate through each character.
-        for char in text:
-            # Advance to next row if character is a new row.
-            if char == '\n':
-                row += 1
-                col = 0
-                self.set_cursor(col, row)
-            # Write the character to the display.
-            else:
-                self.write8(ord(char), True)
+        with self._lock:
+            (col, row) = self.cursor_position
+            # Iterate through each character.
+            for char in text:
+                # Advance to next row if character is a new row.
+                if char == '\n':
+                    row += 1
+                    col = 0
+                    self.setCursor(col, row)
+                # Write the character to the display.
+                else:
+                    self.write8(ord(char), True)
+                    col += 1
+                    self.cursor_position = (col,row)
     
-    def flash(self, text,col,row):
-        """flashes the text on the display"""
-        while True:
-            self.setCursor(col,row)
-            self.message(textcd )
-            time.sleep(2)
+    def flash(self, text, col, row, period=1.0, wheel=None):
+        """flashes the text on the display every period seconds (does not block)"""
+        self.stopFlash()
+        
+        if wheel is None:
+            wheel = TIMER_WHEEL.default_wheel()
+        
+        # Show the text now, then alternate blanks / text
+        self._flash_step(text, col, row, [True])
+        self._flash_timer = wheel.call_every(period, self._flash_step, text, col, row, [False])
+        
+        return self._flash_timer
+    
+    def _flash_step(self, text, col, row, visible):
+        """shows the text or blanks (timer wheel thread)"""
+        with self._lock:
+            # Put the cursor back where the other writes left it
+            saved = self.cursor_position
             self.setCursor(col,row)
-            self.message("")
+            self.message(text if visible[0] else " " * len(text))
+            self.write8(LCD_SETDDRAMADDR | (saved[0] + LCD_ROW_OFFSETS[saved[1]]))
+            self.cursor_position = saved
+        
+        visible[0] = not visible[0]
+    
+    def stopFlash(self):
+        """stops flashing (the text is left as it is)"""
+        if self._flash_timer is not None:
+            self._flash_timer.cancel()
+            self._flash_timer = None
     
     def endFlash(self,text,col,row):
         """stops flashing the text"""
-        self.setCursor(col,row)
-        self.message(text)
+        self.stopFlash()
+        
+        with self._lock:
+            self.setCursor(col,row)
+            self.message(text)
         
         
     def write8(self, value, char_mode=False):
@@ -292,6 +346,10 @@ class LCD():
         value from 0-255, and char_mode is True if character data or False if
         non-character data (default).
         """
+        with self._lock:
+            self._write8(value, char_mode)
+    
+    def _write8(self, value, char_mode):
         # One millisecond delay to prevent writing too quickly.
         self._delay_microseconds(1000)
         # Set character / data bit.
@@ -0,0 +1,642 @@
+"""
+--------------------------------------------------------------------------
+Accelerometer Driver
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+
+Accelerometer Driver
+
+  Captures the acceleration of the wrist (tremor) with an MPU6050 on I2C1
+(P2_09 / P2_11, /dev/i2c-1) while the taps are timed.
+
+  The device samples on its own clock into its 1024 byte FIFO (accelerometer
+only:  6 bytes per sample).  A thread drains the FIFO every drain_time with
+multi-byte block reads of the FIFO register (30 bytes, 5 samples, per
+transfer, the largest whole number of samples in an SMBus block read)
+instead of one register read per sample, and copies the samples into a
+numpy ring.
+
+  The FIFO samples have no timestamps, and the device clock is not the
+clock of the board (the rate can be off by a percent or more).  Every
+drain gives one point (number of the newest sample, time.monotonic_ns()
+when the FIFO count was read), and the newest sample cannot be later than
+that time.  A least-squares line through these points (older points
+forgotten by FIT_DECAY per drain) gives the actual sample period;  the
+line is then moved down to the lowest of the points (followed down at once
+and up slowly), since every point is late by the time from the sample to
+the read.  Sample n is timestamped on that line, on the clock of the
+sensor taps, within about a sample period plus the bus latency whether
+the device clock is fast or slow.  After a FIFO overflow the FIFO is reset
+and the clock is fitted again.
+
+Software API:
+
+  Accelerometer(bus=I2C_BUS, address=MPU6050_ADDRESS, rate=DEFAULT_RATE,
+                full_scale=2, capacity=RING_CAPACITY, drain_time=0.1)
+    - bus:  I2C bus number or an SMBus object (e.g. FakeMPU6050)
+
+    start() / stop()
+      - Start / stop draining the FIFO (on a thread)
+
+    drain()
+      - Drain the FIFO once, returns the number of samples
+
+    read(start_ns=None, end_ns=None)
+      - Return (timestamps_ns, acceleration_g) of the samples in the ring
+        between two times (numpy arrays, n and n x 3)
+
+    tremor(start_ns=None, end_ns=None)
+      - Return Tremor(frequency, rms) of the samples between two times:
+        dominant frequency (Hz) in the tremor band and RMS amplitude (g) of
+        the acceleration without gravity
+
+    samples / transfers / overflows
+      - Counters of the samples read, the I2C transfers and the FIFO
+        overflows
+
+  FakeMPU6050(rate_error=0.0)
+    - SMBus object of a simulated MPU6050 (gravity + 6 Hz tremor + noise)
+
+Usage:
+
+  python3 accelerometer.py          - Print the tremor every second
+  python3 accelerometer.py --test   - Self test on the simulated device
+
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+
+import smbus
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+I2C_BUS           = 1             # /dev/i2c-1 (P2_09 / P2_11)
+MPU6050_ADDRESS   = 0x68
+
+# Registers
+SMPLRT_DIV        = 0x19
+CONFIG            = 0x1A
+ACCEL_CONFIG      = 0x1C
+FIFO_EN           = 0x23
+INT_STATUS        = 0x3A
+USER_CTRL         = 0x6A
+PWR_MGMT_1        = 0x6B
+FIFO_COUNT_H      = 0x72
+FIFO_R_W          = 0x74
+WHO_AM_I          = 0x75
+
+# Register values
+DEVICE_ID         = 0x68
+CLOCK_PLL_X       = 0x01          # PWR_MGMT_1:  awake, gyro X PLL clock
+DLPF_44HZ         = 0x03          # CONFIG:  1 kHz internal sample rate
+FIFO_ACCEL        = 0x08          # FIFO_EN:  accelerometer X, Y, Z
+USER_FIFO_ENABLE  = 0x40
+USER_FIFO_RESET   = 0x04
+FIFO_OVERFLOW     = 0x10          # INT_STATUS
+FULL_SCALES       = {2: 0x00, 4: 0x08, 8: 0x10, 16: 0x18}     # g: ACCEL_CONFIG
+
+INTERNAL_RATE     = 1000          # Hz (with the DLPF)
+FIFO_SIZE         = 1024          # bytes
+SAMPLE_BYTES      = 6
+BLOCK_BYTES       = 30            # 5 samples per SMBus block read (max 32 bytes)
+
+DEFAULT_RATE      = 200           # Samples per second
+RING_CAPACITY     = 60 * DEFAULT_RATE
+TREMOR_BAND       = (3.0, 15.0)   # Hz
+FIT_DECAY         = 0.99          # Weight kept by the older drains per drain
+FIT_DRAINS        = 3             # Drains before the fitted period is used
+FLOOR_GAIN        = 0.01          # Share of a later point taken per drain
+
+Tremor            = collections.namedtuple("Tremor", ["frequency", "rms"])
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class Accelerometer():
+    """ Accelerometer Class """
+    address        = None
+    rate           = None
+    full_scale     = None
+    drain_time     = None
+
+    samples        = None
+    transfers      = None
+    overflows      = None
+
+    def __init__(self, bus=I2C_BUS, address=MPU6050_ADDRESS, rate=DEFAULT_RATE, full_scale=2,
+                 capacity=RING_CAPACITY, drain_time=0.1):
+        """ Initialize variables and set up the device """
+        if full_scale not in FULL_SCALES:
+            raise ValueError("Full scale must be one of {0} g".format(sorted(FULL_SCALES)))
+
+        self._bus       = smbus.SMBus(bus) if isinstance(bus, int) else bus
+        self.address    = address
+        self.full_scale = full_scale
+        self.drain_time = drain_time
+
+        # The rate is the internal rate divided by an integer
+        divider         = max(1, int(round(INTERNAL_RATE / rate)))
+        self.rate       = INTERNAL_RATE / divider
+        self._divider   = divider
+        self._period_ns = 1e9 / self.rate
+
+        # Ring of the samples (raw counts) and their timestamps
+        self._counts    = np.zeros((capacity, 3), dtype=np.int16)
+        self._times     = np.zeros(capacity, dtype=np.int64)
+        self._written   = 0
+        self._block     = bytearray(FIFO_SIZE)
+        self._lock      = threading.Lock()
+
+        # Sample clock:  number of the next sample and the fitted line
+        self._number    = 0
+        self._reset_clock()
+
+        self.samples    = 0
+        self.transfers  = 0
+        self.overflows  = 0
+
+        self._stop      = threading.Event()
+        self._thread    = None
+
+        self._setup()
+
+    # End def
+
+
+    def _write(self, register, value):
+        """ Write a register """
+        self._bus.write_byte_data(self.address, register, value)
+        self.transfers += 1
+
+    # End def
+
+
+    def _read(self, register):
+        """ Read a register """
+        self.transfers += 1
+        return self._bus.read_byte_data(self.address, register)
+
+    # End def
+
+
+    def _setup(self):
+        """ Setup the hardware components. """
+        if self._read(WHO_AM_I) != DEVICE_ID:
+            raise ValueError("No MPU6050 at address 0x{0:02x}".format(self.address))
+
+        self._write(PWR_MGMT_1, CLOCK_PLL_X)
+        self._write(CONFIG, DLPF_44HZ)
+        self._write(SMPLRT_DIV, self._divider - 1)
+        self._write(ACCEL_CONFIG, FULL_SCALES[self.full_scale])
+        self._write(FIFO_EN, FIFO_ACCEL)
+        self._reset_fifo()
+
+    # End def
+
+
+    def _reset_fifo(self):
+        """ Empty the FIFO and anchor the sample clock again """
+        self._write(USER_CTRL, USER_FIFO_RESET)
+        self._write(USER_CTRL, USER_FIFO_ENABLE)
+
+        self._reset_clock()
+
+    # End def
+
+
+    def _reset_clock(self):
+        """ Forget the drains of the sample clock """
+        self._drains    = 0
+        self._weight    = 0.0
+        self._origin_ns = None            # read_ns of the first drain
+        self._mean_n    = 0.0             # Weighted means of the points
+        self._mean_t    = 0.0
+        self._cov_nn    = 0.0             # Weighted co-moments of the points
+        self._cov_nt    = 0.0
+        self._floor     = None            # Lowest point below the line (ns)
+
+    # End def
+
+
+    def _clock(self, newest, read_ns):
+        """ Add a drain to the sample clock
+
+            Returns (period_ns, timestamp of sample 0 - origin_ns)
+        """
+        if self._origin_ns is None:
+            self._origin_ns = read_ns
+
+        n = float(newest)
+        t = float(read_ns - self._origin_ns)
+
+        # Weighted least squares, updated in place (West's algorithm)
+        self._drains  += 1
+        self._weight   = FIT_DECAY * self._weight + 1.0
+        self._cov_nn  *= FIT_DECAY
+        self._cov_nt  *= FIT_DECAY
+
+        dn             = n - self._mean_n
+        self._mean_n  += dn / self._weight
+        self._mean_t  += (t - self._mean_t) / self._weight
+        self._cov_nn  += dn * (n - self._mean_n)
+        self._cov_nt  += dn * (t - self._mean_t)
+
+        period_ns = self._period_ns
+
+        if (self._drains >= FIT_DRAINS) and (self._cov_nn > 0):
+            # A fit far from the nominal rate is not a clock error
+            period_ns = min(max(self._cov_nt / self._cov_nn, 0.9 * self._period_ns),
+                            1.1 * self._period_ns)
+
+        # Move the line down to the lowest point
+        offset = t - (self._mean_t + (n - self._mean_n) * period_ns)
+
+        if (self._floor is None) or (offset < self._floor):
+            self._floor = offset
+        else:
+            self._floor += FLOOR_GAIN * (offset - self._floor)
+
+        return (period_ns, self._mean_t - self._mean_n * period_ns + self._floor)
+
+    # End def
+
+
+    def start(self):
+        """ Start draining the FIFO """
+        self._stop.clear()
+        self._reset_fifo()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # End def
+
+
+    def _run(self):
+        """ Drain the FIFO on absolute deadlines (drain thread) """
+        deadline = time.monotonic()
+
+        while not self._stop.is_set():
+            self.drain()
+
+            deadline = max(deadline + self.drain_time, time.monotonic())
+            self._stop.wait(deadline - time.monotonic())
+
+    # End def
+
+
+    def stop(self):
+        """ Stop draining the FIFO """
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # End def
+
+
+    def drain(self):
+        """ Read the samples of the FIFO into the ring, returns their number """
+        if self._read(INT_STATUS) & FIFO_OVERFLOW:
+            self.overflows += 1
+            self._reset_fifo()
+            return 0
+
+        # Whole samples only (a sample may be half written)
+        self.transfers += 1
+        (high, low)     = self._bus.read_i2c_block_data(self.address, FIFO_COUNT_H, 2)
+        read_ns         = time.monotonic_ns()
+        size            = ((high << 8) | low) // SAMPLE_BYTES * SAMPLE_BYTES
+
+        if size == 0:
+            return 0
+
+        # Burst reads of the FIFO register into one buffer
+        view = memoryview(self._block)
+
+        for offset in range(0, size, BLOCK_BYTES):
+            length = min(BLOCK_BYTES, size - offset)
+            view[offset:offset + length] = bytes(
+                self._bus.read_i2c_block_data(self.address, FIFO_R_W, length))
+            self.transfers += 1
+
+        counts = np.frombuffer(self._block, dtype=">i2", count=size // 2).reshape(-1, 3)
+        count  = len(counts)
+
+        # The newest sample is not later than read_ns
+        (period_ns, zero_ns) = self._clock(self._number + count - 1, read_ns)
+
+        times = (self._origin_ns + (zero_ns + np.arange(self._number, self._number + count) *
+                                    period_ns)).astype(np.int64)
+
+        self._store(counts, times)
+
+        self._number += count
+        self.samples += count
+
+        return count
+
+    # End def
+
+
+    def _store(self, counts, times):
+        """ Copy samples into the ring """
+        capacity = len(self._times)
+
+        with self._lock:
+            # Only the newest samples fit
+            counts = counts[-capacity:]
+            times  = times[-capacity:]
+            start  = self._written % capacity
+            first  = min(len(times), capacity - start)
+
+            self._counts[start:start + first] = counts[:first]
+            self._times[start:start + first]  = times[:first]
+            self._counts[:len(times) - first] = counts[first:]
+            self._times[:len(times) - first]  = times[first:]
+
+            self._written += len(times)
+
+    # End def
+
+
+    def read(self, start_ns=None, end_ns=None):
+        """ Return (timestamps_ns, acceleration_g) of the samples between two times """
+        capacity = len(self._times)
+
+        with self._lock:
+            count = min(self._written, capacity)
+            start = (self._written - count) % capacity
+            order = (np.arange(count) + start) % capacity
+            times = self._times[order]
+            accel = self._counts[order] * (self.full_scale / 32768.0)
+
+        keep = np.ones(count, dtype=bool)
+
+        if start_ns is not None:
+            keep &= times >= start_ns
+
+        if end_ns is not None:
+            keep &= times <= end_ns
+
+        return (times[keep], accel[keep])
+
+    # End def
+
+
+    def tremor(self, start_ns=None, end_ns=None):
+        """ Return Tremor(frequency, rms) of the samples between two times """
+        (times, accel) = self.read(start_ns, end_ns)
+
+        if len(times) < self.rate:
+            return Tremor(float("nan"), float("nan"))
+
+        # Gravity is the mean of every axis;  the tremor is what is left
+        motion = accel - accel.mean(axis=0)
+        rms    = float(np.sqrt((motion ** 2).sum(axis=1).mean()))
+
+        # Dominant frequency of the axis with the most motion
+        axis     = int(np.argmax(motion.var(axis=0)))
+        spectrum = np.abs(np.fft.rfft(motion[:, axis] * np.hanning(len(motion))))
+        freqs    = np.fft.rfftfreq(len(motion), 1.0 / self.rate)
+        band     = (freqs >= TREMOR_BAND[0]) & (freqs <= TREMOR_BAND[1])
+
+        return Tremor(float(freqs[band][np.argmax(spectrum[band])]), rms)
+
+    # End def
+
+
+    def cleanup(self):
+        """ Stop draining and put the device to sleep """
+        self.stop()
+        self._write(PWR_MGMT_1, 0x40)
+
+    # End def
+
+# End class
+
+
+class FakeMPU6050():
+    """ Simulated MPU6050 Class (SMBus object) """
+    tremor_frequency = None
+    tremor_amplitude = None
+
+    def __init__(self, rate_error=0.0, tremor_frequency=6.0, tremor_amplitude=0.05,
+                 noise=0.005, seed=1):
+        """ Gravity on Z, a sine tremor on X (g) and noise;  rate_error is the
+            relative error of the device clock
+        """
+        self.tremor_frequency = tremor_frequency
+        self.tremor_amplitude = tremor_amplitude
+
+        self._rate_error = rate_error
+        self._noise      = noise
+        self._rng        = np.random.default_rng(seed)
+        self._registers  = {WHO_AM_I: DEVICE_ID}
+        self._fifo       = bytearray()
+        self._sampled    = None           # monotonic_ns() of the last sample
+        self._number     = 0
+
+        # monotonic_ns() of every sample since the FIFO was reset
+        self.times_ns    = []
+
+    # End def
+
+
+    def _sample(self):
+        """ Add the samples due since the last call to the FIFO """
+        now_ns = time.monotonic_ns()
+
+        if not (self._registers.get(USER_CTRL, 0) & USER_FIFO_ENABLE):
+            self._sampled = now_ns
+            return
+
+        rate      = INTERNAL_RATE / (self._registers.get(SMPLRT_DIV, 0) + 1)
+        period_ns = 1e9 / (rate * (1 + self._rate_error))
+        count     = int((now_ns - self._sampled) // period_ns)
+
+        if count <= 0:
+            return
+
+        self.times_ns.extend(int(self._sampled + (i + 1) * period_ns) for i in range(count))
+        self._sampled += int(count * period_ns)
+
+        t      = (self._number + np.arange(count)) / rate
+        accel  = np.zeros((count, 3))
+        accel[:, 0] = self.tremor_amplitude * np.sin(2 * np.pi * self.tremor_frequency * t)
+        accel[:, 2] = 1.0
+        accel += self._rng.normal(0, self._noise, accel.shape)
+
+        scale  = 32768.0 / [2, 4, 8, 16][self._registers.get(ACCEL_CONFIG, 0) >> 3]
+        counts = np.clip(accel * scale, -32768, 32767).astype(">i2")
+
+        self._number += count
+        self._fifo   += counts.tobytes()
+
+        if len(self._fifo) > FIFO_SIZE:
+            self._fifo = self._fifo[:FIFO_SIZE]
+            self._registers[INT_STATUS] = FIFO_OVERFLOW
+
+    # End def
+
+
+    def write_byte_data(self, address, register, value):
+        """ Write a register """
+        if (register == USER_CTRL) and (value & USER_FIFO_RESET):
+            self._fifo    = bytearray()
+            self._sampled = time.monotonic_ns()
+            self.times_ns = []
+            self._registers[INT_STATUS] = 0
+
+        self._registers[register] = value
+
+    # End def
+
+
+    def read_byte_data(self, address, register):
+        """ Read a register (reading INT_STATUS clears it) """
+        self._sample()
+
+        value = self._registers.get(register, 0)
+
+        if register == INT_STATUS:
+            self._registers[INT_STATUS] = 0
+
+        return value
+
+    # End def
+
+
+    def read_i2c_block_data(self, address, register, length):
+        """ Block read:  FIFO count, FIFO data or registers """
+        self._sample()
+
+        if register == FIFO_COUNT_H:
+            return [len(self._fifo) >> 8, len(self._fifo) & 0xFF]
+
+        if register == FIFO_R_W:
+            data       = self._fifo[:length]
+            self._fifo = self._fifo[length:]
+            return list(data)
+
+        return [self._registers.get(register + i, 0) for i in range(length)]
+
+    # End def
+
+# End class
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import sys
+
+    if "--test" in sys.argv:
+        print("Accelerometer Test")
+
+        # Device clock 1 % fast and 1 % slow:  the timestamps follow it
+        for rate_error in (0.01, -0.01):
+            device        = FakeMPU6050(rate_error=rate_error)
+            accelerometer = Accelerometer(device, rate=200)
+
+            start_ns = time.monotonic_ns()
+            accelerometer.start()
+            time.sleep(6.0)
+            accelerometer.stop()
+            end_ns   = time.monotonic_ns()
+
+            (times, accel) = accelerometer.read()
+            tremor         = accelerometer.tremor()
+            period_ns      = 1e9 / (accelerometer.rate * (1 + rate_error))
+
+            # Error against the time the simulated device took every sample
+            errors = (times - np.array(device.times_ns[:len(times)])) / 1e6
+            late   = errors[len(errors) // 2:]
+
+            print("    Clock {0:+.0%}: {1} samples ({2:.0f}/s), {3:.2f} transfers per sample, "
+                  "{4} overflows".format(rate_error, accelerometer.samples,
+                                         accelerometer.samples * 1e9 / (end_ns - start_ns),
+                                         accelerometer.transfers / accelerometer.samples,
+                                         accelerometer.overflows))
+            print("        Timestamp error {0:+.2f} to {1:+.2f} ms (last 3 s {2:+.2f} to "
+                  "{3:+.2f} ms), spacing {4:.3f} ms".format(errors.min(), errors.max(),
+                                                            late.min(), late.max(),
+                                                            np.diff(times).mean() / 1e6))
+            print("        Tremor {0:.2f} Hz, {1:.1f} mg rms".format(tremor.frequency,
+                                                                    tremor.rms * 1e3))
+
+            assert abs(accelerometer.samples - 6 * 200 * (1 + rate_error)) < 0.05 * 6 * 200
+            assert np.abs(late).max() < (period_ns + 2e6) / 1e6
+            assert abs(np.diff(times).mean() - period_ns) < 0.001 * period_ns
+            assert abs(tremor.frequency - device.tremor_frequency) < 0.5
+            assert abs(tremor.rms - device.tremor_amplitude / np.sqrt(2)) < 0.01
+            assert accelerometer.transfers / accelerometer.samples < 0.5
+
+        # Overflow:  a FIFO not drained in time is reset
+        accelerometer.drain()
+        time.sleep(1.2)
+        accelerometer.drain()
+        assert accelerometer.overflows == 1
+
+        print("Test Complete")
+
+    else:
+        print("Accelerometer Tremor (Ctrl-C to exit)")
+
+        accelerometer = Accelerometer()
+        accelerometer.start()
+
+        try:
+            while True:
+                time.sleep(1.0)
+                tremor = accelerometer.tremor(time.monotonic_ns() - int(5e9))
+                print("    {0:.1f} Hz, {1:.1f} mg rms".format(tremor.frequency, tremor.rms * 1e3))
+
+        except KeyboardInterrupt:
+            pass
+
+        accelerometer.cleanup()
@@ -0,0 +1,262 @@
+"""
+--------------------------------------------------------------------------
+Asyncio Device Adapters
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Asyncio Device Adapters
+
+  Awaitable wrappers around the Button, Sensor, LCD, LED and Buzzer drivers
+so that the TapFreq test can run as one asyncio event loop.
+
+  Inputs use GPIO edge detection instead of polling (the asyncio API of
+input_device.InputDevice):  the Adafruit_BBIO event thread timestamps every
+edge with time.monotonic_ns() as soon as it happens and hands it to the
+event loop, so waiting uses no CPU and the timestamps do not depend on what
+the loop is doing.  LCD writes busy-wait in the driver, so they run on a
+worker thread (one per LCD, which keeps the writes in order).  Buzzer tones
+and LED flashes are coroutines that sleep on the event loop instead of
+blocking it.
+
+Software API:
+
+  AsyncButton(button)
+    await press()
+      - Wait for the button to be pressed and released
+      - Returns (press_ns, release_ns)
+
+  AsyncSensor(sensor)
+    await tap()
+      - Wait for the sensor to be tapped and released
+      - Returns (onset_ns, release_ns) (also stored in the Sensor)
+
+  AsyncLCD(lcd)
+    await clear() / await message(text) / await show(row, text)
+
+  AsyncLED(led)
+    on() / off()
+    await flash(length)
+
+  AsyncBuzzer(buzzer)
+    await play(frequency, length)
+
+"""
+import asyncio
+import concurrent.futures
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class AsyncButton():
+    """ Async Button Class """
+    button         = None
+
+    def __init__(self, button):
+        """ Wrap a button.Button """
+        self.button = button
+
+    # End def
+
+
+    async def press(self):
+        """ Wait for the button to be pressed and released """
+        return await self.button.pressed()
+
+    # End def
+
+# End class
+
+
+class AsyncSensor():
+    """ Async Sensor Class """
+    sensor         = None
+
+    def __init__(self, sensor):
+        """ Wrap a sensor.Sensor """
+        self.sensor = sensor
+
+    # End def
+
+
+    async def tap(self):
+        """ Wait for the sensor to be tapped and released """
+        return await self.sensor.cycle()
+
+    # End def
+
+# End class
+
+
+class AsyncLCD():
+    """ Async LCD Class """
+    lcd            = None
+    cols           = None
+
+    def __init__(self, lcd, cols=16):
+        """ Wrap an LCD.LCD """
+        self.lcd       = lcd
+        self.cols      = cols
+
+        # One thread so the writes reach the display in order
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    # End def
+
+
+    async def _call(self, function, *args):
+        """ Run an LCD function on the LCD thread """
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    # End def
+
+
+    async def clear(self):
+        """ Clear the display """
+        await self._call(self.lcd.clear)
+
+    # End def
+
+
+    async def message(self, text):
+        """ Clear the display and show text """
+        await self._call(self._message, text)
+
+    # End def
+
+
+    def _message(self, text):
+        """ Clear the display and show text (LCD thread) """
+        self.lcd.clear()
+        self.lcd.message(text)
+
+    # End def
+
+
+    async def show(self, row, text):
+        """ Replace the text of a row """
+        await self._call(self._show, row, text)
+
+    # End def
+
+
+    def _show(self, row, text):
+        """ Replace the text of a row (LCD thread) """
+        self.lcd.setCursor(0, row)
+        self.lcd.message(text[0:self.cols].ljust(self.cols))
+
+    # End def
+
+
+    def close(self):
+        """ Stop the LCD thread """
+        self._executor.shutdown()
+
+    # End def
+
+# End class
+
+
+class AsyncLED():
+    """ Async LED Class """
+    led            = None
+
+    def __init__(self, led):
+        """ Wrap a led.LED """
+        self.led = led
+
+    # End def
+
+
+    def on(self):
+        """ Turn the LED on """
+        self.led.on()
+
+    # End def
+
+
+    def off(self):
+        """ Turn the LED off """
+        self.led.off()
+
+    # End def
+
+
+    async def flash(self, length=1.0):
+        """ Turn the LED on for length seconds """
+        self.led.on()
+
+        try:
+            await asyncio.sleep(length)
+        finally:
+            self.led.off()
+
+    # End def
+
+# End class
+
+
+class AsyncBuzzer():
+    """ Async Buzzer Class """
+    buzzer         = None
+
+    def __init__(self, buzzer):
+        """ Wrap a buzzer.Buzzer """
+        self.buzzer = buzzer
+
+    # End def
+
+
+    async def play(self, frequency, length=1.0):
+        """ Play the frequency for length seconds """
+        self.buzzer.play(frequency, 0.0)
+
+        try:
+            await asyncio.sleep(length)
+        finally:
+            self.buzzer.stop()
+
+    # End def
+
+# End class
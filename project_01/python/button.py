@@ -44,14 +44,20 @@ button is not pressed) and will be connected to power when the button is pressed
   To select the pull up configuration, press_low=True.  To select the pull down
 configuration, press_low=False.
 
+  The button is an input_device.InputDevice:  the pin is sampled by the
+engine of the device (polled every "sleep_time", GPIO edge events or an
+input hub, see input_device) and the callback functions are run by it.
+
 
 Software API:
 
-  Button(pin, press_low)
+  Button(pin, press_low, sleep_time=0.1, dispatcher=None, engine=None, hub=None)
     - Provide pin that the button monitors
+    - engine:  input_device.POLL / EDGE / HUB (None for the default engine)
     
     wait_for_press()
-      - Wait for the button to be pressed 
+      - Wait for the button to be pressed (presses from before the wait
+        do not count)
       - Function consumes time
         
     is_pressed()
@@ -61,8 +67,23 @@ Software API:
     get_last_press_duration()
       - Return the duration the button was last pressed
 
+    await pressed(timeout=None)
+      - Wait for the button to be pressed and released from asyncio, woken
+        by the GPIO edges (no polling);  returns (press_ns, release_ns) and
+        raises TimeoutError after timeout seconds
+
+    async for event in events()
+      - ButtonEvent(pressed, timestamp_ns, duration) of every press and
+        release (duration of the press in seconds on a release, else None)
+
     cleanup()
       - Clean up HW
+
+    set_dispatcher(dispatcher)
+      - Run the callback functions on a callback_dispatch.CallbackDispatcher
+        (worker thread / event loop) instead of inside the polling loops, so
+        a slow callback does not delay the next edge (None to run them
+        inline)
       
     Callback Functions:
       These functions will be called at the various times during a button 
@@ -85,10 +106,13 @@ Software API:
 
 
 """
+import collections
 import time
 
 import Adafruit_BBIO.GPIO as GPIO
 
+import input_device as INPUT_DEVICE
+
 # ------------------------------------------------------------------------
 # Constants
 # ------------------------------------------------------------------------
@@ -96,6 +120,8 @@ import Adafruit_BBIO.GPIO as GPIO
 HIGH          = GPIO.HIGH
 LOW           = GPIO.LOW
 
+ButtonEvent   = collections.namedtuple("ButtonEvent", ["pressed", "timestamp_ns", "duration"])
+
 # ------------------------------------------------------------------------
 # Global variables
 # ------------------------------------------------------------------------
@@ -106,14 +132,11 @@ LOW           = GPIO.LOW
 # Functions / Classes
 # ------------------------------------------------------------------------
 
-class Button():
+class Button(INPUT_DEVICE.InputDevice):
     """ Button Class """
-    pin                           = None
-    
     unpressed_value               = None
     pressed_value                 = None
     
-    sleep_time                    = None
     press_duration                = None
 
     pressed_callback              = None
@@ -125,42 +148,25 @@ class Button():
     on_release_callback           = None
     on_release_callback_value     = None
     
+    # (while active, while inactive, on activation, on release)
+    CALLBACKS                     = ("pressed_callback", "unpressed_callback",
+                                     "on_press_callback", "on_release_callback")
+    
     
-    def __init__(self, pin=None, press_low=True, sleep_time=0.1):
+    def __init__(self, pin=None, press_low=True, sleep_time=0.1, dispatcher=None,
+                 engine=None, hub=None):
         """ Initialize variables and set up the button """
-        if (pin == None):
-            raise ValueError("Pin not provided for Button()")
-        else:
-            self.pin = pin
+        self.press_duration  = 0.0        
         
         # For pull up resistor configuration:    press_low = True
         # For pull down resistor configuration:  press_low = False
-        if press_low:
-            self.unpressed_value = HIGH
-            self.pressed_value   = LOW
-        else:
-            self.unpressed_value = LOW
-            self.pressed_value   = HIGH
+        INPUT_DEVICE.InputDevice.__init__(self, pin, press_low, sleep_time, dispatcher,
+                                          engine, hub)
         
-        # By default sleep time is "0.1" seconds
-        self.sleep_time      = sleep_time
-        self.press_duration  = 0.0        
-
-        # Initialize the hardware components        
-        self._setup()
+        self.unpressed_value = self.inactive_value
+        self.pressed_value   = self.active_value
     
     # End def
-    
-    
-    def _setup(self):
-        """ Setup the hardware components. """
-        # Initialize Button
-        # HW#4 TODO: (one line of code)
-        #   Remove "pass" and use the Adafruit_BBIO.GPIO library to set up the button
-        GPIO.setup(self.pin, GPIO.IN )
-        pass
-
-    # End def
 
 
     def is_pressed(self):
@@ -169,11 +175,7 @@ class Button():
            Returns:  True  - Button is pressed
                      False - Button is not pressed
         """
-        # HW#4 TODO: (one line of code)
-        #   Remove "pass" and return the comparison of input value of the GPIO pin of 
-        #   the buton (i.e. self.pin) to the "pressed value" of the class 
-        
-        return GPIO.input(self.pin)==self.pressed_value;
+        return self.is_active()
 
     # End def
 
@@ -190,68 +192,60 @@ class Button():
            Arguments:  None
            Returns:    None
         """
-        button_press_time = None
-        
-        # Wait for button press
-        #   Execute the unpressed callback function based on the sleep time
-        #
-        # HW#4 TODO: (one line of code)
-        #   Update while loop condition to compare the input value of the  
-        #   GPIO pin of the buton (i.e. self.pin) to the "unpressed value" 
-        #   of the class (i.e. we are executing the while loop while the 
-        #   button is not being pressed)
-        #
-        while(GPIO.input(self.pin)==self.unpressed_value):
-        
-            if self.unpressed_callback is not None:
-                self.unpressed_callback_value = self.unpressed_callback()
-            
-            time.sleep(self.sleep_time)
-            
-        # Record time
-        button_press_time = time.time()
-        
-        # Executed the on press callback function
-        if self.on_press_callback is not None:
-            self.on_press_callback_value = self.on_press_callback()
-        
-        # Wait for button release
-        #   Execute the pressed callback function based on the sleep time
-        #
-        # HW#4 TODO: (one line of code)
-        #   Update while loop condition to compare the input value of the  
-        #   GPIO pin of the buton (i.e. self.pin) to the "pressed value" 
-        #   of the class (i.e. we are executing the while loop while the 
-        #   button is being pressed)
-        #
-        while(GPIO.input(self.pin)==self.pressed_value):
+        # A press made before the wait (e.g. while reading the results)
+        # is stale
+        self.discard()
+        self.wait_for_cycle()
         
-            if self.pressed_callback is not None:
-                self.pressed_callback_value = self.pressed_callback()
-                
-            time.sleep(self.sleep_time)
-        
-        # Record the press duration
-        self.press_duration = time.time() - button_press_time
+    # End def
 
-        # Executed the on release callback function
-        if self.on_release_callback is not None:
-            self.on_release_callback_value = self.on_release_callback()        
-        
+
+    def _on_active(self, timestamp_ns):
+        """ Record the press time """
+        self._press_ns = timestamp_ns
+    
     # End def
 
+
+    def _on_inactive(self, timestamp_ns):
+        """ Record the press duration (before the on release callback) """
+        self.press_duration = (timestamp_ns - self._press_ns) / 1e9
+    
+    # End def
+    
     
     def get_last_press_duration(self):
         """ Return the last press duration """
         return self.press_duration
     
     # End def
+
     
+    async def pressed(self, timeout=None):
+        """ Wait for the button to be pressed and released (asyncio)
+        
+           Returns:  (press_ns, release_ns) (time.monotonic_ns())
+        """
+        return await self.cycle(timeout)
     
-    def cleanup(self):
-        """ Clean up the button hardware. """
-        # Nothing to do for GPIO
-        pass
+    # End def
+    
+    
+    async def events(self):
+        """ Yield a ButtonEvent for every press and release """
+        press_ns = None
+        
+        async for event in INPUT_DEVICE.InputDevice.events(self):
+            if event.active:
+                press_ns = event.timestamp_ns
+                yield ButtonEvent(True, event.timestamp_ns, None)
+            else:
+                duration = None
+                
+                if press_ns is not None:
+                    duration = (event.timestamp_ns - press_ns) / 1e9
+                
+                yield ButtonEvent(False, event.timestamp_ns, duration)
     
     # End def
     
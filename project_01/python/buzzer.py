@@ -1,132 +1,351 @@
-# -*- coding: utf-8 -*-
-"""
---------------------------------------------------------------------------
-Buzzer
---------------------------------------------------------------------------
-License:   
-Copyright 2021-2023 Erik Welsh
-
-Based on library from
-
-Copyright 2018 Nicholas Lester
-
-Redistribution and use in source and binary forms, with or without 
-modification, are permitted provided that the following conditions are met:
-
-1. Redistributions of source code must retain the above copyright notice, this 
-list of conditions and the following disclaimer.
-
-2. Redistributions in binary form must reproduce the above copyright notice, 
-this list of conditions and the following disclaimer in the documentation 
-and/or other materials provided with the distribution.
-
-3. Neither the name of the copyright holder nor the names of its contributors 
-may be used to endorse or promote products derived from this software without 
-specific prior written permission.
-
-THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
-AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
-IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE 
-DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE 
-FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL 
-DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR 
-SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER 
-CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, 
-OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
-OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
---------------------------------------------------------------------------
-This file provides an interface to a PWM controllered buzzer.
-  - Ex:  https://www.adafruit.com/product/1536
-
-
-APIs:
-  - Buzzer(pin)
-    - play(frequency, length=1.0, stop=False)
-      - Plays the frequency for the length of time
-
-    - stop(length=0.0)
-      - Stop the buzzer (will cause breaks between tones)
-      
-    - cleanup()
-      - Stop the buzzer and clean up the PWM
-
-"""
-import time
-
-import Adafruit_BBIO.PWM as PWM
-
-# ------------------------------------------------------------------------
-# Global variables
-# ------------------------------------------------------------------------
-
-
-# ------------------------------------------------------------------------
-# Main Tasks
-# ------------------------------------------------------------------------
-
-class Buzzer():
-    pin       = None
-    
-    def __init__(self, pin):
-        self.pin = pin
-    
-    # End def
-    
-    
-    def play(self, frequency, length=1.0, stop=False):
-        """ Plays the frequency for the length of time.
-            frequency - Value in Hz or None for no tone
-            length    - Time in seconds (default 1.0 seconds)
-            stop      - Stop the buzzer (will cause breaks between tones)
-        """
-        if frequency is not None:
-            PWM.start(self.pin, 50, frequency)
-            
-        time.sleep(length)
-        
-        if (stop):
-            self.stop()
-        
-    # End def
-
-    
-    def stop(self, length=0.0):
-        """ Stops the buzzer (will cause breaks between tones)
-            length    - Time in seconds (default 0.0 seconds)
-        """
-        PWM.stop(self.pin)
-        time.sleep(length)
-        
-    # End def
-
-    
-    def cleanup(self):
-        """Stops the PWM and cleans up the PWM.
-             *** This function must be called during hardware cleanup ***
-        """
-        PWM.stop(self.pin)
-        PWM.cleanup()
-    # End def
-    
-# End class
-
-# ------------------------------------------------------------------------
-# Main script
-# ------------------------------------------------------------------------
-
-if __name__ == '__main__':
-    print("Buzzer Test")
-    
-    buzzer = Buzzer("P2_1")
-    
-    print("Play tone")
-    
-    buzzer.play(440, 1.0, False)      # Play 440Hz for 1 second
-    time.sleep(1.0)
-    buzzer.play(880, 1.0, True)       # Play 440Hz for 1 second
-    time.sleep(1.0)   
-
-    buzzer.cleanup()
-    
-    print("Test Complete")
-
+# -*- coding: utf-8 -*-
+"""
+--------------------------------------------------------------------------
+Buzzer
+--------------------------------------------------------------------------
+License:   
+Copyright 2021-2023 Erik Welsh
+
+Based on library from
+
+Copyright 2018 Nicholas Lester
+
+Redistribution and use in source and binary forms, with or without 
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this 
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, 
+this list of conditions and the following disclaimer in the documentation 
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors 
+may be used to endorse or promote products derived from this software without 
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE 
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE 
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL 
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR 
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER 
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, 
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+This file provides an interface to a PWM controllered buzzer.
+  - Ex:  https://www.adafruit.com/product/1536
+
+
+APIs:
+  - Buzzer(pin)
+    - play(frequency, length=1.0, stop=False)
+      - Plays the frequency for the length of time
+
+    - stop(length=0.0)
+      - Stop the buzzer (will cause breaks between tones)
+      
+    - cleanup()
+      - Stop the buzzer and clean up the PWM
+
+  - BackgroundBuzzer(pin, duty=50)
+    - Same API, but nothing blocks:  tones are queued and played by a
+      sequencer thread.  The PWM channel is started once (at 0% duty cycle)
+      and kept running; tones change the frequency / duty cycle in place
+      and rests set the duty cycle to 0, so there is no PWM start / stop
+      latency between tones.
+
+    - play(frequency, length=1.0, stop=False)
+      - Queue the tone; it keeps sounding after length until the next
+        tone or rest (as Buzzer.play), unless stop=True
+      - Returns the queued_ns of the tone (to find its onset in onsets)
+
+    - sequence(steps, stop=True)
+      - Queue a list of (frequency, length) steps (frequency None is a rest)
+      - Returns the queued_ns of the steps
+
+    - stop(length=0.0)
+      - Drop the queued tones and silence the buzzer now
+
+    - wait(timeout=None)
+      - Wait for the queued tones to finish
+
+    - onsets
+      - (frequency, queued_ns, onset_ns) of the last tones, with the
+        time.monotonic_ns() when the tone was queued and when the PWM was
+        changed (for latency analysis)
+
+"""
+import collections
+import threading
+import time
+
+import Adafruit_BBIO.PWM as PWM
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+# Frequency of the PWM channel while it is idle (Hz)
+IDLE_FREQUENCY = 440
+
+# Number of tone onsets kept for latency analysis
+ONSETS_KEPT    = 256
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+
+# ------------------------------------------------------------------------
+# Main Tasks
+# ------------------------------------------------------------------------
+
+class Buzzer():
+    pin       = None
+    
+    def __init__(self, pin):
+        self.pin = pin
+    
+    # End def
+    
+    
+    def play(self, frequency, length=1.0, stop=False):
+        """ Plays the frequency for the length of time.
+            frequency - Value in Hz or None for no tone
+            length    - Time in seconds (default 1.0 seconds)
+            stop      - Stop the buzzer (will cause breaks between tones)
+        """
+        if frequency is not None:
+            PWM.start(self.pin, 50, frequency)
+            
+        time.sleep(length)
+        
+        if (stop):
+            self.stop()
+        
+    # End def
+
+    
+    def stop(self, length=0.0):
+        """ Stops the buzzer (will cause breaks between tones)
+            length    - Time in seconds (default 0.0 seconds)
+        """
+        PWM.stop(self.pin)
+        time.sleep(length)
+        
+    # End def
+
+    
+    def cleanup(self):
+        """Stops the PWM and cleans up the PWM.
+             *** This function must be called during hardware cleanup ***
+        """
+        PWM.stop(self.pin)
+        PWM.cleanup()
+    # End def
+    
+# End class
+
+
+class BackgroundBuzzer(Buzzer):
+    duty      = None
+    onsets    = None
+    
+    def __init__(self, pin, duty=50):
+        Buzzer.__init__(self, pin)
+        
+        self.duty       = duty
+        self.onsets     = collections.deque(maxlen=ONSETS_KEPT)
+        
+        # (frequency, length, queued_ns) steps of the sequencer
+        self._steps     = collections.deque()
+        self._condition = threading.Condition()
+        self._interrupt = False
+        self._busy      = False
+        self._closed    = False
+        self._frequency = IDLE_FREQUENCY
+        
+        # Start the channel once, silent
+        PWM.start(self.pin, 0, self._frequency)
+        
+        self._thread    = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    # End def
+    
+    
+    def play(self, frequency, length=1.0, stop=False):
+        """ Queue the frequency for the length of time.
+            frequency - Value in Hz or None for no tone
+            length    - Time in seconds (default 1.0 seconds)
+            stop      - Rest after the tone (will cause breaks between tones)
+        """
+        steps = [(frequency, length)]
+        
+        if stop:
+            steps.append((None, 0.0))
+        
+        return self.sequence(steps, False)
+        
+    # End def
+    
+    
+    def sequence(self, steps, stop=True):
+        """ Queue (frequency, length) steps (frequency None for a rest)
+            stop      - Rest after the last step
+        """
+        queued_ns = time.monotonic_ns()
+        
+        with self._condition:
+            for (frequency, length) in steps:
+                self._steps.append((frequency, length, queued_ns))
+            
+            if stop:
+                self._steps.append((None, 0.0, queued_ns))
+            
+            self._condition.notify_all()
+        
+        return queued_ns
+        
+    # End def
+    
+    
+    def stop(self, length=0.0):
+        """ Drop the queued tones and silence the buzzer now
+            length    - Rest in seconds (default 0.0 seconds)
+        """
+        with self._condition:
+            self._steps.clear()
+            self._steps.append((None, length, time.monotonic_ns()))
+            self._interrupt = True
+            self._condition.notify_all()
+        
+    # End def
+    
+    
+    def wait(self, timeout=None):
+        """ Wait for the queued tones to finish; returns False on timeout """
+        with self._condition:
+            return self._condition.wait_for(lambda: not (self._steps or self._busy), timeout)
+        
+    # End def
+    
+    
+    def _run(self):
+        """ Play the queued steps (sequencer thread) """
+        while True:
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+                
+                while (not self._steps) and (not self._closed):
+                    self._condition.wait()
+                
+                if not self._steps:
+                    return
+                
+                (frequency, length, queued_ns) = self._steps.popleft()
+                self._busy      = True
+                self._interrupt = False
+            
+            self._apply(frequency)
+            self.onsets.append((frequency, queued_ns, time.monotonic_ns()))
+            
+            # Hold the step unless stop() interrupts it
+            deadline = time.monotonic() + length
+            
+            with self._condition:
+                while not (self._interrupt or self._closed):
+                    remaining = deadline - time.monotonic()
+                    
+                    if remaining <= 0:
+                        break
+                    
+                    self._condition.wait(remaining)
+        
+    # End def
+    
+    
+    def _apply(self, frequency):
+        """ Change the tone of the running PWM channel """
+        if frequency is None:
+            PWM.set_duty_cycle(self.pin, 0)
+            return
+        
+        if frequency != self._frequency:
+            PWM.set_frequency(self.pin, frequency)
+            self._frequency = frequency
+        
+        PWM.set_duty_cycle(self.pin, self.duty)
+        
+    # End def
+
+    
+    def cleanup(self):
+        """Stops the sequencer, the PWM and cleans up the PWM.
+             *** This function must be called during hardware cleanup ***
+        """
+        with self._condition:
+            self._steps.clear()
+            self._closed = True
+            self._condition.notify_all()
+        
+        self._thread.join()
+        Buzzer.cleanup(self)
+    # End def
+    
+# End class
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    print("Buzzer Test")
+    
+    buzzer = Buzzer("P2_1")
+    
+    print("Play tone")
+    
+    buzzer.play(440, 1.0, False)      # Play 440Hz for 1 second
+    time.sleep(1.0)
+    buzzer.play(880, 1.0, True)       # Play 440Hz for 1 second
+    time.sleep(1.0)   
+
+    buzzer.cleanup()
+    
+    print("Background Buzzer Test")
+    
+    buzzer = BackgroundBuzzer("P2_1")
+    
+    # Returns at once; the scale plays in the background
+    start = time.perf_counter()
+    buzzer.sequence([(262, 0.2), (294, 0.2), (330, 0.2), (None, 0.1), (349, 0.4)])
+    print("    Queued in {0:.3f} ms".format((time.perf_counter() - start) * 1e3))
+    
+    buzzer.wait()
+    
+    for (frequency, queued_ns, onset_ns) in buzzer.onsets:
+        print("    {0!s:>4} Hz at {1:7.1f} ms".format(frequency, (onset_ns - queued_ns) / 1e6))
+    
+    # Latency of a tone:  PWM.start every time vs. the running channel
+    start = time.perf_counter()
+    for i in range(20):
+        PWM.start("P2_1", 50, 440)
+        PWM.stop("P2_1")
+    print("    PWM start/stop: {0:.2f} ms per tone".format((time.perf_counter() - start) / 20 * 1e3))
+    
+    latencies = []
+    for i in range(20):
+        buzzer.play(440, 0.0, True)
+        buzzer.wait()
+        latencies.append(buzzer.onsets[-2][2] - buzzer.onsets[-2][1])
+    print("    Background:     {0:.2f} ms per tone (queue to onset)".format(sum(latencies) / 20 / 1e6))
+    
+    buzzer.cleanup()
+    
+    print("Test Complete")
+
@@ -0,0 +1,366 @@
+"""
+--------------------------------------------------------------------------
+Callback Dispatcher
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Callback Dispatcher
+
+  Runs the callback functions of the Button and Sensor drivers away from
+their polling loops.  The driver only queues the callback (a few
+microseconds) and goes back to polling, so a slow callback (e.g. one that
+writes to the LCD) cannot delay the detection or the timestamp of the next
+edge.  The callbacks run in order on one worker thread, or on an asyncio
+event loop.
+
+  The queue is bounded.  When it is full, the overflow policy decides:
+
+    DROP_OLDEST - The oldest queued callback is dropped
+    COALESCE    - A callback that is already queued is not queued again
+                  (e.g. the "every sleep_time" callbacks); otherwise the
+                  oldest callback is dropped
+    BLOCK       - The driver waits for room in the queue (edges are still
+                  timestamped before the wait)
+
+  The return value of a callback is stored in the "<name>_value" attribute
+of the driver when the callback runs, so the get_*_callback_value()
+functions of the drivers work as before (once the callback has run).  A
+callback that raises is reported (traceback) and the next callbacks still
+run.
+
+Software API:
+
+  CallbackDispatcher(max_pending=16, policy=COALESCE, loop=None,
+                     late_after=0.1)
+    - loop:  asyncio event loop to run the callbacks on (default: a worker
+      thread)
+    - late_after:  seconds after which a callback counts as late
+
+    submit(driver, name)
+      - Queue the callback "name" of the driver (any thread)
+
+    dispatched / dropped / late / max_delay_ns
+      - Counters of the callbacks that ran / were dropped (or coalesced) /
+        started more than late_after after they were queued, and the
+        longest delay (ns)
+
+    close()
+      - Run the queued callbacks and stop the worker thread
+
+  Drivers:  Button(..., dispatcher=None) / Sensor(..., dispatcher=None) or
+  set_dispatcher(dispatcher)
+
+"""
+import collections
+import threading
+import time
+import traceback
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+# Overflow policies
+DROP_OLDEST   = "drop_oldest"
+COALESCE      = "coalesce"
+BLOCK         = "block"
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class CallbackDispatcher():
+    """ Callback Dispatcher Class """
+    max_pending    = None
+    policy         = None
+    late_after     = None
+
+    dispatched     = None
+    dropped        = None
+    late           = None
+    max_delay_ns   = None
+
+    def __init__(self, max_pending=16, policy=COALESCE, loop=None, late_after=0.1):
+        """ Start the worker thread (if there is no loop) """
+        if policy not in (DROP_OLDEST, COALESCE, BLOCK):
+            raise ValueError("Unknown overflow policy {0!r}".format(policy))
+
+        self.max_pending  = max_pending
+        self.policy       = policy
+        self.late_after   = late_after
+
+        self.dispatched   = 0
+        self.dropped      = 0
+        self.late         = 0
+        self.max_delay_ns = 0
+
+        # (driver, name, queued_ns) in order; (id(driver), name) of the queue
+        self._pending     = collections.deque()
+        self._keys        = collections.Counter()
+        self._condition   = threading.Condition()
+        self._closed      = False
+
+        self._loop        = loop
+        self._scheduled   = False
+        self._worker      = None
+
+        if loop is None:
+            self._worker = threading.Thread(target=self._work, daemon=True)
+            self._worker.start()
+
+    # End def
+
+
+    def submit(self, driver, name):
+        """ Queue the callback "name" of the driver """
+        key       = (id(driver), name)
+        queued_ns = time.monotonic_ns()
+
+        with self._condition:
+            if (self.policy == COALESCE) and self._keys[key]:
+                self.dropped += 1
+                return
+
+            if len(self._pending) >= self.max_pending:
+                if self.policy == BLOCK:
+                    while (len(self._pending) >= self.max_pending) and not self._closed:
+                        self._condition.wait()
+                else:
+                    self._pop()
+                    self.dropped += 1
+
+            self._pending.append((driver, name, queued_ns))
+            self._keys[key] += 1
+
+            if self._loop is None:
+                self._condition.notify_all()
+                return
+
+            if self._scheduled:
+                return
+
+            self._scheduled = True
+
+        self._loop.call_soon_threadsafe(self._drain)
+
+    # End def
+
+
+    def _pop(self):
+        """ Remove the oldest callback from the queue (lock held) """
+        (driver, name, queued_ns) = self._pending.popleft()
+        key                       = (id(driver), name)
+
+        self._keys[key] -= 1
+
+        if not self._keys[key]:
+            del self._keys[key]
+
+        self._condition.notify_all()
+
+        return (driver, name, queued_ns)
+
+    # End def
+
+
+    def _run(self, driver, name, queued_ns):
+        """ Run a callback and store its return value """
+        delay_ns = time.monotonic_ns() - queued_ns
+
+        self.dispatched  += 1
+        self.max_delay_ns = max(self.max_delay_ns, delay_ns)
+
+        if delay_ns > self.late_after * 1e9:
+            self.late += 1
+
+        function = getattr(driver, name)
+
+        # The callback may have been removed since it was queued
+        if function is None:
+            return
+
+        try:
+            setattr(driver, name + "_value", function())
+        except Exception:
+            traceback.print_exc()
+
+    # End def
+
+
+    def _work(self):
+        """ Run the queued callbacks (worker thread) """
+        while True:
+            with self._condition:
+                while (not self._pending) and (not self._closed):
+                    self._condition.wait()
+
+                if not self._pending:
+                    return
+
+                callback = self._pop()
+
+            self._run(*callback)
+
+    # End def
+
+
+    def _drain(self):
+        """ Run the queued callbacks (event loop) """
+        try:
+            while True:
+                with self._condition:
+                    if not self._pending:
+                        return
+
+                    callback = self._pop()
+
+                self._run(*callback)
+        finally:
+            # Scheduled again by the next submit() whatever happened
+            with self._condition:
+                self._scheduled = bool(self._pending)
+
+            if self._scheduled:
+                self._loop.call_soon_threadsafe(self._drain)
+
+    # End def
+
+
+    def close(self):
+        """ Run the queued callbacks and stop the worker thread """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        if self._worker is not None:
+            self._worker.join()
+
+    # End def
+
+# End class
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    print("Callback Dispatcher Test")
+
+    class Driver():
+        """ Driver with a slow callback """
+        on_tap_callback       = None
+        on_tap_callback_value = None
+
+    driver = Driver()
+    calls  = []
+
+    def slow():
+        time.sleep(0.05)
+        calls.append(time.monotonic_ns())
+        return len(calls)
+
+    driver.on_tap_callback = slow
+
+    # Queueing takes microseconds even though the callback takes 50 ms
+    for (policy, expected) in ((DROP_OLDEST, (4, 5)), (COALESCE, (1, 2)), (BLOCK, (10,))):
+        dispatcher = CallbackDispatcher(max_pending=4, policy=policy, late_after=0.01)
+        calls      = []
+        start      = time.perf_counter()
+
+        for i in range(10):
+            dispatcher.submit(driver, "on_tap_callback")
+
+        elapsed = time.perf_counter() - start
+        dispatcher.close()
+
+        print("    {0:11}: submit {1:7.2f} ms, ran {2:2d}, dropped {3}, late {4}".format(
+              policy, elapsed * 1e3, dispatcher.dispatched, dispatcher.dropped, dispatcher.late))
+
+        # The first callback may already be running when the rest are queued
+        assert dispatcher.dispatched in expected
+        assert dispatcher.dispatched + dispatcher.dropped == 10
+        assert driver.on_tap_callback_value == len(calls)
+
+    # A callback that raises does not stop the next ones (thread and loop)
+    import asyncio
+    import contextlib
+    import io
+
+    def failing():
+        raise RuntimeError("callback failed")
+
+    def tapped():
+        return "ran"
+
+    async def on_loop(driver):
+        dispatcher = CallbackDispatcher(policy=BLOCK, loop=asyncio.get_running_loop())
+        dispatcher.submit(driver, "on_press_callback")
+        dispatcher.submit(driver, "on_tap_callback")
+        await asyncio.sleep(0.01)
+        dispatcher.submit(driver, "on_press_callback")
+        dispatcher.submit(driver, "on_tap_callback")
+        await asyncio.sleep(0.01)
+        return dispatcher
+
+    with contextlib.redirect_stderr(io.StringIO()) as errors:
+        driver                   = Driver()
+        driver.on_press_callback = failing
+        driver.on_tap_callback   = tapped
+
+        # Thread:  the worker survives, so BLOCK never waits forever
+        dispatcher = CallbackDispatcher(max_pending=2, policy=BLOCK)
+
+        for i in range(5):
+            dispatcher.submit(driver, "on_press_callback")
+            dispatcher.submit(driver, "on_tap_callback")
+
+        dispatcher.close()
+        assert dispatcher.dispatched == 10
+        assert driver.on_tap_callback_value == "ran"
+
+        # Loop:  the drain is scheduled again after the failure
+        driver.on_tap_callback_value = None
+        dispatcher = asyncio.run(on_loop(driver))
+        assert dispatcher.dispatched == 4
+        assert driver.on_tap_callback_value == "ran"
+
+    assert errors.getvalue().count("RuntimeError: callback failed") == 7
+    print("    Raising callback: thread and loop keep dispatching")
+
+    print("Test Complete")
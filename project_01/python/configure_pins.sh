@@ -39,6 +39,9 @@
 #   - Sensor
 #   - LCD
 # 
+# NOTE:  pinmux.py configures the same pins without starting a config-pin
+#   process per pin and is used by the run script.  Keep the two in sync.
+# 
 # --------------------------------------------------------------------------
 
 # I2C1
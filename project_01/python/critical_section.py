@@ -0,0 +1,261 @@
+"""
+--------------------------------------------------------------------------
+Capture Critical Section
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Capture Critical Section
+
+  Removes the sources of pauses in the process for the duration of a tap
+collection window:
+
+    - Garbage collection:  a full collection is run on entry, the surviving
+      objects are moved to the permanent generation (gc.freeze()) and the
+      collector is disabled, so no collection can start during the window
+    - Allocation:  the columns of the TapSession are reserved up front, so
+      appending taps does not allocate
+    - Page faults:  mlockall(MCL_CURRENT | MCL_FUTURE) keeps the pages of the
+      process in RAM (needs CAP_IPC_LOCK or a large enough RLIMIT_MEMLOCK)
+    - Scheduling:  the process runs with SCHED_FIFO at the given priority
+      (needs CAP_SYS_NICE), so other processes cannot preempt it
+
+  Everything is restored on exit (the collector is re-enabled, the objects
+unfrozen and the garbage of the window collected).  Measures that are not
+permitted are skipped; "applied" lists the measures that took effect.
+
+Software API:
+
+  CriticalSection(session=None, reserve=1024, gc_freeze=True,
+                  lock_memory=False, priority=None)
+    - Context manager:  with CriticalSection(session): ...
+
+    applied
+      - Names of the measures in effect ("gc", "reserve", "mlock",
+        "priority")
+
+Usage:
+
+  python3 critical_section.py --benchmark
+    - Interval jitter of a 1 ms polling loop that allocates (like the
+      collection loop) with each measure added in turn
+
+"""
+import ctypes
+import ctypes.util
+import gc
+import os
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+# mlockall flags (linux/mman.h)
+MCL_CURRENT   = 1
+MCL_FUTURE    = 2
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _libc():
+    """ Return the C library (None if it cannot be loaded) """
+    name = ctypes.util.find_library("c")
+
+    try:
+        return ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+
+# End def
+
+
+class CriticalSection():
+    """ Capture Critical Section Class """
+    session        = None
+    reserve        = None
+    gc_freeze      = None
+    lock_memory    = None
+    priority       = None
+
+    applied        = None
+
+    def __init__(self, session=None, reserve=1024, gc_freeze=True,
+                 lock_memory=False, priority=None):
+        """ Select the measures of the critical section
+
+            session     - TapSession to reserve room in (None for no reserve)
+            reserve     - Number of taps to reserve
+            gc_freeze   - Freeze and disable the garbage collector
+            lock_memory - Lock the pages of the process in RAM
+            priority    - SCHED_FIFO priority (1 - 99, None to keep the policy)
+        """
+        self.session     = session
+        self.reserve     = reserve
+        self.gc_freeze   = gc_freeze
+        self.lock_memory = lock_memory
+        self.priority    = priority
+        self.applied     = []
+
+        self._gc_enabled = None
+        self._scheduler  = None
+
+    # End def
+
+
+    def __enter__(self):
+        """ Apply the measures """
+        self.applied = []
+
+        if self.gc_freeze:
+            self._gc_enabled = gc.isenabled()
+            gc.collect()
+            gc.freeze()
+            gc.disable()
+            self.applied.append("gc")
+
+        if self.session is not None:
+            self.session.reserve(self.reserve)
+            self.applied.append("reserve")
+
+        if self.lock_memory:
+            libc = _libc()
+
+            if (libc is not None) and (libc.mlockall(MCL_CURRENT | MCL_FUTURE) == 0):
+                self.applied.append("mlock")
+
+        if (self.priority is not None) and hasattr(os, "sched_setscheduler"):
+            scheduler = (os.sched_getscheduler(0), os.sched_getparam(0))
+
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+                self._scheduler = scheduler
+                self.applied.append("priority")
+            except OSError:
+                pass
+
+        return self
+
+    # End def
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Restore the state of the process """
+        if "priority" in self.applied:
+            (policy, param) = self._scheduler
+            os.sched_setscheduler(0, policy, param)
+
+        if "mlock" in self.applied:
+            _libc().munlockall()
+
+        if "gc" in self.applied:
+            gc.unfreeze()
+
+            if self._gc_enabled:
+                gc.enable()
+
+            # Collect the garbage of the window now that it is over
+            gc.collect()
+
+        return False
+
+    # End def
+
+# End class
+
+
+def _poll_intervals(polls=3000, poll_time=0.001):
+    """ Return the sorted intervals (ns) of a polling loop that allocates """
+    import time
+
+    intervals = []
+    last_ns   = time.monotonic_ns()
+
+    for i in range(polls):
+        time.sleep(poll_time)
+        now_ns  = time.monotonic_ns()
+        intervals.append(now_ns - last_ns)
+        last_ns = now_ns
+
+        # Cyclic garbage like the objects of the live statistics / display
+        node = {"text": "{0:.1f}Hz".format(i)}
+        node["self"] = node
+
+    return sorted(intervals)
+
+# End def
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import sys
+
+    if "--benchmark" in sys.argv:
+        import tap_session as TAP_SESSION
+
+        print("Critical Section Jitter Benchmark (3000 polls of 1 ms)")
+
+        # Long lived objects make every full collection slow
+        heap = [{"tap": i} for i in range(300000)]
+
+        for (name, options) in (("reserve only  ", {"gc_freeze": False}),
+                                ("gc            ", {}),
+                                ("gc+mlock      ", {"lock_memory": True}),
+                                ("gc+mlock+prio ", {"lock_memory": True, "priority": 50})):
+            with CriticalSection(TAP_SESSION.TapSession(), **options) as section:
+                intervals = _poll_intervals()
+
+            print("    {0}: p99 {1:6.2f} ms  max {2:6.2f} ms  ({3})".format(
+                  name, intervals[int(len(intervals) * 0.99)] / 1e6, intervals[-1] / 1e6,
+                  ", ".join(section.applied) or "-"))
+
+    else:
+        print("Critical Section Test")
+
+        enabled = gc.isenabled()
+
+        with CriticalSection(lock_memory=True, priority=10) as section:
+            assert not gc.isenabled()
+            assert gc.get_freeze_count() > 0
+            print("    Applied: {0}".format(", ".join(section.applied)))
+
+        assert gc.isenabled() == enabled
+        assert gc.get_freeze_count() == 0
+
+        print("Test Complete")
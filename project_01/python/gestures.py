@@ -0,0 +1,393 @@
+"""
+--------------------------------------------------------------------------
+Button Gestures
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+
+Button Gestures
+
+  Recognizes clicks, double clicks, long presses and hold-repeats of a
+button from the timestamps of its edges (input_device listeners), so no
+thread waits or polls for them:
+
+    CLICK        - Press and release, not followed by a second press within
+                   double_time (the click is reported double_time after the
+                   release)
+    DOUBLE_CLICK - Second press within double_time of the release of a
+                   click (reported on the second release)
+    LONG_PRESS   - Button held for long_time
+    REPEAT       - Every repeat_time while the button is still held after a
+                   long press
+
+  The edges drive a state machine (on the GPIO event thread) and the
+deadlines (long press, end of the double click window, repeats) are
+timers of the timer wheel, measured from the edge timestamps.  A timer
+that fires after the state has moved on is ignored.
+
+Software API:
+
+  GestureRecognizer(device, double_time=0.3, long_time=1.0,
+                    repeat_time=0.25, callback=None, wheel=None)
+    - device:  button.Button (any input_device.InputDevice)
+    - double_time:  None for no double clicks (clicks are reported at once)
+    - repeat_time:  None for no repeats
+    - callback(gesture) is called on the event / wheel thread (must be
+      short)
+
+    get(timeout=None)
+      - Return the next Gesture(kind, timestamp_ns, count), None after
+        timeout seconds
+
+    clear()
+      - Drop the gestures that were not read
+
+    close()
+      - Stop listening to the device
+
+"""
+import collections
+import queue
+import threading
+import time
+
+import timer_wheel as TIMER_WHEEL
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+# Gestures
+CLICK         = "click"
+DOUBLE_CLICK  = "double_click"
+LONG_PRESS    = "long_press"
+REPEAT        = "repeat"
+
+Gesture       = collections.namedtuple("Gesture", ["kind", "timestamp_ns", "count"])
+
+# States
+IDLE          = "idle"
+DOWN          = "down"                # First press
+UP            = "up"                  # Released, waiting for a second press
+DOWN_AGAIN    = "down_again"          # Second press
+HELD          = "held"                # Long press (repeating)
+
+MAX_GESTURES  = 16                    # Gestures kept until read
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class GestureRecognizer():
+    """ Gesture Recognizer Class """
+    device         = None
+    double_time    = None
+    long_time      = None
+    repeat_time    = None
+    callback       = None
+    wheel          = None
+
+    def __init__(self, device, double_time=0.3, long_time=1.0, repeat_time=0.25,
+                 callback=None, wheel=None):
+        """ Start recognizing the gestures of a device """
+        self.device      = device
+        self.double_time = double_time
+        self.long_time   = long_time
+        self.repeat_time = repeat_time
+        self.callback    = callback
+        self.wheel       = TIMER_WHEEL.default_wheel() if wheel is None else wheel
+
+        self._gestures   = queue.Queue(MAX_GESTURES)
+        self._lock       = threading.Lock()
+        self._state      = IDLE
+        self._level      = device.is_active()
+        self._press_ns   = None
+        self._release_ns = None
+        self._repeats    = 0
+
+        # Timer of the state and its token (a stale timer has an old token)
+        self._timer      = None
+        self._token      = None
+
+        device.add_listener(self._on_edge)
+
+    # End def
+
+
+    def _on_edge(self, active, timestamp_ns):
+        """ Advance the state machine on an edge (event / hub thread) """
+        gestures = []
+
+        with self._lock:
+            # Only changes of level count (a bounce may repeat an edge)
+            if active == self._level:
+                return
+
+            self._level = active
+
+            if active:
+                self._press(timestamp_ns, gestures)
+            else:
+                self._release(timestamp_ns, gestures)
+
+        self._emit(gestures)
+
+    # End def
+
+
+    def _press(self, timestamp_ns, gestures):
+        """ The button was pressed (lock held) """
+        if self._state == UP:
+            if (timestamp_ns - self._release_ns) <= self.double_time * 1e9:
+                self._cancel()
+                self._state = DOWN_AGAIN
+                return
+
+            # The end of the double click window is late:  it was a click
+            gestures.append(Gesture(CLICK, self._press_ns, 1))
+
+        self._cancel()
+        self._state    = DOWN
+        self._press_ns = timestamp_ns
+        self._schedule(self.long_time, timestamp_ns, self._on_long)
+
+    # End def
+
+
+    def _release(self, timestamp_ns, gestures):
+        """ The button was released (lock held) """
+        state = self._state
+
+        self._cancel()
+        self._state = IDLE
+
+        if state == DOWN:
+            if self.double_time:
+                self._state      = UP
+                self._release_ns = timestamp_ns
+                self._schedule(self.double_time, timestamp_ns, self._on_click)
+            else:
+                gestures.append(Gesture(CLICK, self._press_ns, 1))
+
+        elif state == DOWN_AGAIN:
+            gestures.append(Gesture(DOUBLE_CLICK, self._press_ns, 2))
+
+    # End def
+
+
+    def _schedule(self, delay, from_ns, function):
+        """ Call function(token) delay seconds after from_ns (lock held) """
+        self._token = object()
+        remaining   = delay - (time.monotonic_ns() - from_ns) / 1e9
+        self._timer = self.wheel.call_later(max(0.0, remaining), function, self._token)
+
+    # End def
+
+
+    def _cancel(self):
+        """ Cancel the timer of the state (lock held) """
+        self._token = None
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    # End def
+
+
+    def _on_long(self, token):
+        """ The button is still pressed after long_time (wheel thread) """
+        with self._lock:
+            if (token is not self._token) or (self._state != DOWN):
+                return
+
+            self._state   = HELD
+            self._repeats = 0
+            gestures      = [Gesture(LONG_PRESS, self._press_ns + int(self.long_time * 1e9), 1)]
+
+            if self.repeat_time:
+                self._timer = self.wheel.call_every(self.repeat_time, self._on_repeat, token)
+
+        self._emit(gestures)
+
+    # End def
+
+
+    def _on_repeat(self, token):
+        """ The button is still held (wheel thread) """
+        with self._lock:
+            if (token is not self._token) or (self._state != HELD):
+                return
+
+            self._repeats += 1
+            gestures       = [Gesture(REPEAT, time.monotonic_ns(), self._repeats)]
+
+        self._emit(gestures)
+
+    # End def
+
+
+    def _on_click(self, token):
+        """ No second press within double_time (wheel thread) """
+        with self._lock:
+            if (token is not self._token) or (self._state != UP):
+                return
+
+            self._state = IDLE
+            self._timer = None
+            gestures    = [Gesture(CLICK, self._press_ns, 1)]
+
+        self._emit(gestures)
+
+    # End def
+
+
+    def _emit(self, gestures):
+        """ Queue the gestures and call the callback """
+        for gesture in gestures:
+            # Keep the newest gestures when nobody reads them
+            while True:
+                try:
+                    self._gestures.put_nowait(gesture)
+                    break
+                except queue.Full:
+                    try:
+                        self._gestures.get_nowait()
+                    except queue.Empty:
+                        pass
+
+            if self.callback is not None:
+                self.callback(gesture)
+
+    # End def
+
+
+    def get(self, timeout=None):
+        """ Return the next gesture (None after timeout seconds) """
+        try:
+            return self._gestures.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    # End def
+
+
+    def clear(self):
+        """ Drop the gestures that were not read """
+        while True:
+            try:
+                self._gestures.get_nowait()
+            except queue.Empty:
+                return
+
+    # End def
+
+
+    def close(self):
+        """ Stop listening to the device """
+        self.device.remove_listener(self._on_edge)
+
+        with self._lock:
+            self._cancel()
+            self._state = IDLE
+
+    # End def
+
+# End class
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    print("Button Gestures Test")
+
+    class Edges():
+        """ Device driven by the test (edges at given times) """
+        def is_active(self):
+            return False
+
+        def add_listener(self, function):
+            self.edge = function
+
+        def remove_listener(self, function):
+            self.edge = None
+
+        def press(self, length, gap=0.0):
+            self.edge(True, time.monotonic_ns())
+            time.sleep(length)
+            self.edge(False, time.monotonic_ns())
+            time.sleep(gap)
+
+    device     = Edges()
+    recognizer = GestureRecognizer(device, double_time=0.3, long_time=0.8, repeat_time=0.2)
+
+    def kinds():
+        """ Kinds of the gestures received so far """
+        result = []
+
+        while True:
+            gesture = recognizer.get(timeout=0)
+
+            if gesture is None:
+                return result
+
+            result.append(gesture.kind)
+
+    device.press(0.1, 0.5)
+    assert kinds() == [CLICK]
+
+    device.press(0.1, 0.1)
+    device.press(0.1, 0.5)
+    assert kinds() == [DOUBLE_CLICK]
+
+    # Held for 0.8 s + 2 repeats
+    device.press(1.25, 0.1)
+    assert kinds() == [LONG_PRESS, REPEAT, REPEAT]
+
+    # Two clicks too far apart are two clicks
+    device.press(0.1, 0.4)
+    device.press(0.1, 0.5)
+    assert kinds() == [CLICK, CLICK]
+
+    recognizer.close()
+
+    print("    {0} thread(s), late wheel ticks {1}".format(threading.active_count(),
+                                                           recognizer.wheel.late_ticks))
+    print("Test Complete")
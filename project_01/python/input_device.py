@@ -0,0 +1,710 @@
+"""
+--------------------------------------------------------------------------
+Input Device
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+
+Input Device
+
+  Common core of the Button and Sensor drivers (and of any other two level
+input):  an input is "active" (pressed / tapped) or "inactive", and a cycle
+is an activation followed by a release.  The core owns how the input is
+sampled and how the callback functions are run, so Button and Sensor only
+name the states and keep their own API.
+
+  The input is sampled by one of three engines:
+
+    POLL - The waiting thread reads the pin every "sleep_time" (the
+           original drivers);  an edge is seen up to sleep_time late
+    EDGE - GPIO edge detection:  the Adafruit_BBIO event thread timestamps
+           every edge with time.monotonic_ns() and wakes the waiting
+           thread, so waiting uses no CPU and the timestamps are exact
+    HUB  - One InputHub thread polls the pins of all its devices every
+           poll_time (1 ms) and hands them the edges, for pins or kernels
+           without edge detection
+
+  With EDGE and HUB the "while active / inactive" callbacks still run every
+sleep_time while a thread waits, and only then:  without them the waiting
+thread sleeps until the next edge.  The engine of new devices is the
+default engine (set_default_engine()), so one call switches every input.
+
+  The edges can also be awaited from asyncio (cycle() / events()):  every
+awaiting coroutine gets the edges through its own queue, handed to its
+event loop by the thread that timestamped them, so an idle wait uses no
+CPU and an edge wakes the coroutine at once.  A polled device switches to
+the EDGE engine the first time it is awaited.
+
+Software API:
+
+  InputDevice(pin, active_low=True, sleep_time=0.1, dispatcher=None,
+              engine=None, hub=None)
+    - engine:  POLL, EDGE or HUB (None for the default engine)
+
+    is_active()
+      - Return True if the input is active
+
+    wait_for_cycle()
+      - Wait for the input to be activated and released, running the
+        callback functions; returns (onset_ns, release_ns)
+      - With EDGE / HUB the edges queued since the last wait count, so a
+        tap made while the caller was busy (e.g. writing to the LCD) is
+        not lost
+
+    discard()
+      - Drop the queued edges (e.g. at the start of a test)
+
+    await cycle(timeout=None)
+      - Same as wait_for_cycle() from asyncio (the "while active / inactive"
+        callbacks are not run); raises TimeoutError after timeout seconds
+
+    async for event in events()
+      - InputEvent(active, timestamp_ns) of every change of level
+
+    interrupt() / clear_interrupt()
+      - Make the current (or next) wait_for_cycle() raise Interrupted /
+        drop an interrupt that was not consumed
+
+    add_listener(function) / remove_listener(function)
+      - Call function(active, timestamp_ns) on every edge (on the event /
+        hub thread, must be short; switches a polled device to EDGE)
+
+    set_dispatcher(dispatcher)
+      - Run the callback functions on a callback_dispatch.CallbackDispatcher
+
+    cleanup()
+      - Stop the edge detection / leave the hub
+
+  InputHub(poll_time=0.001)
+    add(device) / remove(device) / stop()
+
+  set_default_engine(engine, hub=None)
+    - Engine (and hub) of the devices created from now on
+
+  Interrupted
+    - Exception raised by an interrupted wait_for_cycle()
+
+  Subclasses name the callbacks in CALLBACKS:  (while active, while
+inactive, on activation, on release), and may record the edges in
+_on_active(timestamp_ns) / _on_inactive(timestamp_ns).
+
+"""
+import asyncio
+import collections
+import threading
+import time
+
+import Adafruit_BBIO.GPIO as GPIO
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+HIGH          = GPIO.HIGH
+LOW           = GPIO.LOW
+
+# Engines
+POLL          = "poll"
+EDGE          = "edge"
+HUB           = "hub"
+
+HUB_POLL_TIME = 0.001             # s
+MAX_EDGES     = 64                # Edges kept for a waiting thread
+
+InputEvent    = collections.namedtuple("InputEvent", ["active", "timestamp_ns"])
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# Engine (and hub) of the devices created without one
+default_engine = POLL
+default_hub    = None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class Interrupted(Exception):
+    """ A wait for a cycle was interrupted (InputDevice.interrupt()) """
+    pass
+
+# End class
+
+
+def set_default_engine(engine, hub=None):
+    """ Set the engine of the devices created from now on """
+    global default_engine
+    global default_hub
+
+    if engine not in (POLL, EDGE, HUB):
+        raise ValueError("Unknown input engine {0!r}".format(engine))
+
+    default_engine = engine
+    default_hub    = hub
+
+# End def
+
+
+class InputHub():
+    """ Input Hub Class """
+    poll_time      = None
+
+    def __init__(self, poll_time=HUB_POLL_TIME):
+        """ Initialize the hub (the thread starts with the first device) """
+        self.poll_time = poll_time
+
+        self._devices  = {}               # device: last level
+        self._lock     = threading.Lock()
+        self._stop     = threading.Event()
+        self._thread   = None
+
+    # End def
+
+
+    def add(self, device):
+        """ Poll the pin of a device """
+        with self._lock:
+            self._devices[device] = device.is_active()
+
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    # End def
+
+
+    def remove(self, device):
+        """ Stop polling the pin of a device """
+        with self._lock:
+            self._devices.pop(device, None)
+
+    # End def
+
+
+    def _run(self):
+        """ Poll every pin on absolute deadlines (hub thread) """
+        deadline = time.monotonic()
+
+        while not self._stop.is_set():
+            with self._lock:
+                devices = list(self._devices.items())
+
+            for (device, last) in devices:
+                active = device.is_active()
+
+                if active != last:
+                    timestamp_ns = time.monotonic_ns()
+
+                    with self._lock:
+                        if device in self._devices:
+                            self._devices[device] = active
+
+                    device._edge(active, timestamp_ns)
+
+            deadline = max(deadline + self.poll_time, time.monotonic())
+            self._stop.wait(deadline - time.monotonic())
+
+    # End def
+
+
+    def stop(self):
+        """ Stop the hub thread """
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # End def
+
+# End class
+
+
+class InputDevice():
+    """ Input Device Class """
+    pin            = None
+
+    active_value   = None
+    inactive_value = None
+
+    sleep_time     = None
+    engine         = None
+    hub            = None
+    dispatcher     = None
+
+    # (while active, while inactive, on activation, on release)
+    CALLBACKS      = ("active_callback", "inactive_callback",
+                      "on_active_callback", "on_inactive_callback")
+
+    active_callback      = None
+    inactive_callback    = None
+    on_active_callback   = None
+    on_inactive_callback = None
+
+    def __init__(self, pin=None, active_low=True, sleep_time=0.1, dispatcher=None,
+                 engine=None, hub=None):
+        """ Initialize variables and set up the input """
+        if (pin == None):
+            raise ValueError("Pin not provided for {0}()".format(type(self).__name__))
+        else:
+            self.pin = pin
+
+        # For pull up resistor configuration:    active_low = True
+        # For pull down resistor configuration:  active_low = False
+        if active_low:
+            self.inactive_value = HIGH
+            self.active_value   = LOW
+        else:
+            self.inactive_value = LOW
+            self.active_value   = HIGH
+
+        if engine is None:
+            engine = default_engine
+            hub    = hub or default_hub
+
+        if engine not in (POLL, EDGE, HUB):
+            raise ValueError("Unknown input engine {0!r}".format(engine))
+
+        self.sleep_time = sleep_time
+        self.dispatcher = dispatcher
+        self.engine     = engine
+        self.hub        = hub
+
+        # Edges of the EDGE / HUB engines:  (active, timestamp_ns)
+        self._edges     = collections.deque(maxlen=MAX_EDGES)
+        self._condition = threading.Condition()
+        self._level     = None
+
+        # Functions called with every edge (event / hub thread)
+        self._listeners   = []
+        self._interrupted = False
+
+        # Initialize the hardware components
+        self._setup()
+
+    # End def
+
+
+    def _setup(self):
+        """ Setup the hardware components. """
+        GPIO.setup(self.pin, GPIO.IN)
+
+        self._level = self.is_active()
+
+        if self.engine == EDGE:
+            GPIO.add_event_detect(self.pin, GPIO.BOTH, callback=self._on_gpio_edge)
+
+        elif self.engine == HUB:
+            if self.hub is None:
+                self.hub = InputHub()
+
+            self.hub.add(self)
+
+    # End def
+
+
+    def is_active(self):
+        """ Is the input active? """
+        return GPIO.input(self.pin) == self.active_value
+
+    # End def
+
+
+    def _on_gpio_edge(self, channel):
+        """ Timestamp an edge (Adafruit_BBIO event thread) """
+        timestamp_ns = time.monotonic_ns()
+
+        self._edge(self.is_active(), timestamp_ns)
+
+    # End def
+
+
+    def _edge(self, active, timestamp_ns):
+        """ Queue an edge and call the listeners (event / hub thread) """
+        with self._condition:
+            self._edges.append((active, timestamp_ns))
+            self._condition.notify_all()
+
+            listeners = list(self._listeners)
+
+        for function in listeners:
+            function(active, timestamp_ns)
+
+    # End def
+
+
+    def _start_edges(self):
+        """ Switch a polled device to GPIO edge detection """
+        with self._condition:
+            if self.engine != POLL:
+                return
+
+            self.engine = EDGE
+            self._level = self.is_active()
+
+        GPIO.add_event_detect(self.pin, GPIO.BOTH, callback=self._on_gpio_edge)
+
+    # End def
+
+
+    def add_listener(self, function):
+        """ Call function(active, timestamp_ns) on every edge """
+        self._start_edges()
+
+        with self._condition:
+            self._listeners.append(function)
+
+    # End def
+
+
+    def remove_listener(self, function):
+        """ Stop calling function on the edges """
+        with self._condition:
+            if function in self._listeners:
+                self._listeners.remove(function)
+
+    # End def
+
+
+    def _subscribe(self):
+        """ Return (listener, queue) of the edges for the running event loop """
+        loop  = asyncio.get_running_loop()
+        edges = asyncio.Queue()
+
+        def listener(active, timestamp_ns):
+            try:
+                loop.call_soon_threadsafe(edges.put_nowait, (active, timestamp_ns))
+            except RuntimeError:
+                # The event loop of the coroutine is closed
+                pass
+
+        self.add_listener(listener)
+
+        return (listener, edges)
+
+    # End def
+
+
+    def interrupt(self):
+        """ Make the current (or next) wait_for_cycle() raise Interrupted """
+        with self._condition:
+            self._interrupted = True
+            self._condition.notify_all()
+
+    # End def
+
+
+    def clear_interrupt(self):
+        """ Drop an interrupt that no wait has consumed """
+        with self._condition:
+            self._interrupted = False
+
+    # End def
+
+
+    def _check_interrupt(self):
+        """ Raise Interrupted if the wait was interrupted (lock held) """
+        if self._interrupted:
+            self._interrupted = False
+            raise Interrupted()
+
+    # End def
+
+
+    def wait_for_cycle(self):
+        """ Wait for the input to be activated and released
+
+            Returns:  (onset_ns, release_ns) (time.monotonic_ns())
+        """
+        (while_active, while_inactive, on_active, on_inactive) = self.CALLBACKS
+
+        onset_ns = self._wait_level(True, while_inactive)
+        self._on_active(onset_ns)
+        self._callback(on_active)
+
+        release_ns = self._wait_level(False, while_active)
+        self._on_inactive(release_ns)
+        self._callback(on_inactive)
+
+        return (onset_ns, release_ns)
+
+    # End def
+
+
+    def discard(self):
+        """ Drop the queued edges:  only edges from now on start a cycle """
+        if self.engine != POLL:
+            with self._condition:
+                self._next_edge(None)
+
+    # End def
+
+
+    def _wait_level(self, active, name):
+        """ Wait for the input to reach a level, running the callback "name"
+            every sleep_time; returns the time of the edge
+        """
+        if self.engine == POLL:
+            while self.is_active() != active:
+                with self._condition:
+                    self._check_interrupt()
+
+                self._callback(name)
+
+                time.sleep(self.sleep_time)
+
+            return time.monotonic_ns()
+
+        with self._condition:
+            self._check_interrupt()
+
+            if self._level == active:
+                return time.monotonic_ns()
+
+        while True:
+            with self._condition:
+                self._check_interrupt()
+
+                timestamp_ns = self._next_edge(active)
+
+                if timestamp_ns is not None:
+                    return timestamp_ns
+
+            self._callback(name)
+
+            # Without a callback to run, sleep until the next edge
+            timeout = self.sleep_time if (getattr(self, name) is not None) else None
+
+            with self._condition:
+                if not (self._edges or self._interrupted):
+                    self._condition.wait(timeout)
+
+    # End def
+
+
+    def _next_edge(self, active):
+        """ Consume the queued edges up to the first change to level active
+            (None for all of them); returns its time or None (lock held)
+        """
+        while self._edges:
+            (level, timestamp_ns) = self._edges.popleft()
+
+            # Only changes of level count (a bounce may repeat an edge)
+            if level != self._level:
+                self._level = level
+
+                if level == active:
+                    return timestamp_ns
+
+        return None
+
+    # End def
+
+
+    async def cycle(self, timeout=None):
+        """ Wait for the input to be activated and released (asyncio)
+
+            Returns:  (onset_ns, release_ns) (time.monotonic_ns())
+        """
+        return await asyncio.wait_for(self._cycle(), timeout)
+
+    # End def
+
+
+    async def _cycle(self):
+        """ Wait for an activation and a release on one queue of edges """
+        (while_active, while_inactive, on_active, on_inactive) = self.CALLBACKS
+
+        (listener, edges) = self._subscribe()
+
+        try:
+            if self.is_active():
+                onset_ns = time.monotonic_ns()
+            else:
+                onset_ns = await self._next_level(edges, True)
+
+            self._on_active(onset_ns)
+            self._callback(on_active)
+
+            release_ns = await self._next_level(edges, False)
+            self._on_inactive(release_ns)
+            self._callback(on_inactive)
+
+        finally:
+            self.remove_listener(listener)
+
+        return (onset_ns, release_ns)
+
+    # End def
+
+
+    async def _next_level(self, edges, active):
+        """ Wait for an edge to level active on a queue of edges """
+        while True:
+            (level, timestamp_ns) = await edges.get()
+
+            # A bounce may repeat an edge of the current level
+            if level == active:
+                return timestamp_ns
+
+    # End def
+
+
+    async def events(self):
+        """ Yield an InputEvent for every change of level """
+        (listener, edges) = self._subscribe()
+        level             = self.is_active()
+
+        try:
+            while True:
+                (active, timestamp_ns) = await edges.get()
+
+                if active != level:
+                    level = active
+                    yield InputEvent(active, timestamp_ns)
+
+        finally:
+            self.remove_listener(listener)
+
+    # End def
+
+
+    def _on_active(self, timestamp_ns):
+        """ Record an activation (before the on activation callback) """
+        pass
+
+    # End def
+
+
+    def _on_inactive(self, timestamp_ns):
+        """ Record a release (before the on release callback) """
+        pass
+
+    # End def
+
+
+    def _callback(self, name):
+        """ Run the callback function "name" or queue it on the dispatcher """
+        function = getattr(self, name)
+
+        if function is None:
+            return
+
+        if self.dispatcher is None:
+            setattr(self, name + "_value", function())
+        else:
+            self.dispatcher.submit(self, name)
+
+    # End def
+
+
+    def set_dispatcher(self, dispatcher):
+        """ Run the callback functions on a CallbackDispatcher (None: inline) """
+        self.dispatcher = dispatcher
+
+    # End def
+
+
+    def cleanup(self):
+        """ Clean up the input hardware. """
+        if self.engine == EDGE:
+            GPIO.remove_event_detect(self.pin)
+
+        elif self.engine == HUB:
+            self.hub.remove(self)
+
+    # End def
+
+# End class
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import sys
+
+    if "--test" in sys.argv:
+        print("Input Device Test")
+
+        # Edges are injected into an idle pin (P2_19)
+        device   = InputDevice("P2_19", engine=EDGE)
+        start_ns = time.monotonic_ns()
+
+        # Edges queued while the caller was busy still make a cycle
+        device._edge(True, start_ns + 1000)
+        device._edge(False, start_ns + 2000)
+        assert device.wait_for_cycle() == (start_ns + 1000, start_ns + 2000), \
+               "Queued cycle lost"
+
+        # discard() drops them:  the next cycle is the one after it
+        device._edge(True, start_ns + 3000)
+        device._edge(False, start_ns + 4000)
+        device.discard()
+
+        def later():
+            device._edge(True, start_ns + 5000)
+            device._edge(False, start_ns + 6000)
+
+        threading.Timer(0.1, later).start()
+        assert device.wait_for_cycle() == (start_ns + 5000, start_ns + 6000), \
+               "Discarded cycle returned"
+
+        device.cleanup()
+
+        print("Test Complete")
+        sys.exit(0)
+
+    print("Input Device Test")
+
+    # Press durations and CPU of each engine (P2_2:  button, press_low);
+    # the polled durations are multiples of sleep_time
+    for engine in (POLL, EDGE, HUB):
+        device    = InputDevice("P2_2", engine=engine)
+        durations = []
+        cpu       = time.process_time()
+
+        print("    {0}:  press the button 5 times".format(engine))
+
+        for i in range(5):
+            (onset_ns, release_ns) = device.wait_for_cycle()
+            durations.append((release_ns - onset_ns) / 1e6)
+
+        cpu = time.process_time() - cpu
+        device.cleanup()
+
+        print("        durations {0} ms, {1:.3f} s CPU".format(
+              ", ".join("{0:.1f}".format(d) for d in durations), cpu))
+
+    print("Test Complete")
@@ -0,0 +1,752 @@
+"""
+--------------------------------------------------------------------------
+Keypad Driver
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+
+Keypad Driver
+
+  Scans a 4x4 (any rows x columns) key matrix without diodes:  the columns
+are inputs with pull up resistors and the rows are inputs (high impedance)
+except while they are scanned.  Every scan makes one row at a time an
+output driving the "pressed" value (like a Button with press_low=True, the
+pressed value is LOW), reads the columns and makes the row an input again,
+so 16 keys take 4 row writes and 16 column reads per scan instead of one
+polling loop per key.  Only one row is ever driven:  two keys pressed in
+the same column join two rows, which must not be two outputs at different
+levels.
+
+  The columns need their pull ups:  apply KEYPAD_PINS with
+pinmux.configure() before using the keypad.
+
+  Making a row an output / input is a GPIO.setup() call, which costs far
+more than a read, so the matrix is only scanned while a key is down.
+While every key is up, all the rows are outputs driving the pressed value
+(all at the same level, so keys joining rows are not a short) and the
+scan thread sleeps:  a press pulls its column to the pressed value and
+the edge detection of the columns wakes the thread.  The thread then
+scans until every key is released and drives the rows again.
+
+  While a key is down the scans run on a fixed schedule (absolute
+deadlines, every scan_time), so every key is sampled at the same rate
+whatever the number of pressed keys, and an event is never more than one
+scan late.
+
+    - Debounce:  a key changes state after "debounce" consecutive scans
+      that disagree with its state;  the event keeps the time of the first
+      of these scans (time.monotonic_ns(), the clock of the sensor taps)
+    - Rollover:  any number of keys can be held;  a key that is at the
+      corner of a rectangle of pressed keys (two rows with two pressed
+      columns in common) cannot be told from a ghost and keeps its state
+      until the rectangle is gone
+
+Software API:
+
+  Keypad(rows=ROW_PINS, cols=COL_PINS, keys=KEYS, press_low=True,
+         scan_time=0.005, debounce=2, callback=None, read=None, write=None,
+         setup=None, detect=None)
+    - read / write / setup are the functions of the pins (default
+      GPIO.input / GPIO.output / GPIO.setup);  detect(pin, edge, callback)
+      starts the edge detection of a column (callback None stops it)
+    - callback(event) is called on the scan thread (must be short)
+
+    start() / stop()
+      - Start / stop scanning
+
+    get(timeout=None)
+      - Return the next KeyEvent(key, pressed, timestamp_ns), None after
+        timeout seconds
+
+    pressed_keys()
+      - Return the keys that are pressed (debounced)
+
+    read_number(echo=None, timeout=None)
+      - Read digits up to "#" ("*" deletes a digit);  echo(text) is called
+        after every key (e.g. to show the number on the LCD)
+      - Returns the number or None (nothing entered / timeout)
+
+    scans / late_scans / wakeups / scan_rate() / mean_scan_cost_ns /
+    max_scan_cost_ns
+      - Number of scans, scans skipped because the thread was late, times
+        the thread was woken by a press, the achieved scans per second
+        while a key is down and the time spent per scan
+
+Usage:
+
+  python3 keypad.py           - Print the key events (Ctrl-C to exit)
+  python3 keypad.py --test    - Self test on a simulated matrix (no
+                                hardware)
+
+"""
+import collections
+import queue
+import threading
+import time
+
+import Adafruit_BBIO.GPIO as GPIO
+
+import pinmux as PINMUX
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+HIGH          = GPIO.HIGH
+LOW           = GPIO.LOW
+
+KEYS          = (("1", "2", "3", "A"),
+                 ("4", "5", "6", "B"),
+                 ("7", "8", "9", "C"),
+                 ("*", "0", "#", "D"))
+
+ROW_PINS      = ("P2_28", "P2_30", "P2_32", "P2_34")
+COL_PINS      = ("P2_17", "P2_19", "P2_25", "P2_27")
+
+# Pin, mode, use (see pinmux)
+KEYPAD_PINS   = tuple([(pin, "gpio", "Keypad row {0}".format(i + 1)) 
+                       for (i, pin) in enumerate(ROW_PINS)] +
+                      [(pin, "gpio_pu", "Keypad column {0}".format(i + 1))
+                       for (i, pin) in enumerate(COL_PINS)])
+
+KeyEvent      = collections.namedtuple("KeyEvent", ["key", "pressed", "timestamp_ns"])
+
+MAX_EVENTS    = 32                # Events kept until read
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _detect(pin, edge, callback):
+    """ Start (callback) / stop (callback None) the edge detection of a pin """
+    if callback is None:
+        GPIO.remove_event_detect(pin)
+    else:
+        GPIO.add_event_detect(pin, edge, callback=callback)
+
+# End def
+
+
+class Keypad():
+    """ Keypad Class """
+    rows              = None
+    cols              = None
+    keys              = None
+    pressed_value     = None
+    unpressed_value   = None
+    scan_time         = None
+    debounce          = None
+    callback          = None
+
+    scans             = None
+    late_scans        = None
+    wakeups           = None
+    mean_scan_cost_ns = None
+    max_scan_cost_ns  = None
+
+    def __init__(self, rows=ROW_PINS, cols=COL_PINS, keys=KEYS, press_low=True,
+                 scan_time=0.005, debounce=2, callback=None, read=None, write=None,
+                 setup=None, detect=None):
+        """ Initialize variables and set up the keypad """
+        self.rows      = rows
+        self.cols      = cols
+        self.keys      = [key for row in keys for key in row]
+        self.scan_time = scan_time
+        self.debounce  = debounce
+        self.callback  = callback
+
+        # A press pulls its column to the pressed value (idle rows)
+        if press_low:
+            self.unpressed_value = HIGH
+            self.pressed_value   = LOW
+            self._press_edge     = GPIO.FALLING
+        else:
+            self.unpressed_value = LOW
+            self.pressed_value   = HIGH
+            self._press_edge     = GPIO.RISING
+
+        self._read      = GPIO.input if read is None else read
+        self._write     = GPIO.output if write is None else write
+        self._pin_setup = GPIO.setup if setup is None else setup
+        self._detect    = _detect if detect is None else detect
+
+        # Debounced state, scans that disagreed and time of the first one
+        self._state     = [False] * len(self.keys)
+        self._count     = [0] * len(self.keys)
+        self._since     = [0] * len(self.keys)
+
+        self._events    = queue.Queue(MAX_EVENTS)
+        self._stop      = threading.Event()
+        self._wake      = threading.Event()
+        self._thread    = None
+
+        # Rows driving the pressed value (idle) or inputs (scanning)
+        self._driven    = False
+
+        self._reset_stats()
+
+        self._setup()
+
+    # End def
+
+
+    def _setup(self):
+        """ Setup the hardware components. """
+        for col in self.cols:
+            self._pin_setup(col, GPIO.IN)
+
+        self._drive_rows()
+
+    # End def
+
+
+    def _drive_rows(self):
+        """ Make every row an output driving the pressed value (idle) """
+        for row in self.rows:
+            self._pin_setup(row, GPIO.OUT)
+            self._write(row, self.pressed_value)
+
+        self._driven = True
+
+    # End def
+
+
+    def _release_rows(self):
+        """ Make every row an input (scanning) """
+        for row in self.rows:
+            self._pin_setup(row, GPIO.IN)
+
+        self._driven = False
+
+    # End def
+
+
+    def _column_pressed(self):
+        """ Is a column pulled to the pressed value? (idle rows) """
+        return any(self._read(col) == self.pressed_value for col in self.cols)
+
+    # End def
+
+
+    def _keys_up(self):
+        """ Are all the keys up, with no change being debounced? """
+        return not (any(self._masks) or any(self._state) or any(self._count))
+
+    # End def
+
+
+    def _on_column_edge(self, channel):
+        """ Wake the scan thread (Adafruit_BBIO event thread) """
+        self._wake.set()
+
+    # End def
+
+
+    def _reset_stats(self):
+        """ Reset the scan statistics """
+        self.scans             = 0
+        self.late_scans        = 0
+        self.wakeups           = 0
+        self.mean_scan_cost_ns = 0.0
+        self.max_scan_cost_ns  = 0
+
+        self._total_cost_ns    = 0
+        self._masks            = []
+
+        # Scans per second while a key is down:  time of the scans
+        self._scan_ns          = 0
+        self._rate_scans       = 0
+        self._last_ns          = None
+
+    # End def
+
+
+    def start(self):
+        """ Start scanning """
+        self._reset_stats()
+        self._stop.clear()
+
+        for col in self.cols:
+            self._detect(col, self._press_edge, self._on_column_edge)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # End def
+
+
+    def stop(self):
+        """ Stop scanning """
+        self._stop.set()
+        self._wake.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+            for col in self.cols:
+                self._detect(col, self._press_edge, None)
+
+    # End def
+
+
+    def _run(self):
+        """ Sleep until a press, then scan until every key is up (scan thread) """
+        while not self._stop.is_set():
+            if not self._driven:
+                self._drive_rows()
+
+            # A press from before the wake was cleared is in the columns
+            self._wake.clear()
+
+            if not self._column_pressed():
+                self._wake.wait()
+
+                if self._stop.is_set():
+                    return
+
+            self.wakeups += 1
+            self._scan_while_pressed()
+
+    # End def
+
+
+    def _scan_while_pressed(self):
+        """ Scan on absolute deadlines until every key is up """
+        period_ns = int(self.scan_time * 1e9)
+        start_ns  = time.perf_counter_ns()
+        tick      = 0
+
+        # The rate is measured from the first scan of every burst
+        self._last_ns = None
+
+        while not self._stop.is_set():
+            self.scan()
+
+            if self._keys_up():
+                return
+
+            # A scan that was missed entirely is skipped, not run late
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            next_tick  = max(tick + 1, elapsed_ns // period_ns + 1)
+
+            self.late_scans += next_tick - tick - 1
+            tick             = next_tick
+
+            wait_ns = start_ns + tick * period_ns - time.perf_counter_ns()
+
+            if wait_ns > 0:
+                self._stop.wait(wait_ns / 1e9)
+
+    # End def
+
+
+    def scan(self):
+        """ Scan the matrix once and update the keys """
+        if self._driven:
+            self._release_rows()
+
+        start_ns = time.perf_counter_ns()
+        read     = self._read
+        write    = self._write
+        setup    = self._pin_setup
+        masks    = []
+
+        # One bit per pressed column for every row;  the other rows are
+        # inputs, so a column joining two rows never joins two outputs
+        for row in self.rows:
+            setup(row, GPIO.OUT)
+            write(row, self.pressed_value)
+
+            mask = 0
+            bit  = 1
+
+            for col in self.cols:
+                if read(col) == self.pressed_value:
+                    mask |= bit
+
+                bit <<= 1
+
+            setup(row, GPIO.IN)
+            masks.append(mask)
+
+        timestamp_ns = time.monotonic_ns()
+        self._masks  = masks
+
+        self._update(masks, self._ghosts(masks), timestamp_ns)
+
+        # Statistics
+        cost_ns                 = time.perf_counter_ns() - start_ns
+        self.scans             += 1
+        self._total_cost_ns    += cost_ns
+        self.mean_scan_cost_ns  = self._total_cost_ns / self.scans
+        self.max_scan_cost_ns   = max(self.max_scan_cost_ns, cost_ns)
+
+        if self._last_ns is not None:
+            self._scan_ns    += timestamp_ns - self._last_ns
+            self._rate_scans += 1
+
+        self._last_ns = timestamp_ns
+
+    # End def
+
+
+    def _ghosts(self, masks):
+        """ Return the masks of the keys that could be ghosts (per row) """
+        ghosts = [0] * len(masks)
+
+        for first in range(len(masks)):
+            for second in range(first + 1, len(masks)):
+                common = masks[first] & masks[second]
+
+                # Two columns in common:  a rectangle of pressed keys
+                if common & (common - 1):
+                    ghosts[first]  |= common
+                    ghosts[second] |= common
+
+        return ghosts
+
+    # End def
+
+
+    def _update(self, masks, ghosts, timestamp_ns):
+        """ Debounce the keys of a scan and queue the events """
+        cols  = len(self.cols)
+        index = 0
+
+        for (mask, ghost) in zip(masks, ghosts):
+            for col in range(cols):
+                bit = 1 << col
+
+                # A key that may be a ghost keeps its state
+                if ghost & bit:
+                    self._count[index] = 0
+
+                elif bool(mask & bit) != self._state[index]:
+                    if self._count[index] == 0:
+                        self._since[index] = timestamp_ns
+
+                    self._count[index] += 1
+
+                    if self._count[index] >= self.debounce:
+                        self._state[index] = not self._state[index]
+                        self._count[index] = 0
+                        self._emit(KeyEvent(self.keys[index], self._state[index],
+                                            self._since[index]))
+                else:
+                    self._count[index] = 0
+
+                index += 1
+
+    # End def
+
+
+    def _emit(self, event):
+        """ Queue an event and call the callback """
+        # Keep the newest events when nobody reads them
+        while True:
+            try:
+                self._events.put_nowait(event)
+                break
+            except queue.Full:
+                try:
+                    self._events.get_nowait()
+                except queue.Empty:
+                    pass
+
+        if self.callback is not None:
+            self.callback(event)
+
+    # End def
+
+
+    def get(self, timeout=None):
+        """ Return the next key event (None after timeout seconds) """
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    # End def
+
+
+    def pressed_keys(self):
+        """ Return the keys that are pressed """
+        return [key for (key, pressed) in zip(self.keys, self._state) if pressed]
+
+    # End def
+
+
+    def scan_rate(self):
+        """ Return the achieved scans per second while a key is down """
+        if self._scan_ns == 0:
+            return 0.0
+
+        return self._rate_scans * 1e9 / self._scan_ns
+
+    # End def
+
+
+    def read_number(self, echo=None, timeout=None):
+        """ Read digits up to "#" ("*" deletes a digit)
+
+            Returns the number or None
+        """
+        digits = ""
+
+        while True:
+            event = self.get(timeout)
+
+            if event is None:
+                return None
+
+            if not event.pressed:
+                continue
+
+            if event.key == "#":
+                return int(digits) if digits else None
+
+            if event.key == "*":
+                digits = digits[:-1]
+            elif event.key.isdigit():
+                digits += event.key
+
+            if echo is not None:
+                echo(digits)
+
+    # End def
+
+
+    def cleanup(self):
+        """ Stop scanning and release the rows """
+        self.stop()
+
+        for row in self.rows:
+            self._pin_setup(row, GPIO.IN)
+
+    # End def
+
+# End class
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import sys
+
+    if "--test" in sys.argv:
+        print("Keypad Test")
+
+        class Matrix():
+            """ Key matrix without diodes (a pressed key joins its row and column)
+
+                Columns are pulled up;  rows are inputs (high impedance) or
+                outputs.  Two outputs joined through pressed keys are a short.
+            """
+            def __init__(self):
+                self.pressed = set()          # (row, col)
+                self.outputs = {}             # row: driven value
+                self.shorts  = 0
+                self.detects = {}             # col pin: callback
+
+            def detect(self, pin, edge, callback):
+                if callback is None:
+                    self.detects.pop(pin, None)
+                else:
+                    self.detects[pin] = callback
+
+            def press(self, keys):
+                # Falling edges of the columns pulled low by the new keys
+                before       = [self.read(pin) for pin in COL_PINS]
+                self.pressed = set(keys)
+
+                for (pin, level) in zip(COL_PINS, before):
+                    if (level == HIGH) and (self.read(pin) == LOW) and (pin in self.detects):
+                        self.detects[pin](pin)
+
+            def setup(self, pin, direction):
+                if pin in ROW_PINS:
+                    row = ROW_PINS.index(pin)
+
+                    if direction == GPIO.OUT:
+                        self.outputs[row] = LOW
+                    else:
+                        self.outputs.pop(row, None)
+
+            def write(self, pin, value):
+                row = ROW_PINS.index(pin)
+                assert row in self.outputs, "Write to a row that is not an output"
+                self.outputs[row] = value
+
+            def read(self, pin):
+                # Net of the column:  rows and columns joined through pressed keys
+                rows    = set()
+                cols    = {COL_PINS.index(pin)}
+                changed = True
+
+                while changed:
+                    changed = False
+
+                    for (row, col) in self.pressed:
+                        if (row in rows) != (col in cols):
+                            rows.add(row)
+                            cols.add(col)
+                            changed = True
+
+                levels = {self.outputs[row] for row in rows if row in self.outputs}
+
+                if len(levels) > 1:
+                    self.shorts += 1
+
+                return levels.pop() if len(levels) == 1 else HIGH
+
+        matrix = Matrix()
+        keypad = Keypad(read=matrix.read, write=matrix.write, setup=matrix.setup,
+                        detect=matrix.detect, scan_time=0.002)
+
+        def scans(count, bounce=None):
+            """ Run scans, toggling a bouncing key on every other scan """
+            for i in range(count):
+                if (bounce is not None) and (i < 4):
+                    matrix.pressed ^= {bounce}
+
+                keypad.scan()
+
+        def events():
+            result = []
+
+            while True:
+                event = keypad.get(timeout=0)
+
+                if event is None:
+                    return result
+
+                result.append((event.key, event.pressed))
+
+        # Debounce:  a bouncing "5" gives one press
+        scans(10, bounce=(1, 1))
+        matrix.pressed = {(1, 1)}
+        scans(4)
+        assert events() == [("5", True)], events()
+
+        # Rollover:  three keys on different rows and columns
+        matrix.pressed |= {(0, 0), (3, 2)}
+        scans(4)
+        assert sorted(keypad.pressed_keys()) == ["#", "1", "5"]
+
+        # Ghost:  "1", "2" and "5" make "4" look pressed;  "4" is blocked
+        matrix.pressed = {(0, 0), (0, 1), (1, 1)}
+        scans(4)
+        assert "4" not in keypad.pressed_keys()
+        events()
+
+        # Two keys in one column:  the rows are never both outputs
+        matrix.pressed = {(0, 3), (1, 3), (2, 3)}
+        scans(4)
+        assert sorted(keypad.pressed_keys()) == ["A", "B", "C"]
+        assert (matrix.shorts == 0) and (matrix.outputs == {})
+        events()
+
+        # Patient id entry
+        matrix.pressed = set()
+        scans(4)
+        events()
+
+        for (row, col) in ((0, 1), (2, 2), (3, 0), (0, 2), (3, 2)):  # 2 9 * 3 #
+            matrix.pressed = {(row, col)}
+            scans(3)
+            matrix.pressed = set()
+            scans(3)
+
+        shown = []
+        assert keypad.read_number(shown.append, timeout=0) == 23
+        assert shown == ["2", "29", "2", "23"]
+
+        # Scan thread:  no scans while every key is up
+        events()
+        keypad.start()
+        time.sleep(0.2)
+        assert (keypad.scans == 0) and (keypad.wakeups == 0), keypad.scans
+
+        # A press wakes the thread, which scans until the key is released
+        matrix.press({(2, 1)})
+        event = keypad.get(timeout=1.0)
+        assert (event.key, event.pressed) == ("8", True), event
+        time.sleep(0.5)
+        matrix.press(set())
+        event = keypad.get(timeout=1.0)
+        assert (event.key, event.pressed) == ("8", False), event
+
+        time.sleep(0.05)
+        scans = keypad.scans
+        time.sleep(0.2)
+        assert keypad.scans == scans, "Scanning while every key is up"
+        assert (keypad.wakeups == 1) and (matrix.shorts == 0)
+        assert len(matrix.outputs) == len(ROW_PINS)
+        keypad.stop()
+
+        # Simulated pins:  the cost of GPIO.setup() / input() on the board
+        # is not included (run "python3 keypad.py" on the board for it)
+        print("    Simulated pins:  {0} scans in 1 press, {1:.0f} scans/s (target "
+              "{2:.0f}), {3} late, cost {4:.1f} us mean / {5:.1f} us max".format(
+              scans, keypad.scan_rate(), 1 / keypad.scan_time, keypad.late_scans,
+              keypad.mean_scan_cost_ns / 1e3, keypad.max_scan_cost_ns / 1e3))
+
+        print("Test Complete")
+
+    else:
+        print("Keypad Events (Ctrl-C to exit)")
+
+        PINMUX.configure(KEYPAD_PINS)
+
+        keypad = Keypad()
+        keypad.start()
+
+        try:
+            while True:
+                event = keypad.get()
+                print("    {0} {1} at {2:.3f} s ({3:.0f} scans/s, {4:.1f} us per scan)".format(
+                      event.key, "pressed " if event.pressed else "released",
+                      event.timestamp_ns / 1e9, keypad.scan_rate(),
+                      keypad.mean_scan_cost_ns / 1e3))
+
+        except KeyboardInterrupt:
+            pass
+
+        keypad.cleanup()
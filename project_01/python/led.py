@@ -40,11 +40,21 @@ such that the LED is ON when the output is "High"/"1" and OFF when the output is
 
 Software API:
 
-  LED(pin, low_off=True)
+  LED(pin, low_off=True, wheel=None, pwm=False, frequency=PWM_FREQUENCY)
     - Provide pin that the LED is connected
+    - pwm:  drive the LED with the PWM hardware (the pin must be a PWM pin,
+      e.g. P2_3) so it has a brightness
     
     is_on()
       - Return a boolean value (i.e. True/False) if the LED is ON / OFF
+        (cached state, does not read the pin)
+
+    set_brightness(level)
+      - Set the brightness (0.0 - 1.0; any level above 0 is ON without PWM)
+
+    fade(level, length=1.0)
+      - Fade from the current brightness to level in length seconds
+        (returns at once; without PWM the level is set at once)
 
     on()
       - Turn the LED on
@@ -52,8 +62,39 @@ Software API:
     off()
       - Turn the LED off    
 
+    flash(length)
+      - Turn the LED on for length seconds (returns at once)
+
+    blink(on_time, off_time=None, count=None)
+      - Blink the LED count times (None for until stopped), returns at once
+
+    stop_blink()
+      - Stop blinking / flashing and turn the LED off
+
+  The flashes and blinks are timers of the shared timer wheel 
+(timer_wheel.default_wheel()), so any number of LEDs costs one thread.
+on() / off() / set_brightness() stop a pending flash / blink / fade, so the
+LED is not changed behind the caller's back.
+
+  With PWM, the brightness is a duty cycle of the PWM hardware, so a dim LED
+costs no CPU.  A fade is a table of duty cycles (gamma corrected, so the
+steps look even), computed once per (start, end, steps) and stepped by a
+timer of the wheel at FADE_RATE.
+
+Usage:
+
+  python3 led.py              - Blink the LED on P2_3 (Ctrl-C to exit)
+  python3 led.py --pwm        - Fade the LED on P2_3 in and out
+  python3 led.py --test       - Self test of the flash / blink timers
+
 """
+import functools
+import threading
+
 import Adafruit_BBIO.GPIO as GPIO
+import Adafruit_BBIO.PWM as PWM
+
+import timer_wheel as TIMER_WHEEL
 
 # ------------------------------------------------------------------------
 # Constants
@@ -62,6 +103,10 @@ import Adafruit_BBIO.GPIO as GPIO
 HIGH          = GPIO.HIGH
 LOW           = GPIO.LOW
 
+PWM_FREQUENCY = 1000              # Hz (no visible flicker)
+FADE_RATE     = 50                # Fade steps per second
+GAMMA         = 2.2               # Perceived brightness ~ duty ** (1 / GAMMA)
+
 # ------------------------------------------------------------------------
 # Global variables
 # ------------------------------------------------------------------------
@@ -72,13 +117,41 @@ LOW           = GPIO.LOW
 # Functions / Classes
 # ------------------------------------------------------------------------
 
+@functools.lru_cache(maxsize=32)
+def _fade_table(start, end, steps, invert):
+    """ Return the ((level, duty cycle), ...) steps of a fade (cached) """
+    table = []
+    
+    for i in range(1, steps + 1):
+        level = start + (end - start) * i / steps
+        table.append((level, _duty_cycle(level, invert)))
+    
+    return tuple(table)
+
+# End def
+
+
+def _duty_cycle(level, invert):
+    """ Return the duty cycle (%) of a brightness level (gamma corrected) """
+    duty = 100.0 * (level ** GAMMA)
+    
+    return (100.0 - duty) if invert else duty
+
+# End def
+
+
 class LED():
     """ LED Class """
     pin             = None
     on_value        = None
     off_value       = None
+    wheel           = None
+    pwm             = None
+    frequency       = None
+    brightness      = None
     
-    def __init__(self, pin=None, low_off=True):
+    def __init__(self, pin=None, low_off=True, wheel=None, pwm=False,
+                 frequency=PWM_FREQUENCY):
         """ Initialize variables and set up the LED """
         if (pin == None):
             raise ValueError("Pin not provided for LED()")
@@ -94,6 +167,20 @@ class LED():
             self.on_value  = LOW
             self.off_value = HIGH
 
+        # Timer wheel of the flashes / blinks / fades (default:  shared wheel)
+        self.wheel      = wheel
+        self._timer     = None
+        self._blinking  = None
+        self._lock      = threading.Lock()
+
+        # PWM mode (an active low LED has an inverted duty cycle)
+        self.pwm        = pwm
+        self.frequency  = frequency
+        self._invert    = not low_off
+        
+        # Logical state of the LED, so is_on() does not read the pin
+        self.brightness = 0.0
+
         # Initialize the hardware components        
         self._setup()
     
@@ -103,11 +190,10 @@ class LED():
     def _setup(self):
         """ Setup the hardware components. """
         # Initialize LED
-        GPIO.setup(self.pin, GPIO.OUT)
-
-        # !!! NEED TO IMPLEMENT !!! #
-        pass 
-        # !!! NEED TO IMPLEMENT !!! #
+        if self.pwm:
+            PWM.start(self.pin, _duty_cycle(0.0, self._invert), self.frequency)
+        else:
+            GPIO.setup(self.pin, GPIO.OUT)
         
         self.off()
 
@@ -120,26 +206,183 @@ class LED():
            Returns:  True  - LED is ON
                      False - LED is OFF
         """
-        
-        # !!! NEED TO IMPLEMENT !!! #
-        return GPIO.input(self.pin) == self.on_value 
-        # !!! NEED TO IMPLEMENT !!! #
+        return self.brightness > 0.0
 
     # End def
 
     
     def on(self):
-        """ Turn the LED ON """
-
-        GPIO.output(self.pin, self.on_value)
+        """ Turn the LED ON (stops a blink / flash / fade) """
+        self.set_brightness(1.0)
     
     # End def
     
     
     def off(self):
-        """ Turn the LED OFF """
+        """ Turn the LED OFF (stops a blink / flash / fade) """
+        self.set_brightness(0.0)
+    
+    # End def
+
+
+    def set_brightness(self, level):
+        """ Set the brightness of the LED (0.0 - 1.0, stops a blink / flash / fade) """
+        self._cancel()
+        self._set(level)
+    
+    # End def
+
+
+    def _set(self, level):
+        """ Drive the LED at level without touching the timers """
+        level = min(1.0, max(0.0, float(level)))
+        
+        if self.pwm:
+            PWM.set_duty_cycle(self.pin, _duty_cycle(level, self._invert))
+        else:
+            GPIO.output(self.pin, self.on_value if (level > 0.0) else self.off_value)
+        
+        self.brightness = level
+    
+    # End def
+
 
-        GPIO.output(self.pin, self.off_value)
+    def _wheel(self):
+        """ Return the timer wheel of the LED """
+        if self.wheel is None:
+            self.wheel = TIMER_WHEEL.default_wheel()
+        
+        return self.wheel
+    
+    # End def
+    
+    
+    def flash(self, length=1.0):
+        """ Turn the LED ON for length seconds (does not block) """
+        self.stop_blink()
+        self._set(1.0)
+        
+        # The flash has a token so a later on() / off() is not undone
+        with self._lock:
+            self._blinking = object()
+            self._timer    = self._wheel().call_later(length, self._flash_off, self._blinking)
+    
+    # End def
+    
+    
+    def _flash_off(self, token):
+        """ End of a flash (timer wheel thread) """
+        with self._lock:
+            if token is not self._blinking:
+                return
+            
+            self._blinking = None
+            self._timer    = None
+            self._set(0.0)
+    
+    # End def
+    
+    
+    def blink(self, on_time, off_time=None, count=None):
+        """ Blink the LED count times (None for until stopped, does not block) """
+        if off_time is None:
+            off_time = on_time
+        
+        self.stop_blink()
+        
+        # Each blink has its own token so a stopped blink cannot restart
+        self._blinking = object()
+        self._blink(self._blinking, True, on_time, off_time, count)
+    
+    # End def
+    
+    
+    def _blink(self, token, turn_on, on_time, off_time, count):
+        """ Next step of a blink (timer wheel thread) """
+        with self._lock:
+            if token is not self._blinking:
+                return
+            
+            if turn_on:
+                if count is not None:
+                    if count <= 0:
+                        self._timer = None
+                        return
+                    
+                    count -= 1
+                
+                self._set(1.0)
+                delay = on_time
+            else:
+                self._set(0.0)
+                delay = off_time
+            
+            self._timer = self._wheel().call_later(delay, self._blink, token, not turn_on,
+                                                   on_time, off_time, count)
+    
+    # End def
+    
+    
+    def fade(self, level, length=1.0):
+        """ Fade to level in length seconds (does not block) """
+        level = min(1.0, max(0.0, float(level)))
+        
+        # Stop a blink / flash / fade, but keep the current brightness
+        self._cancel()
+        
+        if not self.pwm:
+            self._set(level)
+            return
+        
+        steps = max(1, int(round(length * FADE_RATE)))
+        table = _fade_table(round(self.brightness, 3), level, steps, self._invert)
+        
+        with self._lock:
+            self._blinking = object()
+            self._timer    = self._wheel().call_every(1.0 / FADE_RATE, self._fade_step,
+                                                      self._blinking, iter(table),
+                                                      count=steps)
+    
+    # End def
+    
+    
+    def _fade_step(self, token, table):
+        """ Next step of a fade (timer wheel thread) """
+        with self._lock:
+            if token is not self._blinking:
+                return
+            
+            (level, duty) = next(table, (None, None))
+            
+            if level is None:
+                return
+            
+            PWM.set_duty_cycle(self.pin, duty)
+            self.brightness = level
+    
+    # End def
+    
+    
+    def _cancel(self):
+        """ Stop blinking / flashing / fading; returns True if a timer was running """
+        with self._lock:
+            self._blinking = None
+            
+            if self._timer is None:
+                return False
+            
+            self._timer.cancel()
+            self._timer = None
+        
+        return True
+    
+    # End def
+    
+    
+    def stop_blink(self):
+        """ Stop blinking / flashing / fading and turn the LED OFF """
+        if self._cancel():
+            self.off()
     
     # End def
 
@@ -147,8 +390,12 @@ class LED():
     def cleanup(self):
         """ Cleanup the hardware components. """
         # Turn LED off 
+        self.stop_blink()
         self.off()
         
+        if self.pwm:
+            PWM.stop(self.pin)
+        
     # End def
 
 # End class
@@ -160,17 +407,77 @@ class LED():
 # ------------------------------------------------------------------------
 
 if __name__ == '__main__':
+    import sys
     import time
 
+    if "--test" in sys.argv:
+        print("LED Test")
+        
+        led = LED("P2_3")
+        
+        # A flash ends on its own
+        led.flash(0.2)
+        assert led.is_on()
+        time.sleep(0.4)
+        assert not led.is_on(), "Flash did not end"
+        
+        # on() / off() / set_brightness() during a flash are not undone
+        led.flash(0.2)
+        led.on()
+        time.sleep(0.4)
+        assert led.is_on(), "Flash turned the LED off after on()"
+        
+        led.flash(0.2)
+        led.off()
+        led.set_brightness(0.5)
+        time.sleep(0.4)
+        assert led.is_on(), "Flash turned the LED off after set_brightness()"
+        
+        # A blink is stopped by on()
+        led.blink(0.05)
+        time.sleep(0.12)
+        led.on()
+        time.sleep(0.2)
+        assert led.is_on(), "Blink kept running after on()"
+        
+        led.cleanup()
+        
+        print("Test Complete")
+        sys.exit(0)
+
     print("LED Test")
 
-    # Create instantiation of the LED
-    led = LED("P2_3")
+    # Create instantiation of the LED ("--pwm" to fade it in and out)
+    pwm = "--pwm" in sys.argv
+    led = LED("P2_3", pwm=pwm)
+    
+    # is_on() is a cached state:  compare to reading the pin
+    start = time.perf_counter()
+    for i in range(10000):
+        led.is_on()
+    cached = (time.perf_counter() - start) / 10000
+    
+    start = time.perf_counter()
+    for i in range(10000):
+        GPIO.input(led.pin)
+    read = (time.perf_counter() - start) / 10000
+    
+    print("is_on() {0:.2f} us, GPIO.input() {1:.2f} us".format(cached * 1e6, read * 1e6))
     
     # Use a Keyboard Interrupt (i.e. "Ctrl-C") to exit the test
     print("Use Ctrl-C to Exit")
     
     try:
+        while(pwm):
+            # Fade in and out (the fades run on the timer wheel)
+            led.fade(1.0, 1.0)
+            time.sleep(1.5)
+            print("LED brightness {0:.2f}".format(led.brightness))
+            
+            led.fade(0.0, 1.0)
+            time.sleep(1.5)
+            print("LED brightness {0:.2f}".format(led.brightness))
+        
         while(1):
             # Turn LED ON
             led.on()
@@ -185,5 +492,7 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         pass
 
+    led.cleanup()
+
     print("Test Complete")
 
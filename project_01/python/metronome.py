@@ -0,0 +1,310 @@
+"""
+--------------------------------------------------------------------------
+Metronome
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Metronome
+
+  Clicks the buzzer at a target rate for the paced tapping test and matches
+the taps of the patient to the clicks.
+
+  Every click is scheduled on an absolute deadline (start + n * period,
+from time.perf_counter_ns()) instead of sleeping one period after the last
+click, so the time spent clicking and waking up never accumulates:  the
+n-th click is late by the wake up latency of that click only.  The actual
+time of every click is its onset on the buzzer (the time.monotonic_ns(),
+the clock of the tap timestamps, when the sequencer changed the PWM), taken
+from the onsets of the buzzer, so the queue latency of the sequencer does
+not bias the asynchrony.
+
+  The analysis matches every tap to the nearest click and returns the
+asynchrony (tap time - click time; negative when the patient anticipates
+the click), vectorized with numpy over the whole session.
+
+Software API:
+
+  Metronome(buzzer, rate=DEFAULT_RATE, frequency=CLICK_FREQUENCY,
+            click_length=CLICK_LENGTH)
+    - buzzer is a buzzer.BackgroundBuzzer (clicks do not block)
+
+    start() / stop()
+      - Start / stop clicking (on a thread)
+
+    clicks
+      - array of the time.monotonic_ns() of the onset of every click
+        (complete after stop())
+
+    max_late_ns
+      - Largest delay of a click after its deadline
+
+  asynchrony(taps_ns, clicks_ns)
+    - Return Asynchrony(count, mean, stdev, mean_abs, late_fraction) in ms
+      of the taps that are within half a period of a click
+
+Usage:
+
+  python3 metronome.py       - Drift and analysis self test (no hardware)
+
+"""
+import collections
+import threading
+import time
+
+from array import array
+
+import numpy as np
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+DEFAULT_RATE    = 2.0             # Clicks per second
+CLICK_FREQUENCY = 880             # Hz
+CLICK_LENGTH    = 0.03            # s
+
+Asynchrony      = collections.namedtuple("Asynchrony",
+                                         ["count", "mean", "stdev", "mean_abs",
+                                          "late_fraction"])
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class Metronome():
+    """ Metronome Class """
+    buzzer         = None
+    rate           = None
+    frequency      = None
+    click_length   = None
+
+    clicks         = None
+    max_late_ns    = None
+
+    def __init__(self, buzzer, rate=DEFAULT_RATE, frequency=CLICK_FREQUENCY,
+                 click_length=CLICK_LENGTH):
+        """ Initialize the metronome """
+        self.buzzer       = buzzer
+        self.rate         = rate
+        self.frequency    = frequency
+        self.click_length = click_length
+
+        self.clicks       = array("q")
+        self.max_late_ns  = 0
+
+        # queued_ns of the clicks whose onset is not known yet
+        self._pending     = []
+        self._stop        = threading.Event()
+        self._thread      = None
+
+    # End def
+
+
+    def start(self):
+        """ Start clicking """
+        self.clicks      = array("q")
+        self.max_late_ns = 0
+        self._pending    = []
+        self._stop.clear()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # End def
+
+
+    def _run(self):
+        """ Click on absolute deadlines until stopped (metronome thread) """
+        period_ns = int(1e9 / self.rate)
+        start_ns  = time.perf_counter_ns()
+        tick      = 0
+
+        while True:
+            deadline_ns = start_ns + tick * period_ns
+            wait_ns     = deadline_ns - time.perf_counter_ns()
+
+            if (wait_ns > 0) and self._stop.wait(wait_ns / 1e9):
+                return
+
+            if self._stop.is_set():
+                return
+
+            self.max_late_ns = max(self.max_late_ns, time.perf_counter_ns() - deadline_ns)
+
+            self._pending.append(self.buzzer.play(self.frequency, self.click_length, True))
+            self._resolve()
+
+            # A click that was missed entirely is skipped, not played late
+            tick = max(tick + 1, (time.perf_counter_ns() - start_ns) // period_ns + 1)
+
+    # End def
+
+
+    def stop(self):
+        """ Stop clicking """
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        # Onset of the last click;  clicks dropped by buzzer.stop() have none
+        self.buzzer.wait(1.0)
+        self._resolve()
+        self._pending = []
+
+    # End def
+
+
+    def _resolve(self):
+        """ Move the onsets of the pending clicks to clicks """
+        # A copy:  the sequencer thread appends to the onsets
+        onsets = {queued_ns: onset_ns for (frequency, queued_ns, onset_ns)
+                  in self.buzzer.onsets.copy() if frequency is not None}
+        pending = []
+
+        for queued_ns in self._pending:
+            if queued_ns in onsets:
+                self.clicks.append(onsets[queued_ns])
+            else:
+                pending.append(queued_ns)
+
+        self._pending = pending
+
+# End class
+
+
+def asynchrony(taps_ns, clicks_ns):
+    """ Match every tap to the nearest click
+
+        taps_ns   - Tap times (ns, time.monotonic_ns())
+        clicks_ns - Click times (ns, time.monotonic_ns())
+
+        Returns Asynchrony in ms (NaN if no tap is near a click)
+    """
+    taps   = np.asarray(taps_ns, dtype=np.int64)
+    clicks = np.asarray(clicks_ns, dtype=np.int64)
+
+    if (len(taps) == 0) or (len(clicks) < 2):
+        return Asynchrony(0, float("nan"), float("nan"), float("nan"), float("nan"))
+
+    half_period = np.median(np.diff(clicks)) / 2
+
+    # Nearest click:  the one before or after the tap
+    after   = np.clip(np.searchsorted(clicks, taps), 1, len(clicks) - 1)
+    before  = after - 1
+    to_prev = taps - clicks[before]
+    to_next = taps - clicks[after]
+    offsets = np.where(np.abs(to_prev) <= np.abs(to_next), to_prev, to_next)
+
+    # Taps more than half a period outside the clicks are not matched
+    offsets = offsets[np.abs(offsets) <= half_period] / 1e6
+
+    if len(offsets) == 0:
+        return Asynchrony(0, float("nan"), float("nan"), float("nan"), float("nan"))
+
+    return Asynchrony(int(len(offsets)), float(offsets.mean()),
+                      float(offsets.std(ddof=1)) if len(offsets) > 1 else 0.0,
+                      float(np.abs(offsets).mean()), float((offsets > 0).mean()))
+
+# End def
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    print("Metronome Test")
+
+    class Silent():
+        """ Buzzer that takes as long as a PWM start to play """
+        def __init__(self):
+            self.onsets = collections.deque(maxlen=256)
+
+        def play(self, frequency, length=1.0, stop=False):
+            queued_ns = time.monotonic_ns()
+            time.sleep(0.002)
+            self.onsets.append((frequency, queued_ns, time.monotonic_ns()))
+            return queued_ns
+
+        def wait(self, timeout=None):
+            return True
+
+    # 10 s at 10 Hz:  a sleep loop drifts by every overhead, deadlines do not
+    rate      = 10.0
+    silent    = Silent()
+    metronome = Metronome(silent, rate)
+    metronome.start()
+    time.sleep(10.0 + 0.5 / rate)
+    metronome.stop()
+
+    # The clicks are the onsets, not the times the tones were queued
+    clicks = np.asarray(metronome.clicks)
+    assert list(metronome.clicks) == [onset_ns for (f, q, onset_ns) in silent.onsets]
+    drift  = (clicks[-1] - clicks[0]) / 1e6 - (len(clicks) - 1) * 1e3 / rate
+    print("    Deadlines:  {0} clicks, drift {1:+.2f} ms, max late {2:.2f} ms".format(
+          len(clicks), drift, metronome.max_late_ns / 1e6))
+
+    sleep_clicks = []
+    for i in range(len(clicks)):
+        sleep_clicks.append(time.monotonic_ns())
+        Silent().play(CLICK_FREQUENCY)
+        time.sleep(1.0 / rate)
+
+    drift  = (sleep_clicks[-1] - sleep_clicks[0]) / 1e6 - (len(clicks) - 1) * 1e3 / rate
+    print("    Sleep loop: {0} clicks, drift {1:+.2f} ms".format(len(sleep_clicks), drift))
+
+    # Taps 30 ms ahead of the clicks with 10 ms of noise, plus a stray tap
+    rng     = np.random.default_rng(1)
+    clicks  = np.arange(0, 600) * 500000000
+    taps    = clicks - 30000000 + rng.normal(0, 10000000, len(clicks)).astype(np.int64)
+    taps    = np.append(taps, clicks[-1] + 400000000)
+
+    start   = time.perf_counter()
+    result  = asynchrony(taps, clicks)
+    elapsed = time.perf_counter() - start
+
+    print("    {0} taps: mean {1:+.1f} ms, sd {2:.1f} ms in {3:.2f} ms".format(
+          result.count, result.mean, result.stdev, elapsed * 1e3))
+
+    assert result.count == len(clicks)
+    assert abs(result.mean + 30) < 2 and abs(result.stdev - 10) < 2
+    assert asynchrony([], clicks).count == 0
+
+    print("Test Complete")
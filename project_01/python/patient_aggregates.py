@@ -0,0 +1,536 @@
+"""
+--------------------------------------------------------------------------
+Patient Aggregates
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Patient Aggregates
+
+  Longitudinal statistics of the mean tap frequency of each patient across
+their sessions, updated in O(1) when a session completes instead of
+rescanning the session store:
+
+    - Mean and variance of the session means (Welford's algorithm)
+    - Trend slope of the session means in Hz per day (running least
+      squares sums, time measured from the first session of the patient)
+    - Last N sessions and their rolling mean
+
+  The aggregates are a materialized view of a SessionStore.  They are saved
+to a snapshot file together with the last session id they include; when
+loaded, catch_up() applies the sessions stored after the snapshot.  The
+command line can rebuild the aggregates from scratch and check a snapshot
+against a rebuild.
+
+Software API:
+
+  PatientAggregates(last_n=10)
+    - Provide the number of recent sessions kept per patient
+
+    update(session_id, patient_id, start_time, stats)
+      - Add a completed session (ignored if already included)
+
+    get(patient_id)
+      - Return the PatientAggregate of a patient (None if unknown)
+
+    catch_up(store)
+      - Apply the sessions of a SessionStore newer than the aggregates
+
+    save(path) / load(path)
+      - Atomically write / read a snapshot
+
+  rebuild(store, last_n=10)
+    - Return new PatientAggregates of every session of a SessionStore
+
+  Command line:
+    python3 patient_aggregates.py STORE show PATIENT_ID
+    python3 patient_aggregates.py STORE rebuild
+    python3 patient_aggregates.py STORE check
+    python3 patient_aggregates.py STORE benchmark
+    python3 patient_aggregates.py --test    (self test on a temporary store)
+
+"""
+import collections
+import math
+import os
+import struct
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+AGGREGATES_FILE  = "patients.agg"
+
+MAGIC            = b"TAPA"
+VERSION          = 1
+
+SECONDS_PER_DAY  = 86400.0
+
+# Snapshot header:  magic, version, last session id, last N, patient count
+SNAPSHOT_HEADER  = struct.Struct("<4sIQII")
+
+# Patient:  patient id, count, mean, m2, first time, sum x, sum y, sum xx,
+#           sum xy, number of recent sessions
+PATIENT          = struct.Struct("<QIdddddddI")
+
+# Recent session:  session id, start time, mean frequency
+RECENT           = struct.Struct("<Qdd")
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class PatientAggregate():
+    """ Patient Aggregate Class """
+    __slots__ = ("patient_id", "count", "mean", "m2", "first_time",
+                 "sum_x", "sum_y", "sum_xx", "sum_xy", "recent")
+
+    def __init__(self, patient_id, last_n):
+        """ Initialize an empty aggregate """
+        self.patient_id = patient_id
+        self.count      = 0
+        self.mean       = 0.0
+        self.m2         = 0.0
+        self.first_time = None
+        self.sum_x      = 0.0
+        self.sum_y      = 0.0
+        self.sum_xx     = 0.0
+        self.sum_xy     = 0.0
+
+        # (session id, start time, mean frequency) of the last N sessions
+        self.recent     = collections.deque(maxlen=last_n)
+
+    # End def
+
+
+    def add(self, session_id, start_time, mean_freq):
+        """ Add the mean frequency of a session """
+        if self.first_time is None:
+            self.first_time = start_time
+
+        self.count += 1
+
+        # Welford's algorithm
+        delta       = mean_freq - self.mean
+        self.mean  += delta / self.count
+        self.m2    += delta * (mean_freq - self.mean)
+
+        # Least squares sums
+        x            = (start_time - self.first_time) / SECONDS_PER_DAY
+        self.sum_x  += x
+        self.sum_y  += mean_freq
+        self.sum_xx += x * x
+        self.sum_xy += x * mean_freq
+
+        self.recent.append((session_id, start_time, mean_freq))
+
+    # End def
+
+
+    def variance(self):
+        """ Return the variance of the session means (NaN if < 2 sessions) """
+        if self.count < 2:
+            return math.nan
+
+        return self.m2 / self.count
+
+    # End def
+
+
+    def slope(self):
+        """ Return the trend of the session means in Hz per day (NaN if unknown) """
+        denominator = self.count * self.sum_xx - self.sum_x * self.sum_x
+
+        if (self.count < 2) or (denominator <= 0.0):
+            return math.nan
+
+        return (self.count * self.sum_xy - self.sum_x * self.sum_y) / denominator
+
+    # End def
+
+
+    def rolling_mean(self):
+        """ Return the mean frequency of the last N sessions (NaN if none) """
+        if not self.recent:
+            return math.nan
+
+        return sum(recent[2] for recent in self.recent) / len(self.recent)
+
+    # End def
+
+
+    def last_sessions(self):
+        """ Return the (session id, start time, mean) of the last N sessions """
+        return list(self.recent)
+
+    # End def
+
+# End class
+
+
+class PatientAggregates():
+    """ Patient Aggregates Class """
+    last_n            = None
+    last_session_id   = None
+    patients          = None
+
+    def __init__(self, last_n=10):
+        """ Initialize empty aggregates """
+        self.last_n          = last_n
+        self.last_session_id = 0
+        self.patients        = {}
+
+    # End def
+
+
+    def __len__(self):
+        """ Return the number of patients """
+        return len(self.patients)
+
+    # End def
+
+
+    def update(self, session_id, patient_id, start_time, stats):
+        """ Add a completed session
+
+            session_id - Id of the session in the SessionStore
+            patient_id - Id of the patient
+            start_time - Wall clock start time of the session
+            stats      - TapStats of the session
+        """
+        # Sessions must be applied in order and only once
+        if session_id <= self.last_session_id:
+            return
+
+        self.last_session_id = session_id
+
+        # Sessions without an interval have no frequency
+        if stats.count == 0:
+            return
+
+        patient = self.patients.get(patient_id)
+
+        if patient is None:
+            patient = PatientAggregate(patient_id, self.last_n)
+            self.patients[patient_id] = patient
+
+        patient.add(session_id, start_time, stats.mean)
+
+    # End def
+
+
+    def get(self, patient_id):
+        """ Return the PatientAggregate of a patient (None if unknown) """
+        return self.patients.get(patient_id)
+
+    # End def
+
+
+    def catch_up(self, store):
+        """ Apply the sessions of a SessionStore newer than the aggregates """
+        for entry in store.entries():
+            if entry.session_id > self.last_session_id:
+                self.update(entry.session_id, entry.patient_id, entry.start_time,
+                            store.read_stats(entry))
+
+    # End def
+
+
+    def save(self, path):
+        """ Atomically write a snapshot of the aggregates to path """
+        temp_path = path + ".tmp"
+
+        with open(temp_path, "wb") as snapshot:
+            snapshot.write(SNAPSHOT_HEADER.pack(MAGIC, VERSION, self.last_session_id,
+                                                self.last_n, len(self.patients)))
+
+            for patient in self.patients.values():
+                snapshot.write(PATIENT.pack(patient.patient_id, patient.count, patient.mean,
+                                            patient.m2, patient.first_time, patient.sum_x,
+                                            patient.sum_y, patient.sum_xx, patient.sum_xy,
+                                            len(patient.recent)))
+
+                for recent in patient.recent:
+                    snapshot.write(RECENT.pack(*recent))
+
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+
+        os.replace(temp_path, path)
+
+    # End def
+
+
+    @classmethod
+    def load(cls, path, last_n=10):
+        """ Return the aggregates of a snapshot (empty if there is none) """
+        if not os.path.exists(path):
+            return cls(last_n)
+
+        with open(path, "rb") as snapshot:
+            data = snapshot.read()
+
+        (magic, version, last_session_id, last_n, count) = SNAPSHOT_HEADER.unpack_from(data)
+
+        if (magic != MAGIC) or (version != VERSION):
+            raise ValueError("{0} is not a patient aggregates snapshot".format(path))
+
+        aggregates                 = cls(last_n)
+        aggregates.last_session_id = last_session_id
+        offset                     = SNAPSHOT_HEADER.size
+
+        for i in range(count):
+            fields  = PATIENT.unpack_from(data, offset)
+            offset += PATIENT.size
+
+            patient = PatientAggregate(fields[0], last_n)
+            (patient.count, patient.mean, patient.m2, patient.first_time, patient.sum_x,
+             patient.sum_y, patient.sum_xx, patient.sum_xy) = fields[1:9]
+
+            for j in range(fields[9]):
+                patient.recent.append(RECENT.unpack_from(data, offset))
+                offset += RECENT.size
+
+            aggregates.patients[patient.patient_id] = patient
+
+        return aggregates
+
+    # End def
+
+# End class
+
+
+def rebuild(store, last_n=10):
+    """ Return new PatientAggregates of every session of a SessionStore """
+    aggregates = PatientAggregates(last_n)
+    aggregates.catch_up(store)
+
+    return aggregates
+
+# End def
+
+
+def differences(aggregates, expected, tolerance=1e-9):
+    """ Return the patient ids whose aggregates differ from expected """
+    different = set(aggregates.patients) ^ set(expected.patients)
+
+    for (patient_id, patient) in expected.patients.items():
+        other = aggregates.get(patient_id)
+
+        if other is None:
+            continue
+
+        values = [(patient.count, other.count),
+                  (patient.mean, other.mean),
+                  (patient.variance(), other.variance()),
+                  (patient.slope(), other.slope()),
+                  (patient.rolling_mean(), other.rolling_mean())]
+
+        for (a, b) in values:
+            if not ((math.isnan(a) and math.isnan(b)) or
+                    math.isclose(a, b, rel_tol=tolerance, abs_tol=tolerance)):
+                different.add(patient_id)
+
+    return sorted(different)
+
+# End def
+
+
+def _self_test():
+    """ Check the aggregates of a temporary store against direct computation """
+    import random
+    import statistics
+    import tempfile
+
+    import session_store as SESSION_STORE
+    import tap_analysis as TAP_ANALYSIS
+    import tap_session as TAP_SESSION
+
+    print("Patient Aggregates Test")
+
+    random.seed(1)
+
+    path     = tempfile.mkdtemp()
+    store    = SESSION_STORE.SessionStore(path)
+    sessions = collections.defaultdict(list)        # patient id: [(start time, mean)]
+
+    def add_sessions(count):
+        """ Store sessions of 5 patients over 30 days """
+        for i in range(count):
+            patient_id = random.randrange(5)
+            start_time = 1700000000.0 + random.uniform(0.0, 30.0) * SECONDS_PER_DAY
+            session    = TAP_SESSION.TapSession(start_time)
+            tap_ns     = 0
+
+            for j in range(random.randint(5, 40)):
+                tap_ns += random.randint(150000000, 400000000)
+                session.append(tap_ns - 30000000, tap_ns)
+
+            stats = TAP_ANALYSIS.analyze(session.frequencies())
+            store.append(session, stats, patient_id)
+            sessions[patient_id].append((start_time, stats.mean))
+
+        store.flush()
+
+    # Half of the sessions, a snapshot, then catch up with the rest
+    add_sessions(100)
+    aggregates = rebuild(store, last_n=3)
+    aggregates.save(os.path.join(path, AGGREGATES_FILE))
+
+    add_sessions(100)
+    loaded = PatientAggregates.load(os.path.join(path, AGGREGATES_FILE))
+    assert (loaded.last_session_id, loaded.last_n) == (100, 3)
+    assert differences(loaded, aggregates, tolerance=0.0) == []
+
+    loaded.catch_up(store)
+    assert loaded.last_session_id == 200
+
+    # Sessions that are already included are ignored
+    entry = store.entries()[0]
+    loaded.update(entry.session_id, entry.patient_id, entry.start_time, store.read_stats(entry))
+
+    for (patient_id, values) in sorted(sessions.items()):
+        patient = loaded.get(patient_id)
+        means   = [mean for (start_time, mean) in values]
+        days    = [(start_time - values[0][0]) / SECONDS_PER_DAY for (start_time, mean) in values]
+        slope   = statistics.linear_regression(days, means).slope
+
+        assert patient.count == len(values)
+        assert math.isclose(patient.mean, statistics.fmean(means), rel_tol=1e-9)
+        assert math.isclose(patient.variance(), statistics.pvariance(means), rel_tol=1e-9)
+        assert math.isclose(patient.slope(), slope, rel_tol=1e-6, abs_tol=1e-9)
+        assert math.isclose(patient.rolling_mean(), statistics.fmean(means[-3:]), rel_tol=1e-9)
+
+        print("    Patient {0}: {1:2d} sessions, mean {2:.3f} Hz, trend {3:+.4f} Hz/day".format(
+              patient_id, patient.count, patient.mean, patient.slope()))
+
+    # Snapshot round trip of the caught up aggregates
+    loaded.save(os.path.join(path, AGGREGATES_FILE))
+    assert differences(PatientAggregates.load(os.path.join(path, AGGREGATES_FILE)),
+                       loaded, tolerance=0.0) == []
+
+    store.close()
+
+    print("Test Complete")
+
+# End def
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    import random
+    import sys
+    import time
+
+    import session_store as SESSION_STORE
+    import tap_analysis as TAP_ANALYSIS
+
+    if "--test" in sys.argv:
+        _self_test()
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="TapFreq patient aggregates")
+    parser.add_argument("store", help="Directory of the session store")
+    parser.add_argument("command", choices=["show", "rebuild", "check", "benchmark"])
+    parser.add_argument("patient_id", type=int, nargs="?", default=0)
+    parser.add_argument("--last-n", type=int, default=10)
+    args = parser.parse_args()
+
+    path = os.path.join(args.store, AGGREGATES_FILE)
+
+    if args.command == "benchmark":
+        # Synthetic weekly sessions of 100k patients
+        aggregates = PatientAggregates(args.last_n)
+        session_id = 0
+        start      = time.perf_counter()
+
+        for week in range(10):
+            for patient_id in range(100000):
+                session_id += 1
+                mean        = 5.0 - 0.01 * week + random.gauss(0.0, 0.2)
+                aggregates.update(session_id, patient_id, 1700000000.0 + week * 7 * SECONDS_PER_DAY,
+                                  TAP_ANALYSIS.TapStats(20, mean, 0.5, mean - 1.0, mean + 1.0))
+
+        print("{0} updates in {1:.2f} s".format(session_id, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        for patient_id in range(100000):
+            aggregates.get(patient_id).slope()
+        print("Query of 100000 patients in {0:.1f} ms".format((time.perf_counter() - start) * 1e3))
+
+        os.makedirs(args.store, exist_ok=True)
+
+        start = time.perf_counter()
+        aggregates.save(path)
+        aggregates = PatientAggregates.load(path)
+        print("Snapshot save + load in {0:.2f} s".format(time.perf_counter() - start))
+
+    else:
+        store = SESSION_STORE.SessionStore(args.store)
+
+        if args.command == "show":
+            aggregates = PatientAggregates.load(path, args.last_n)
+            aggregates.catch_up(store)
+            patient    = aggregates.get(args.patient_id)
+
+            if patient is None:
+                print("No sessions for patient {0}".format(args.patient_id))
+            else:
+                print("Patient {0}: {1} sessions".format(patient.patient_id, patient.count))
+                print("  Mean      {0:.3f} Hz".format(patient.mean))
+                print("  Variance  {0:.4f}".format(patient.variance()))
+                print("  Trend     {0:+.4f} Hz/day".format(patient.slope()))
+                print("  Rolling   {0:.3f} Hz".format(patient.rolling_mean()))
+                for (session_id, start_time, mean) in patient.last_sessions():
+                    print("    #{0} {1} {2:.3f} Hz".format(session_id, time.ctime(start_time), mean))
+
+        elif args.command == "rebuild":
+            aggregates = rebuild(store, args.last_n)
+            aggregates.save(path)
+            print("Rebuilt {0} patients".format(len(aggregates)))
+
+        elif args.command == "check":
+            aggregates = PatientAggregates.load(path, args.last_n)
+            aggregates.catch_up(store)
+            different  = differences(aggregates, rebuild(store, aggregates.last_n))
+
+            print("{0} patients differ from a rebuild {1}".format(len(different), different[:10]))
+
+        store.close()
@@ -0,0 +1,638 @@
+"""
+--------------------------------------------------------------------------
+Piezo Tap Sensor
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+
+Piezo Tap Sensor
+
+  Detects taps from a piezo disc on an analog input, with the force of
+every tap (peak amplitude), instead of the on / off contact of the Sensor.
+
+  The ADC is sampled in blocks into one preallocated buffer:
+
+    IIOSource    - The kernel ADC buffer (/dev/iio:device0):  the ADC runs
+                   continuously and every read returns a whole block, read
+                   straight into the buffer (readinto), so no sample is
+                   lost between reads and Python runs once per block
+    PolledSource - Adafruit_BBIO.ADC.read_raw() for every sample (when
+                   there is no IIO buffer;  rate limited by Python)
+
+  The detection works on a whole block at a time with numpy:  the samples
+are rectified around the baseline (median of the quiet blocks), the upward
+crossings of the threshold are found with one comparison of the block
+with itself shifted by a sample, and only the crossings (a few per block)
+are looked at one by one:  a crossing within "refractory" seconds of the
+last tap is a ring of the disc, not a tap.  The peak is the maximum of the
+"peak_time" seconds after the onset;  the last peak_time of a block is
+kept for the next block so a tap on a block boundary is measured whole.
+
+  Every sample has a time.monotonic_ns() timestamp (end of the block read
+minus the samples after it), the clock of the Sensor taps.
+
+Software API:
+
+  PiezoDetector(rate, threshold, refractory=0.05, peak_time=0.01,
+                baseline=None)
+    process(block, end_ns)
+      - Return the PiezoTaps of a block (numpy array) whose last sample
+        was read at end_ns
+
+  PiezoTap(onset_ns, release_ns, peak, peak_ns)
+    - release_ns:  first sample back under the threshold after the peak
+
+  PiezoSensor(pin=ANALOG_PIN, threshold=DEFAULT_THRESHOLD, rate=None,
+              block=DEFAULT_BLOCK, source=None)
+    - Drop-in tap source for Proj (like Sensor / TapCapture), sampling on
+      a thread
+
+    start() / close()
+    wait_for_tap() / get_tap_onset_ns() / get_tap_release_ns()
+    get_tap_force()
+      - Peak amplitude of the last tap (ADC counts above the baseline)
+    interrupt() / clear_interrupt()
+
+Usage:
+
+  python3 piezo.py --test     - Detection and throughput on a synthetic
+                                waveform (no hardware)
+
+"""
+import collections
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+import Adafruit_BBIO.ADC as ADC
+
+import input_device as INPUT_DEVICE
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+ANALOG_PIN        = "P1_19"       # AIN0 (1.8 V max)
+AIN_CHANNELS      = {"P1_19": 0, "P1_21": 1, "P1_23": 2, "P1_25": 3, "P1_27": 4,
+                     "P2_35": 5, "P1_02": 6, "P2_36": 7}
+
+IIO_DEVICE        = "/dev/iio:device0"
+IIO_SYSFS         = "/sys/bus/iio/devices/iio:device0"
+
+IIO_RATE          = 10000         # Samples per second of the IIO buffer
+DEFAULT_BLOCK     = 256           # Samples per block
+DEFAULT_THRESHOLD = 200           # ADC counts above the baseline (12 bit)
+
+PiezoTap          = collections.namedtuple("PiezoTap", ["onset_ns", "release_ns", "peak",
+                                                        "peak_ns"])
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class IIOSource():
+    """ IIO Buffer ADC Source Class """
+    channel        = None
+    rate           = None
+
+    def __init__(self, channel, rate=IIO_RATE, block=DEFAULT_BLOCK, sysfs=IIO_SYSFS,
+                 device=IIO_DEVICE):
+        """ Enable the channel and the kernel buffer """
+        self.channel = channel
+        self.rate    = rate
+        self._sysfs  = sysfs
+
+        # Only the channel is scanned:  one 16 bit word per sample
+        self._write(os.path.join("buffer", "enable"), 0)
+        self._write(os.path.join("scan_elements", "in_voltage{0}_en".format(channel)), 1)
+        self._write(os.path.join("buffer", "length"), 16 * block)
+        self._write(os.path.join("buffer", "enable"), 1)
+
+        self._file   = open(device, "rb", buffering=0)
+
+    # End def
+
+
+    def _write(self, name, value):
+        """ Write an attribute of the IIO device """
+        with open(os.path.join(self._sysfs, name), "w") as attribute:
+            attribute.write(str(value))
+
+    # End def
+
+
+    def read_into(self, buffer):
+        """ Fill buffer (uint16) with the next samples, returns the
+            time.monotonic_ns() of the last one
+        """
+        view  = memoryview(buffer).cast("B")
+        count = 0
+
+        while count < len(view):
+            count += self._file.readinto(view[count:])
+
+        return time.monotonic_ns()
+
+    # End def
+
+
+    def close(self):
+        """ Stop the kernel buffer """
+        self._file.close()
+        self._write(os.path.join("buffer", "enable"), 0)
+
+    # End def
+
+# End class
+
+
+class PolledSource():
+    """ Polled ADC Source Class """
+    pin            = None
+    rate           = None
+
+    def __init__(self, pin, rate=1000):
+        """ Set up the ADC (rate:  samples per second to aim for) """
+        ADC.setup()
+
+        self.pin       = pin
+        self.rate      = rate
+        self._next     = None
+
+    # End def
+
+
+    def read_into(self, buffer):
+        """ Fill buffer with samples on absolute deadlines, returns the
+            time.monotonic_ns() of the last one
+        """
+        period = 1.0 / self.rate
+
+        if self._next is None:
+            self._next = time.monotonic()
+
+        for i in range(len(buffer)):
+            buffer[i]   = int(ADC.read_raw(self.pin))
+            self._next += period
+
+            wait = self._next - time.monotonic()
+
+            if wait > 0:
+                time.sleep(wait)
+
+        return time.monotonic_ns()
+
+    # End def
+
+
+    def close(self):
+        """ Nothing to release """
+        pass
+
+    # End def
+
+# End class
+
+
+class SyntheticSource():
+    """ Synthetic Piezo Waveform Class (tests and benchmarks) """
+    rate           = None
+    taps           = None
+
+    def __init__(self, rate=IIO_RATE, tap_rate=4.0, baseline=2048, noise=20, seed=1,
+                 realtime=False):
+        """ Taps every 1 / tap_rate s (jittered) with random forces:  a
+            decaying 300 Hz ring of the disc over the baseline and noise
+        """
+        self.rate      = rate
+        self.taps      = []               # (onset sample, amplitude)
+
+        self._tap_rate = tap_rate
+        self._baseline = baseline
+        self._noise    = noise
+        self._rng      = np.random.default_rng(seed)
+        self._realtime = realtime
+        self._sample   = 0
+        self._next_tap = int(rate / tap_rate)
+        self._ring     = np.zeros(0)
+        self._start_ns = time.monotonic_ns()
+
+        # Response of the disc to a tap of amplitude 1
+        t              = np.arange(int(0.03 * rate)) / rate
+        self._response = np.sin(2 * np.pi * 300 * t) * np.exp(-t / 0.006)
+        self._response = np.maximum(self._response, -0.3)
+
+    # End def
+
+
+    def read_into(self, buffer):
+        """ Fill buffer with the next samples """
+        count   = len(buffer)
+        signal  = self._baseline + self._rng.normal(0, self._noise, count)
+
+        # Ring of the taps of the previous blocks
+        ring    = self._ring[:count]
+        signal[:len(ring)] += ring
+        self._ring = self._ring[count:]
+
+        while self._next_tap < self._sample + count:
+            amplitude = self._rng.uniform(400, 1500)
+            offset    = self._next_tap - self._sample
+            response  = amplitude * self._response
+            end       = min(count, offset + len(response))
+
+            signal[offset:end] += response[:end - offset]
+
+            rest       = response[end - offset:]
+            carry      = np.zeros(max(len(self._ring), len(rest)))
+            carry[:len(self._ring)] += self._ring
+            carry[:len(rest)]       += rest
+            self._ring = carry
+
+            self.taps.append((self._next_tap, amplitude))
+            self._next_tap += int(self.rate / self._tap_rate * self._rng.uniform(0.8, 1.2))
+
+        buffer[:] = np.clip(signal, 0, 4095)
+        self._sample += count
+
+        end_ns = self._start_ns + int(self._sample * 1e9 / self.rate)
+
+        if self._realtime:
+            wait = (end_ns - time.monotonic_ns()) / 1e9
+
+            if wait > 0:
+                time.sleep(wait)
+
+        return end_ns
+
+    # End def
+
+
+    def sample_ns(self, sample):
+        """ Return the timestamp of a sample """
+        return self._start_ns + int((sample + 1) * 1e9 / self.rate)
+
+    # End def
+
+
+    def close(self):
+        """ Nothing to release """
+        pass
+
+    # End def
+
+# End class
+
+
+class PiezoDetector():
+    """ Piezo Tap Detector Class """
+    rate           = None
+    threshold      = None
+    refractory     = None
+    peak_time      = None
+    baseline       = None
+
+    def __init__(self, rate, threshold=DEFAULT_THRESHOLD, refractory=0.05, peak_time=0.01,
+                 baseline=None, block=DEFAULT_BLOCK):
+        """ Initialize the detector
+
+            rate       - Samples per second
+            threshold  - Onset threshold (ADC counts above the baseline)
+            refractory - Time after an onset in which crossings are ignored
+            peak_time  - Time after the onset in which the peak is searched
+            baseline   - Level of the quiet input (None to track it)
+        """
+        self.rate        = rate
+        self.threshold   = threshold
+        self.refractory  = refractory
+        self.peak_time   = peak_time
+        self.baseline    = baseline
+
+        self._track      = baseline is None
+        self._peak_len   = max(1, int(peak_time * rate))
+        self._refractory = int(refractory * rate)
+
+        # Work buffers:  the samples kept from the last block + a block
+        self._work       = np.zeros(self._peak_len + block, dtype=np.float64)
+        self._level      = np.zeros(self._peak_len + block, dtype=np.float64)
+        self._above      = np.zeros(self._peak_len + block, dtype=bool)
+        self._kept       = 0
+        self._sample     = 0              # Sample number of work[0]
+        self._last_onset = None           # Sample number of the last onset
+        self._was_above  = False          # Last sample before work[0] above?
+
+    # End def
+
+
+    def process(self, block, end_ns):
+        """ Return the PiezoTaps of a block whose last sample was read at end_ns """
+        count = self._kept + len(block)
+
+        # A longer block than announced grows the buffers once
+        if len(self._work) < count:
+            work              = np.zeros(count, dtype=np.float64)
+            work[:self._kept] = self._work[:self._kept]
+            self._work        = work
+            self._level       = np.zeros(count, dtype=np.float64)
+            self._above       = np.zeros(count, dtype=bool)
+
+        if self.baseline is None:
+            self.baseline = float(np.median(block))
+
+        work              = self._work[:count]
+        work[self._kept:] = block
+
+        # Rectified level above the baseline (in place, no allocation)
+        level = self._level[:count]
+        above = self._above[:count]
+
+        np.subtract(work, self.baseline, out=level)
+        np.abs(level, out=level)
+        np.greater_equal(level, self.threshold, out=above)
+
+        # Onsets need peak_len samples after them:  the rest waits
+        limit = count - self._peak_len
+
+        if limit <= 0:
+            return []
+
+        onsets = np.flatnonzero(above[1:limit] & ~above[:limit - 1]) + 1
+
+        if above[0] and not self._was_above:
+            onsets = np.concatenate(([0], onsets))
+
+        taps      = []
+        period_ns = 1e9 / self.rate
+
+        for onset in onsets.tolist():
+            number = self._sample + onset
+
+            # Rings of the disc after a tap are not taps
+            if (self._last_onset is not None) and (number - self._last_onset < self._refractory):
+                continue
+
+            self._last_onset = number
+
+            window  = level[onset:onset + self._peak_len]
+            peak_at = int(np.argmax(window))
+            below   = np.flatnonzero(~above[onset + peak_at:onset + self._peak_len])
+            release = onset + peak_at + (int(below[0]) if len(below) else len(window) - peak_at)
+
+            taps.append(PiezoTap(int(end_ns - (count - 1 - onset) * period_ns),
+                                 int(end_ns - (count - 1 - release) * period_ns),
+                                 float(window[peak_at]),
+                                 int(end_ns - (count - 1 - onset - peak_at) * period_ns)))
+
+        # Track the baseline on the blocks without taps
+        if self._track and not above.any():
+            self.baseline += 0.1 * (float(np.median(block)) - self.baseline)
+
+        # Keep the last peak_len samples for the next block
+        self._was_above            = bool(above[limit - 1])
+        self._work[:count - limit] = work[limit:]
+        self._kept                 = count - limit
+        self._sample              += limit
+
+        return taps
+
+    # End def
+
+# End class
+
+
+class PiezoSensor():
+    """ Piezo Sensor Class """
+    pin            = None
+    source         = None
+    detector       = None
+
+    tap_onset_ns   = None
+    tap_release_ns = None
+    tap_force      = None
+
+    def __init__(self, pin=ANALOG_PIN, threshold=DEFAULT_THRESHOLD, rate=None,
+                 block=DEFAULT_BLOCK, source=None, refractory=0.05):
+        """ Open the ADC source (the IIO buffer when there is one) """
+        self.pin = pin
+
+        if source is None:
+            if os.path.exists(IIO_DEVICE):
+                source = IIOSource(AIN_CHANNELS[pin], rate or IIO_RATE, block)
+            else:
+                source = PolledSource(pin, rate or 1000)
+
+        self.source     = source
+        self.detector   = PiezoDetector(source.rate, threshold, refractory, block=block)
+
+        self._buffer    = np.zeros(block, dtype=np.uint16)
+        self._taps      = queue.Queue()
+        self._stop      = threading.Event()
+        self._interrupt = threading.Event()
+        self._thread    = None
+
+    # End def
+
+
+    def start(self):
+        """ Start sampling (on a thread) """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # End def
+
+
+    def _run(self):
+        """ Read and process the blocks (sampling thread) """
+        while not self._stop.is_set():
+            end_ns = self.source.read_into(self._buffer)
+
+            for tap in self.detector.process(self._buffer, end_ns):
+                self._taps.put(tap)
+
+    # End def
+
+
+    def wait_for_tap(self, timeout=None):
+        """ Wait for the next tap, returns the PiezoTap or None """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            if self._interrupt.is_set():
+                self._interrupt.clear()
+                raise INPUT_DEVICE.Interrupted()
+
+            # Short waits so an interrupt is seen
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+
+            try:
+                tap = self._taps.get(timeout=max(0.0, wait))
+                break
+            except queue.Empty:
+                if (deadline is not None) and (time.monotonic() >= deadline):
+                    return None
+
+        self.tap_onset_ns   = tap.onset_ns
+        self.tap_release_ns = tap.release_ns
+        self.tap_force      = tap.peak
+
+        return tap
+
+    # End def
+
+
+    def get_tap_onset_ns(self):
+        """ Return the monotonic time (ns) of the most recent tap onset """
+        return self.tap_onset_ns
+
+    # End def
+
+
+    def get_tap_release_ns(self):
+        """ Return the monotonic time (ns) of the most recent tap release """
+        return self.tap_release_ns
+
+    # End def
+
+
+    def get_tap_force(self):
+        """ Return the peak amplitude of the most recent tap """
+        return self.tap_force
+
+    # End def
+
+
+    def discard(self):
+        """ Skip the taps that have not been read """
+        while True:
+            try:
+                self._taps.get_nowait()
+            except queue.Empty:
+                return
+
+    # End def
+
+
+    def interrupt(self):
+        """ Make the current (or next) wait_for_tap() raise Interrupted """
+        self._interrupt.set()
+
+    # End def
+
+
+    def clear_interrupt(self):
+        """ Drop an interrupt that no wait has consumed """
+        self._interrupt.clear()
+
+    # End def
+
+
+    def close(self):
+        """ Stop sampling and close the source """
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.source.close()
+
+    # End def
+
+# End class
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    print("Piezo Tap Sensor Test")
+
+    # 10 minutes of taps at 10 kHz, detected block by block
+    source   = SyntheticSource(IIO_RATE)
+    detector = PiezoDetector(source.rate)
+    buffer   = np.zeros(DEFAULT_BLOCK, dtype=np.uint16)
+    blocks   = int(600 * source.rate / len(buffer))
+    taps     = []
+    elapsed  = 0.0
+
+    for i in range(blocks):
+        end_ns   = source.read_into(buffer)
+        start    = time.perf_counter()
+        taps    += detector.process(buffer, end_ns)
+        elapsed += time.perf_counter() - start
+
+    # Every tap of the source is found once, at its onset, with its force
+    expected = [(onset, amplitude) for (onset, amplitude) in source.taps
+                if onset < blocks * len(buffer) - detector._peak_len]
+    errors   = np.array([(tap.onset_ns - source.sample_ns(onset)) / 1e6
+                         for (tap, (onset, amplitude)) in zip(taps, expected)])
+    ratios   = np.array([tap.peak / amplitude for (tap, (onset, amplitude)) in zip(taps, expected)])
+
+    print("    {0} taps of {1}:  onset error {2:.2f} ms max, peak / force {3:.2f} - {4:.2f}".format(
+          len(taps), len(expected), np.abs(errors).max(), ratios.min(), ratios.max()))
+    print("    Detection:  {0:.1f} Msamples/s ({1:.1f} us per block of {2})".format(
+          blocks * len(buffer) / elapsed / 1e6, elapsed / blocks * 1e6, len(buffer)))
+
+    assert len(taps) == len(expected)
+    assert np.abs(errors).max() < 1.0
+    assert (ratios.min() > 0.7) and (ratios.max() < 1.2)
+
+    # The sensor on a thread (real time synthetic source)
+    sensor = PiezoSensor(source=SyntheticSource(realtime=True, seed=2))
+    sensor.start()
+
+    for i in range(3):
+        sensor.wait_for_tap(timeout=2.0)
+        print("    Tap:  force {0:.0f}, {1:.1f} ms".format(
+              sensor.get_tap_force(), (sensor.get_tap_release_ns() - sensor.get_tap_onset_ns()) / 1e6))
+
+    sensor.interrupt()
+
+    try:
+        sensor.wait_for_tap()
+    except INPUT_DEVICE.Interrupted:
+        pass
+
+    sensor.close()
+
+    print("Test Complete")
@@ -0,0 +1,190 @@
+"""
+--------------------------------------------------------------------------
+Pin Configuration
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Pin Configuration
+
+  Replaces configure_pins.sh.  Instead of starting one "config-pin" process
+per pin, the mux of every pin is written directly to the pinmux "state"
+file of the cape-universal overlay in one pass:
+
+    /sys/devices/platform/ocp/ocp:<PIN>_pinmux/state
+
+  The current state of every pin is read first and only the pins that are
+not already in the right mode are written, so a second run writes nothing.
+
+  The pins are listed once in the PINS table below (same pins as
+configure_pins.sh).
+
+Software API:
+
+  configure(pins=PINS, root=OCP_ROOT)
+    - Set the mux of every pin of the table
+    - Returns (changed, unchanged) lists of pin names
+    - Raises ValueError if a pin has no pinmux state file
+
+  read_states(pins=PINS, root=OCP_ROOT)
+    - Return a dict of the current mode of every pin of the table
+
+Usage:
+
+  python3 pinmux.py              - Configure the pins
+  python3 pinmux.py --test       - Run the self test on a fake sysfs tree
+
+"""
+import os
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+OCP_ROOT      = "/sys/devices/platform/ocp"
+STATE_FILE    = os.path.join("ocp:{0}_pinmux", "state")
+
+# Pin, mode, use
+PINS = (
+    ("P2_09", "i2c",  "I2C1 SCL"),
+    ("P2_11", "i2c",  "I2C1 SDA"),
+    ("P2_02", "gpio", "Button"),
+    ("P2_01", "pwm",  "Buzzer"),
+    ("P2_03", "gpio", "LED (green)"),
+    ("P2_04", "gpio", "Sensor"),
+    ("P2_06", "gpio", "LCD d4"),
+    ("P2_08", "gpio", "LCD d5"),
+    ("P2_10", "gpio", "LCD d6"),
+    ("P2_18", "gpio", "LCD d7"),
+    ("P1_02", "gpio", "LCD rs"),
+    ("P1_04", "gpio", "LCD enable"),
+)
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _state_path(root, pin):
+    """ Return the path of the pinmux state file of a pin """
+    return os.path.join(root, STATE_FILE.format(pin))
+
+# End def
+
+
+def read_states(pins=PINS, root=OCP_ROOT):
+    """ Return a dict of the current mode of every pin of the table """
+    states = {}
+
+    for (pin, mode, use) in pins:
+        try:
+            with open(_state_path(root, pin)) as state_file:
+                states[pin] = state_file.read().strip()
+        except FileNotFoundError:
+            raise ValueError("No pinmux for {0} ({1}); is cape-universal loaded?".format(pin, use))
+
+    return states
+
+# End def
+
+
+def configure(pins=PINS, root=OCP_ROOT):
+    """ Set the mux of every pin of the table
+
+        Returns (changed, unchanged) lists of pin names
+    """
+    states    = read_states(pins, root)
+    changed   = []
+    unchanged = []
+
+    for (pin, mode, use) in pins:
+        if states[pin] == mode:
+            unchanged.append(pin)
+            continue
+
+        with open(_state_path(root, pin), "w") as state_file:
+            state_file.write(mode)
+
+        changed.append(pin)
+
+    return (changed, unchanged)
+
+# End def
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+    import time
+
+    if "--test" in sys.argv:
+        print("Pin Configuration Test")
+
+        # Fake sysfs tree with every pin in the "default" mode
+        root = tempfile.mkdtemp()
+
+        for (pin, mode, use) in PINS:
+            os.makedirs(os.path.dirname(_state_path(root, pin)))
+
+            with open(_state_path(root, pin), "w") as state_file:
+                state_file.write("default\n")
+
+        (changed, unchanged) = configure(root=root)
+        assert (len(changed), len(unchanged)) == (len(PINS), 0)
+        assert read_states(root=root) == {pin: mode for (pin, mode, use) in PINS}
+
+        # Pins in the right mode are not written again
+        (changed, unchanged) = configure(root=root)
+        assert (len(changed), len(unchanged)) == (0, len(PINS))
+
+        # Missing pins are reported
+        try:
+            configure(PINS + (("P1_36", "pwm", "Missing"),), root=root)
+            assert False
+        except ValueError as error:
+            print("    {0}".format(error))
+
+        print("Test Complete")
+
+    else:
+        start = time.perf_counter()
+        (changed, unchanged) = configure()
+
+        print("Configured {0} pins ({1} already set) in {2:.1f} ms".format(
+              len(changed), len(unchanged), (time.perf_counter() - start) * 1e3))
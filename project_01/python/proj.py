@@ -40,12 +40,56 @@ Requirements:
 Uses:
   - HT16K33 display library developed in class
   - Button
-  - Buzzer
+  - Buzzer (background tone sequencer, PWM channel kept running)
   - LED
+  - Sliding window statistics (live "last 5 s" tap rate)
+  - Tap session record (columnar tap storage)
+  - Session store (every session is saved to STORE_PATH)
+  - Patient aggregates (longitudinal trends per patient)
+  - Test state machine (asyncio version of the test flow)
+  - Isolated tap capture (sensor polled in a child process)
+  - Capture critical section (no GC / page faults / preemption while 
+    collecting)
+  - Metronome (paced test, asynchrony of the taps to the clicks)
+  - Input device (shared sampling engine of the button and the sensor)
+  - Button gestures (long press aborts a test, double click shows the 
+    previous results screen again)
+  - Keypad (patient id entry)
+  - Piezo tap sensor (taps and their force from a piezo disc on an analog
+    input)
+  - Accelerometer (tremor of the wrist during the test, on I2C1)
+
+Usage:
+  python3 proj.py             - One test, page through the results
+  python3 proj.py --sessions  - Back-to-back tests, analysis of the previous
+                                test runs while the next one is collected
+  python3 proj.py --async     - One test on the asyncio state machine 
+                                (proj_fsm), driven by GPIO edge events
+  python3 proj.py --isolated  - One test with the sensor polled in a 
+                                separate process (tap_capture)
+  python3 proj.py --low-jitter - Collect the taps in a critical section
+                                (critical_section)
+  python3 proj.py --paced     - Paced test:  tap along with the metronome
+  python3 proj.py --edge      - Button and sensor on GPIO edge events (or
+                  --hub         one input hub thread) instead of polling
+  python3 proj.py --keypad    - Enter the patient id on the keypad before
+                                the test
+  python3 proj.py --piezo     - Taps from the piezo disc on the analog input
+                                (piezo) instead of the sensor
+  python3 proj.py --tremor    - Measure the tremor with the accelerometer
+                                during the test
 
 """
+import asyncio
+import concurrent.futures
+import contextlib
+import os
+import queue
+import sys
+import threading
 import time
 import math
+import traceback
 
 import Adafruit_BBIO.GPIO as GPIO
 
@@ -54,13 +98,37 @@ import button as BUTTON
 import led as LED
 import buzzer as BUZZER
 import sensor as SENSOR
+import window_stats as WINDOW_STATS
+import tap_session as TAP_SESSION
+import tap_analysis as TAP_ANALYSIS
+import session_store as SESSION_STORE
+import patient_aggregates as PATIENT_AGGREGATES
+import proj_fsm as PROJ_FSM
+import tap_capture as TAP_CAPTURE
+import critical_section as CRITICAL_SECTION
+import timer_wheel as TIMER_WHEEL
+import input_device as INPUT_DEVICE
+import gestures as GESTURES
+import keypad as KEYPAD
+import pinmux as PINMUX
+
+# metronome, piezo (numpy) and accelerometer (numpy, smbus) are imported
+# by the options that use them, so a board without numpy / smbus still
+# runs the plain test
 
 
 # ------------------------------------------------------------------------
 # Constants
 # ------------------------------------------------------------------------
 
-# None
+# Directory of the session store
+STORE_PATH = "sessions"
+
+# SCHED_FIFO priority of the collection in low jitter mode
+CAPTURE_PRIORITY = 50
+
+# Time to enter the patient id on the keypad (s)
+PATIENT_ID_TIMEOUT = 30.0
 
 # ------------------------------------------------------------------------
 # Global variables
@@ -80,23 +148,101 @@ class Proj():
     led        = None
     LCD        = None
     sensor     = None
+    live_stats = None
+    cols       = None
+    session    = None
+    store      = None
+    patient_id = None
+    aggregates = None
+    results    = None
+    delivered  = None
+    station_id = None
+    capture    = None
+    tap_source = None
+    low_jitter = None
+    gestures   = None
+    keypad     = None
+    accelerometer = None
     
     def __init__(self, reset_time=2.0, button="P2_2", rs="P1_2", enable="P1_4", d4="P2_6",
     d5 = "P2_8", d6 = "P2_10", d7 = "P2_18", cols = 16, rows = 2, led="P2_3", buzzer="P2_1",
-    sensor = "P2_4"):
+    sensor = "P2_4", live_window=5.0, store_path=None, patient_id=0, station_id=0,
+    isolated_capture=False, low_jitter=False, keypad=False, piezo=None, tremor=False):
         """ Initialize variables and set up display """
         self.reset_time = reset_time
         self.button     = BUTTON.Button(button)
         self.LCD        = LCD.LCD(rs, enable, d4, d5, d6, d7, cols, rows)
         self.led        = LED.LED(led)
-        self.buzzer     = BUZZER.Buzzer(buzzer)
+        self.buzzer     = BUZZER.BackgroundBuzzer(buzzer)
         self.sensor     = SENSOR.Sensor(sensor)
+        self.live_stats = WINDOW_STATS.SlidingWindowStats(live_window)
+        self.cols       = cols
+        self.patient_id = patient_id
+        self.station_id = station_id
+        self.low_jitter = low_jitter
+        
+        # Gestures of the button (a long press aborts the collection)
+        self.gestures    = GESTURES.GestureRecognizer(self.button, callback=self._on_gesture)
+        self._collecting = threading.Event()
+        
+        # Patient id entry
+        if keypad:
+            self.keypad = KEYPAD.Keypad()
+            self.keypad.start()
+        
+        # Tremor:  the accelerometer FIFO is drained into a ring all along,
+        # on the clock of the taps
+        if tremor:
+            import accelerometer as ACCELEROMETER
+            
+            self.accelerometer = ACCELEROMETER.Accelerometer()
+            self.accelerometer.start()
+        
+        # Taps are read from the sensor, the isolated capture process or
+        # the piezo disc on the analog pin "piezo"
+        if piezo is not None:
+            import piezo as PIEZO
+            
+            self.capture    = PIEZO.PiezoSensor(piezo)
+            self.capture.start()
+            self.tap_source = self.capture
+        elif isolated_capture:
+            self.capture    = TAP_CAPTURE.TapCapture(sensor, self.sensor.tapped_value)
+            self.capture.start()
+            self.tap_source = self.capture
+        else:
+            self.tap_source = self.sensor
+        
+        if store_path is not None:
+            self.store  = SESSION_STORE.SessionStore(store_path, 
+                                                     encoding=SESSION_STORE.ENCODING_DELTA)
+            
+            # Per patient trends, caught up with sessions stored since the
+            # last snapshot
+            self.aggregates = PATIENT_AGGREGATES.PatientAggregates.load(self._aggregates_path())
+            self.aggregates.catch_up(self.store)
         
         self._setup()
     
     # End def
     
     
+    def _aggregates_path(self):
+        """Return the path of the patient aggregates snapshot."""
+        return os.path.join(self.store.path, PATIENT_AGGREGATES.AGGREGATES_FILE)
+    
+    # End def
+    
+    
+    def close_store(self):
+        """Write the queued sessions and the patient aggregates."""
+        if self.store is not None:
+            self.store.close()
+            self.aggregates.save(self._aggregates_path())
+        
+    # End def
+    
+    
     def _setup(self):
         """Setup the hardware components."""
         # Initialize Display
@@ -108,90 +254,472 @@ class Proj():
     def run(self):
         """Execute the main program."""
         
-        # Instantiate variables
-        freq = 0
-        freq_list = []
+        # Wait for button to start test
+        self._wait_to_start()
+        self._enter_patient_id()
         
-        while(1):
-            # Wait for button to start test
-            self.LCD.message("PUSH TO START")
-            self.button.wait_for_press()
-                # start countdown
-            self.LCD.clear()
-            self.LCD.message("5")
-            time.sleep(1)
-            self.LCD.clear()
-            self.LCD.message("4")
-            time.sleep(1)
-            self.LCD.clear()
-            self.LCD.message("3")
-            time.sleep(1)
-            self.LCD.clear()
-            self.LCD.message("2")
-            time.sleep(1)
-            self.LCD.clear()
-            self.LCD.message("1")
-            time.sleep(1)
-            # LED, text, buzzer cue to start test
-            self.LCD.clear()
-            self.LCD.message("TAP NOW")
-            self.led.on()
-            self.buzzer.play(440, 1.0, True) 
-            time.sleep(1)
-            self.led.off()
+        # Countdown, collect tapping data and analyze frequencies
+        self._countdown()
+        self._cue("TAP NOW")
+        if self._collect() is None:
+            self._cue("TEST ABORTED")
+            return
+        
+        self._cue("TEST DONE")
+        
+        stats = TAP_ANALYSIS.analyze(self.session.frequencies())
+        
+        # Save the session (written in the background)
+        self._save(self.session, stats)
+        
+        # Page through the results
+        self._show_results(stats, self._tremor(self.session))
+        
+    # End def
+
+
+    def run_paced(self, rate=None):
+        """Execute a paced test:  the patient taps along with the metronome.
+        
+           rate     - Clicks per second (None for METRONOME.DEFAULT_RATE)
+        """
+        import metronome as METRONOME
+        
+        if rate is None:
+            rate = METRONOME.DEFAULT_RATE
+        
+        self._wait_to_start()
+        self._enter_patient_id()
+        self._countdown()
+        
+        # The metronome clicks on its own thread during the collection
+        metronome = METRONOME.Metronome(self.buzzer, rate)
+        
+        self.LCD.clear()
+        self.LCD.message("TAP ALONG")
+        metronome.start()
+        
+        try:
+            session = self._collect()
+        finally:
+            metronome.stop()
+        
+        if session is None:
+            self._cue("TEST ABORTED")
+            return None
+        
+        self._cue("TEST DONE")
+        
+        stats  = TAP_ANALYSIS.analyze(session.frequencies())
+        result = METRONOME.asynchrony(session.onset_ns, metronome.clicks)
+        
+        self._save(session, stats)
+        
+        # Mean and variability of the asynchrony (ms)
+        disp_text = "ASYNC {0:+.0f}ms SD{1:.0f}".format(result.mean, result.stdev)
+        self.LCD.clear()
+        self.LCD.message(disp_text[0:self.cols])
+        self.button.wait_for_press()
+        self.LCD.clear()
+        
+        return result
+        
+    # End def
+
+
+    def run_async(self, count=1):
+        """Execute the main program as an asyncio state machine.
+        
+           count    - Number of tests (None to run until interrupted)
+        """
+        asyncio.run(self._run_machine(count))
+        
+    # End def
+
+
+    async def _run_machine(self, count):
+        """Run the test state machine on the event loop."""
+        machine = PROJ_FSM.TapTestMachine(self)
+        
+        try:
+            await machine.run(count)
+        finally:
+            machine.close()
+        
+    # End def
+
+
+    def run_sessions(self, count=None, executor="thread", 
+                     analysis=TAP_ANALYSIS.analyze_release_ns):
+        """Execute back-to-back tests.
+        
+           The analysis of a session runs on a worker thread / process 
+           while the next session is collected.  Results are saved and the 
+           summary of the last session is shown on the start screen when 
+           the analysis is ready.
+           
+           count    - Number of tests (None to run until interrupted)
+           executor - "thread" or "process" worker for the analysis
+           analysis - Function of the release times (ns) returning TapStats
+                      (must be picklable for "process")
+        """
+        if executor == "process":
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+        else:
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        
+        # (session number, session, future) of analyses that are done
+        self.results   = queue.Queue()
+        self.delivered = 0
+        number         = 0
+        
+        try:
+            while (count is None) or (number < count):
+                # Deliver results while waiting for the next patient
+                self._deliver_results()
+                self.button.set_unpressed_callback(self._deliver_results)
+                self._wait_to_start()
+                self.button.set_unpressed_callback(None)
+                self._enter_patient_id()
+                
+                self._countdown()
+                self._cue("TAP NOW")
+                session = self._collect()
+                
+                if session is None:
+                    self._cue("TEST ABORTED")
+                    continue
+                
+                self._cue("TEST DONE")
+                
+                number += 1
+                future  = pool.submit(analysis, session.release_ns)
+                future.add_done_callback(
+                    lambda future, number=number, session=session: 
+                        self.results.put((number, session, future)))
+        
+        finally:
+            try:
+                # Deliver the analyses that are still running
+                while self.delivered < number:
+                    self._deliver_result(*self.results.get())
+            finally:
+                pool.shutdown()
+                self.LCD.clear()
+        
+    # End def
+
+
+    def _deliver_results(self):
+        """Deliver the analyses that are done."""
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                return
             
-            # Collect tapping data
-            session_start_time= time.time()
-            self.sensor.wait_for_tap()
-            while((time.time()-session_start_time)<10):
-                # Wait for tap
-                old_tap_time = self.sensor.get_tap_time()
-                self.sensor.wait_for_tap()
-                freq = 1/(self.sensor.get_tap_time() - old_tap_time)
-                freq_list.append(freq)
-            # End Tapping
-            # LED, text, buzzer cue to start test
-            self.LCD.clear()
-            self.LCD.message("TEST DONE")
-            self.led.on()
-            self.buzzer.play(440, 1.0, True) 
-            time.sleep(1)
-            self.led.off()
+            self._deliver_result(*result)
+        
+    # End def
+
+
+    def _deliver_result(self, number, session, future):
+        """Save an analyzed session and show its summary on the second row.
+        
+           A session with fewer than 2 taps has no interval:  its stats 
+           have a count of 0 and NaN values.  If the analysis raised (e.g.
+           a broken process pool) the session is saved with the same empty
+           stats, so its taps are kept and can be analyzed again later 
+           (reanalyze).
+        """
+        self.delivered += 1
+        
+        try:
+            stats = future.result()
+        except Exception:
+            print("Analysis of session {0} failed:".format(number))
+            traceback.print_exc()
             
-            # Analyze frequencies
-            max_freq = max(freq_list)
-            min_freq = min(freq_list)
-            mean_freq = sum(freq_list) / len(freq_list) 
-            stdev_freq = (sum([((i - mean_freq) ** 2) for i in freq_list]) / len(freq_list)) ** 0.5
+            stats = TAP_ANALYSIS.analyze([])
+        
+        self._save(session, stats)
+        
+        if stats.count == 0:
+            disp_text = "#{0} NO RESULT".format(number)
+        else:
+            disp_text = "#{0} AVG{1:.2f} SD{2:.2f}".format(number, stats.mean, stats.stdev)
+        
+        self.LCD.setCursor(0, 1)
+        self.LCD.message(disp_text[0:self.cols].ljust(self.cols))
+        
+    # End def
+
+
+    def _wait_to_start(self):
+        """Wait for the button to start a test."""
+        self.LCD.clear()
+        self.LCD.message("PUSH TO START")
+        self.button.wait_for_press()
+        
+    # End def
+
+
+    def _enter_patient_id(self):
+        """Read the patient id on the keypad (if there is one)."""
+        if self.keypad is None:
+            return
+        
+        self.LCD.clear()
+        self.LCD.message("PATIENT ID, #")
+        
+        # Keys pressed before the prompt do not count
+        while self.keypad.get(timeout=0) is not None:
+            pass
+        
+        patient_id = self.keypad.read_number(self._show_patient_id, PATIENT_ID_TIMEOUT)
+        
+        # Keep the previous patient when nothing was entered
+        if patient_id is not None:
+            self.patient_id = patient_id
+        
+    # End def
+
+
+    def _show_patient_id(self, digits):
+        """Show the digits of the patient id on the second row."""
+        self.LCD.setCursor(0, 1)
+        self.LCD.message(digits[0:self.cols].ljust(self.cols))
+        
+    # End def
+
+
+    def _countdown(self):
+        """Count down from 5 seconds."""
+        # The ticks are timers of the shared timer wheel on absolute 
+        # deadlines; this thread only waits for the end
+        wheel = TIMER_WHEEL.default_wheel()
+        done  = threading.Event()
+        
+        self._show_count(5)
+        
+        for i in range(4, 0, -1):
+            wheel.call_later(5 - i, self._show_count, i)
+        
+        wheel.call_later(5, done.set)
+        done.wait()
+        
+    # End def
+
+
+    def _show_count(self, count):
+        """Show a step of the countdown."""
+        self.LCD.clear()
+        self.LCD.message(str(count))
+        
+    # End def
+
+
+    def _cue(self, text):
+        """LED, text, buzzer cue (does not block)."""
+        self.LCD.clear()
+        self.LCD.message(text)
+        
+        # The LED (timer wheel) and the tone play in the background, so
+        # the collection starts with the cue
+        self.led.flash(1.0)
+        self.buzzer.play(440, 1.0, True) 
+        
+    # End def
+
+
+    def _collect(self):
+        """Collect the taps of one test and return the session.
+        
+           Returns None if the test was aborted (long press)
+        """
+        self.live_stats.reset()
+        self.session = TAP_SESSION.TapSession()
+        
+        # Taps captured before the test do not count (the taps made
+        # during the test are queued, e.g. while the LCD is written)
+        self.tap_source.discard()
+        
+        self.tap_source.clear_interrupt()
+        self._collecting.set()
+        
+        try:
+            with self._critical_section():
+                self._collect_taps()
+        except INPUT_DEVICE.Interrupted:
+            return None
+        finally:
+            self._collecting.clear()
+        
+        return self.session
+        
+    # End def
+
+
+    def _on_gesture(self, gesture):
+        """Abort the collection on a long press (event / wheel thread)."""
+        if (gesture.kind == GESTURES.LONG_PRESS) and self._collecting.is_set():
+            self.tap_source.interrupt()
+        
+    # End def
+
+
+    def _critical_section(self):
+        """Return the context of the collection window."""
+        if not self.low_jitter:
+            return contextlib.nullcontext()
+        
+        return CRITICAL_SECTION.CriticalSection(self.session, lock_memory=True,
+                                                priority=CAPTURE_PRIORITY)
+        
+    # End def
+
+
+    def _collect_taps(self):
+        """Record taps for 10 seconds after the first tap."""
+        session_start_time= time.time()
+        self.tap_source.wait_for_tap()
+        self._record_tap(TAP_SESSION.FLAG_FIRST)
+        while((time.time()-session_start_time)<10):
+            # Wait for tap
+            old_tap_ns = self.tap_source.get_tap_release_ns()
+            self.tap_source.wait_for_tap()
+            tap_ns = self.tap_source.get_tap_release_ns()
+            freq = 1e9/(tap_ns - old_tap_ns)
             
-            # End tapping
-            self.LCD.clear()
-            self.LCD.message("TEST DONE")
-            self.LCD.clear()
-            self.LCD.message("PUSH FOR AVG,SD")
+            if (time.time()-session_start_time) < 10:
+                self._record_tap()
+            else:
+                self._record_tap(TAP_SESSION.FLAG_LATE)
             
-            # Display mean & stdev
-            self.button.wait_for_press()
-            disp_text = "AVG-" + str(mean_freq)[0:4] + " STD-" + str(stdev_freq)[0:3]
+            # Show the statistics of the last "live_window" seconds
+            self.live_stats.add(freq, tap_ns / 1e9)
+            self._show_live_stats()
+        # End Tapping
+        
+    # End def
+
+
+    def _save(self, session, stats):
+        """Save a session to the store and update the patient aggregates.
+        
+           Returns the session id (None if there is no store)
+        """
+        if self.store is None:
+            return None
+        
+        session_id = self.store.append(session, stats, self.patient_id)
+        self.aggregates.update(session_id, self.patient_id, 
+                               session.start_time, stats)
+        
+        return session_id
+        
+    # End def
+
+
+    def _tremor(self, session):
+        """Return the tremor during the taps of a session (None without 
+           accelerometer)."""
+        if (self.accelerometer is None) or (len(session) == 0):
+            return None
+        
+        return self.accelerometer.tremor(session.onset_ns[0], session.release_ns[-1])
+        
+    # End def
+
+
+    def _show_results(self, stats, tremor=None):
+        """Page through the results with button gestures.
+        
+           A click shows the next screen, a double click shows the previous
+           screen again and a long press ends.
+        """
+        pages = ["PUSH FOR AVG,SD",
+                 "AVG-" + str(stats.mean)[0:4] + " STD-" + str(stats.stdev)[0:3],
+                 "PUSH FOR MAX,MIN",
+                 "MIN-" + str(stats.minimum)[0:4] + " MAX-" + str(stats.maximum)[0:3]]
+        
+        if tremor is not None:
+            pages += ["PUSH FOR TREMOR",
+                      "{0:.1f}Hz {1:.0f}mg RMS".format(tremor.frequency, tremor.rms * 1e3)]
+        
+        page  = 0
+        
+        # Presses from before the results do not count
+        self.gestures.clear()
+        
+        while page < len(pages):
             self.LCD.clear()
-            self.LCD.message(disp_text)
+            self.LCD.message(pages[page])
             
-            # Display min & max
-            self.button.wait_for_press()
-            self.LCD.clear()
-            self.LCD.message("PUSH FOR MAX,MIN")
-            self.button.wait_for_press()
-            disp_text = "MIN-" + str(min_freq)[0:4] + " MAX-" + str(max_freq)[0:3]
-            self.LCD.clear()
-            self.LCD.message(disp_text)
+            gesture = self.gestures.get()
             
-            # END
-            self.button.wait_for_press()
-            self.LCD.clear()
-            self.LCD.message("COMPLETE")
-            time.sleep(1)
-            self.LCD.clear()
-            break
+            if gesture.kind == GESTURES.CLICK:
+                page += 1
+            elif gesture.kind == GESTURES.DOUBLE_CLICK:
+                page  = max(0, page - 1)
+            elif gesture.kind == GESTURES.LONG_PRESS:
+                break
+        
+        # END
+        self.LCD.clear()
+        self.LCD.message("COMPLETE")
+        time.sleep(1)
+        self.LCD.clear()
+        
+    # End def
+
+
+    def _record_tap(self, flags=TAP_SESSION.FLAG_NONE):
+        """Add the last tap of the sensor to the session."""
+        self.session.append(self.tap_source.get_tap_onset_ns(), 
+                            self.tap_source.get_tap_release_ns(), self.station_id, flags)
+        
+    # End def
+
+
+    def _show_live_stats(self):
+        """Show the live mean, min and max frequency on the second row."""
+        mean_freq = self.live_stats.mean()
+        
+        if mean_freq is None:
+            return
+        
+        disp_text = "{0:.1f}Hz {1:.1f}-{2:.1f}".format(mean_freq, 
+                                                      self.live_stats.minimum(), 
+                                                      self.live_stats.maximum())
+        
+        # Pad to the full row so old characters are overwritten
+        self.LCD.setCursor(0, 1)
+        self.LCD.message(disp_text[0:self.cols].ljust(self.cols))
+        
+    # End def
+
+
+    def reset(self):
+        """Reset the outputs and the input queues, e.g. before a test that
+           failed is run again (the store is kept)."""
+        self._collecting.clear()
+        
+        # A failed test may have left the cues on
+        self.buzzer.stop()
+        self.led.off()
+        self.LCD.stopFlash()
+        self.LCD.clear()
+        
+        # Interrupts, taps, gestures and keys of the failed test
+        self.tap_source.clear_interrupt()
+        self.tap_source.discard()
+        self.gestures.clear()
+        
+        if self.keypad is not None:
+            while self.keypad.get(timeout=0) is not None:
+                pass
+        
     # End def
 
 
@@ -200,6 +728,24 @@ class Proj():
         
         self.LCD.clear()
         self.LCD.message("DEAD")
+        self.buzzer.cleanup()
+        self.gestures.close()
+        
+        if self.keypad is not None:
+            self.keypad.cleanup()
+        
+        if self.accelerometer is not None:
+            self.accelerometer.cleanup()
+        
+        self.button.cleanup()
+        self.sensor.cleanup()
+        
+        # Write the sessions that are still queued
+        self.close_store()
+        
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
         
     # End def
 
@@ -215,15 +761,51 @@ if __name__ == '__main__':
 
     print("Program Start")
 
+    # Sampling engine of the button and the sensor
+    if "--edge" in sys.argv:
+        INPUT_DEVICE.set_default_engine(INPUT_DEVICE.EDGE)
+    elif "--hub" in sys.argv:
+        INPUT_DEVICE.set_default_engine(INPUT_DEVICE.HUB, INPUT_DEVICE.InputHub())
+
+    # Pull ups of the keypad columns
+    if "--keypad" in sys.argv:
+        PINMUX.configure(KEYPAD.KEYPAD_PINS)
+
+    # Analog pin of the piezo disc
+    piezo = None
+    
+    if "--piezo" in sys.argv:
+        import piezo as PIEZO
+        
+        piezo = PIEZO.ANALOG_PIN
+
     # Create instantiation of the program
-    proj = Proj()
+    proj = Proj(store_path=STORE_PATH, isolated_capture=("--isolated" in sys.argv),
+                low_jitter=("--low-jitter" in sys.argv), keypad=("--keypad" in sys.argv),
+                piezo=piezo,
+                tremor=("--tremor" in sys.argv))
     
     try:
         # Run
-        proj.run()
+        if "--sessions" in sys.argv:
+            proj.run_sessions()
+        elif "--paced" in sys.argv:
+            proj.run_paced()
+        elif "--async" in sys.argv:
+            proj.run_async()
+        else:
+            proj.run()
 
     except KeyboardInterrupt:
         # Clean up hardware when exiting
         proj.cleanup()
 
-    print("Program Complete")
\ No newline at end of file
+    finally:
+        # Make sure the last session is on disk
+        proj.close_store()
+        
+        # Stop the capture process
+        if proj.capture is not None:
+            proj.capture.close()
+
+        print("Program Complete")
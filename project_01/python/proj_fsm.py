@@ -0,0 +1,324 @@
+"""
+--------------------------------------------------------------------------
+TapFreq Test State Machine
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+TapFreq Test State Machine
+
+  The test flow of Proj.run as an explicit state machine on asyncio:
+
+    IDLE       - "PUSH TO START", wait for a button press
+    COUNTDOWN  - 5 ... 1, one second per step on absolute deadlines
+    COLLECT    - "TAP NOW" cue, record taps until the window deadline
+    ANALYZE    - "TEST DONE" cue, compute and save the statistics
+    RESULTS    - Page through the results with button presses
+    COMPLETE   - "COMPLETE", then back to IDLE (or stop)
+
+  Every state is a coroutine that returns the next state.  The collection
+window ends exactly on its deadline (the wait for the next tap is cancelled
+instead of overrunning the window) and the LED / buzzer cues run as tasks
+so they never delay tap timestamps.  While waiting, the loop sleeps in
+epoll and uses no CPU.
+
+Software API:
+
+  TapTestMachine(proj, window=10.0, show_results=True)
+    - Provide the Proj whose hardware is used
+    - show_results=False skips the RESULTS pages and leaves a one line
+      summary on the display (e.g. when the results are fetched remotely)
+    - Must be created from within the event loop
+
+    await run(count=1, start=IDLE)
+      - Run count tests (None to run until cancelled)
+      - start=COUNTDOWN starts the first test without a button press
+
+    state
+      - Current state
+
+    last_stats / last_session_id / last_patient_id / last_start_time
+      - TapStats / store session id / patient id / start time of the last
+        test (kept when the next test starts)
+
+"""
+import asyncio
+
+import aio_devices as AIO_DEVICES
+import tap_analysis as TAP_ANALYSIS
+import tap_session as TAP_SESSION
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+# States
+IDLE          = "IDLE"
+COUNTDOWN     = "COUNTDOWN"
+COLLECT       = "COLLECT"
+ANALYZE       = "ANALYZE"
+RESULTS       = "RESULTS"
+COMPLETE      = "COMPLETE"
+STOPPED       = "STOPPED"
+
+CUE_FREQUENCY = 440
+CUE_LENGTH    = 1.0
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class TapTestMachine():
+    """ TapFreq Test State Machine Class """
+    proj           = None
+    window         = None
+
+    show_results   = None
+
+    state          = None
+    session        = None
+    last_stats     = None
+    last_session_id = None
+    last_patient_id = None
+    last_start_time = None
+
+    button         = None
+    sensor         = None
+    lcd            = None
+    led            = None
+    buzzer         = None
+
+    def __init__(self, proj, window=10.0, show_results=True):
+        """ Wrap the hardware of a Proj """
+        self.proj         = proj
+        self.window       = window
+        self.show_results = show_results
+        self.state      = IDLE
+        self._remaining = None
+
+        self.button     = AIO_DEVICES.AsyncButton(proj.button)
+        self.sensor     = AIO_DEVICES.AsyncSensor(proj.sensor)
+        self.lcd        = AIO_DEVICES.AsyncLCD(proj.LCD, proj.cols)
+        self.led        = AIO_DEVICES.AsyncLED(proj.led)
+        self.buzzer     = AIO_DEVICES.AsyncBuzzer(proj.buzzer)
+
+        self._cues      = set()
+        self._states    = {
+            IDLE      : self._idle,
+            COUNTDOWN : self._countdown,
+            COLLECT   : self._collect,
+            ANALYZE   : self._analyze,
+            RESULTS   : self._results,
+            COMPLETE  : self._complete,
+        }
+
+    # End def
+
+
+    async def run(self, count=1, start=IDLE):
+        """ Run count tests (None to run until cancelled) """
+        self._remaining = count
+        self.state      = start
+
+        try:
+            while self.state != STOPPED:
+                self.state = await self._states[self.state]()
+        finally:
+            # Do not leave the LED / buzzer on if cancelled during a cue
+            for cue in list(self._cues):
+                cue.cancel()
+
+            self.state = IDLE
+
+    # End def
+
+
+    def _cue(self):
+        """ Start the LED and buzzer cue without waiting for it """
+        for coroutine in (self.led.flash(CUE_LENGTH),
+                          self.buzzer.play(CUE_FREQUENCY, CUE_LENGTH)):
+            task = asyncio.ensure_future(coroutine)
+            self._cues.add(task)
+            task.add_done_callback(self._cues.discard)
+
+    # End def
+
+
+    async def _idle(self):
+        """ Wait for the button to start a test """
+        await self.lcd.message("PUSH TO START")
+        await self.button.press()
+
+        return COUNTDOWN
+
+    # End def
+
+
+    async def _countdown(self):
+        """ Count down 5 seconds on absolute deadlines """
+        loop     = asyncio.get_running_loop()
+        deadline = loop.time()
+
+        for i in range(5, 0, -1):
+            await self.lcd.message(str(i))
+
+            deadline += 1.0
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+        return COLLECT
+
+    # End def
+
+
+    async def _collect(self):
+        """ Record taps until the end of the collection window """
+        loop         = asyncio.get_running_loop()
+        self.session = TAP_SESSION.TapSession()
+        self.proj.live_stats.reset()
+
+        await self.lcd.message("TAP NOW")
+        self._cue()
+
+        deadline     = loop.time() + self.window
+        flags        = TAP_SESSION.FLAG_FIRST
+        last_ns      = None
+
+        while True:
+            remaining = deadline - loop.time()
+
+            if remaining <= 0:
+                break
+
+            try:
+                (onset_ns, release_ns) = await asyncio.wait_for(self.sensor.tap(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+            self.session.append(onset_ns, release_ns, self.proj.station_id, flags)
+            flags = TAP_SESSION.FLAG_NONE
+
+            if last_ns is not None:
+                self.proj.live_stats.add(1e9 / (release_ns - last_ns), release_ns / 1e9)
+                await self._show_live_stats()
+
+            last_ns = release_ns
+
+        return ANALYZE
+
+    # End def
+
+
+    async def _show_live_stats(self):
+        """ Show the live mean, min and max frequency on the second row """
+        stats = self.proj.live_stats
+
+        await self.lcd.show(1, "{0:.1f}Hz {1:.1f}-{2:.1f}".format(stats.mean(), stats.minimum(),
+                                                                  stats.maximum()))
+
+    # End def
+
+
+    async def _analyze(self):
+        """ Compute and save the statistics of the session """
+        await self.lcd.message("TEST DONE")
+        self._cue()
+
+        self.last_stats      = TAP_ANALYSIS.analyze(self.session.frequencies())
+        self.last_session_id = self.proj._save(self.session, self.last_stats)
+        self.last_patient_id = self.proj.patient_id
+        self.last_start_time = self.session.start_time
+
+        # Let the cue finish before the results
+        await asyncio.sleep(CUE_LENGTH)
+
+        if self.show_results:
+            return RESULTS
+
+        return COMPLETE
+
+    # End def
+
+
+    async def _results(self):
+        """ Page through the results with button presses """
+        stats = self.last_stats
+
+        await self.lcd.message("PUSH FOR AVG,SD")
+        await self.button.press()
+        await self.lcd.message("AVG-" + str(stats.mean)[0:4] + " STD-" + str(stats.stdev)[0:3])
+
+        await self.button.press()
+        await self.lcd.message("PUSH FOR MAX,MIN")
+        await self.button.press()
+        await self.lcd.message("MIN-" + str(stats.minimum)[0:4] + " MAX-" + str(stats.maximum)[0:3])
+
+        await self.button.press()
+
+        return COMPLETE
+
+    # End def
+
+
+    async def _complete(self):
+        """ Finish the test """
+        await self.lcd.message("COMPLETE")
+
+        if self.show_results:
+            await asyncio.sleep(1.0)
+            await self.lcd.clear()
+        else:
+            stats = self.last_stats
+            await self.lcd.show(1, "AVG-" + str(stats.mean)[0:4] + " STD-" + str(stats.stdev)[0:3])
+
+        if self._remaining is not None:
+            self._remaining -= 1
+
+            if self._remaining <= 0:
+                return STOPPED
+
+        return IDLE
+
+    # End def
+
+
+    def close(self):
+        """ Stop the LCD thread (the edge detection stops with the cleanup
+            of the button and the sensor)
+        """
+        self.lcd.close()
+
+    # End def
+
+# End class
@@ -0,0 +1,236 @@
+"""
+--------------------------------------------------------------------------
+Batch Re-analysis
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Batch Re-analysis
+
+  Recomputes the statistics of every session of a SessionStore (e.g. after
+changing an analysis parameter) with the same math as Proj.run
+(tap_analysis.analyze_release_ns).
+
+  The index of the store is split into chunks of sessions that are analyzed
+by a ProcessPoolExecutor with one worker per core.  Each worker maps the
+data file of the store read-only once and decodes its sessions from the map,
+so only the index entries and the results cross process boundaries.  At most
+two chunks per worker are in flight and results are written to the CSV file
+as chunks complete, so memory does not grow with the size of the store.
+
+  The store is only read; it can be re-analyzed while Proj is writing to it
+(sessions written after the start are not included).
+
+Usage:
+
+  python3 reanalyze.py STORE OUTPUT.csv [--workers N] [--chunk-size N]
+                       [--exclude-late] [--max-freq HZ]
+
+  python3 reanalyze.py STORE --scaling
+    - Analyze the store with 1, 2, 4, ... workers and report sessions/s
+
+"""
+import argparse
+import concurrent.futures
+import csv
+import mmap
+import os
+import sys
+import time
+
+import session_store as SESSION_STORE
+import tap_analysis as TAP_ANALYSIS
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+CSV_HEADER      = ["session_id", "patient_id", "start_time",
+                   "count", "mean", "stdev", "minimum", "maximum"]
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# Read-only map of the data file in each worker process
+data_map        = None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _open_worker(path):
+    """ Map the data file of the store (worker process initializer) """
+    global data_map
+
+    with open(os.path.join(path, SESSION_STORE.DATA_FILE), "rb") as data_file:
+        # An empty file cannot be mapped (and has no sessions)
+        if os.fstat(data_file.fileno()).st_size == 0:
+            data_map = None
+            return
+
+        data_map = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+# End def
+
+
+def analyze_chunk(entries, include_late=True, max_freq=None):
+    """ Return the result rows of a chunk of index entries (worker process) """
+    rows = []
+
+    for entry in entries:
+        stored = SESSION_STORE.decode_record(data_map, entry.offset)
+        stats  = TAP_ANALYSIS.analyze_release_ns(stored.release_ns, stored.flags,
+                                                 include_late, max_freq)
+
+        rows.append((entry.session_id, entry.patient_id, entry.start_time) + tuple(stats))
+
+        # Release the views of the map
+        del stored
+
+    return rows
+
+# End def
+
+
+def chunks(entries, chunk_size):
+    """ Yield the entries in lists of chunk_size """
+    for start in range(0, len(entries), chunk_size):
+        yield entries[start:start + chunk_size]
+
+# End def
+
+
+def reanalyze(path, writer=None, workers=None, chunk_size=64, include_late=True, max_freq=None):
+    """ Re-analyze every session of the store at path
+
+        path         - Directory of the SessionStore
+        writer       - csv.writer for the result rows (None to discard them)
+        workers      - Number of worker processes (default one per core)
+
+        Returns the number of sessions analyzed
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # Validated like the recovery of the store, without opening it for
+    # writing:  no entry points past a torn end of the data file
+    entries = SESSION_STORE.read_entries(path)
+
+    if not entries:
+        return 0
+
+    count     = 0
+    in_flight = set()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_open_worker,
+                                                initargs=(path,)) as executor:
+        for chunk in chunks(entries, chunk_size):
+            # Bound the number of chunks in flight
+            if len(in_flight) >= 2 * workers:
+                (done, in_flight) = concurrent.futures.wait(
+                    in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                count += _write(done, writer)
+
+            in_flight.add(executor.submit(analyze_chunk, chunk, include_late, max_freq))
+
+        count += _write(in_flight, writer)
+
+    return count
+
+# End def
+
+
+def _write(futures, writer):
+    """ Write the rows of finished futures and return the number of rows """
+    count = 0
+
+    for future in futures:
+        rows   = future.result()
+        count += len(rows)
+
+        if writer is not None:
+            writer.writerows(rows)
+
+    return count
+
+# End def
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Re-analyze stored TapFreq sessions")
+    parser.add_argument("store", help="Directory of the session store")
+    parser.add_argument("output", nargs="?", help="CSV file of the results")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: one per core)")
+    parser.add_argument("--chunk-size", type=int, default=64,
+                        help="Sessions per task")
+    parser.add_argument("--exclude-late", action="store_true",
+                        help="Skip taps released after the collection window")
+    parser.add_argument("--max-freq", type=float, default=None,
+                        help="Skip tap frequencies above this value (Hz)")
+    parser.add_argument("--scaling", action="store_true",
+                        help="Report sessions/s for 1, 2, 4, ... workers")
+    args = parser.parse_args()
+
+    if args.scaling:
+        workers = 1
+
+        while workers <= (os.cpu_count() or 1):
+            start   = time.perf_counter()
+            count   = reanalyze(args.store, None, workers, args.chunk_size,
+                                not args.exclude_late, args.max_freq)
+            elapsed = time.perf_counter() - start
+
+            print("{0:3d} workers: {1:.0f} sessions/s".format(workers, count / elapsed))
+            workers *= 2
+
+    elif args.output is None:
+        parser.error("the output CSV file is required")
+
+    else:
+        start = time.perf_counter()
+
+        with open(args.output, "w", newline="") as output:
+            writer = csv.writer(output)
+            writer.writerow(CSV_HEADER)
+
+            count = reanalyze(args.store, writer, args.workers, args.chunk_size,
+                              not args.exclude_late, args.max_freq)
+
+        elapsed = time.perf_counter() - start
+
+        print("{0} sessions in {1:.2f} s ({2:.0f} sessions/s)".format(
+              count, elapsed, count / elapsed if elapsed else 0.0), file=sys.stderr)
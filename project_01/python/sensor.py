@@ -44,15 +44,24 @@ sensor is not tapped) and will be connected to power when the sensor is tapped
   To select the pull up configuration, tap_low=True.  To select the pull down
 configuration, tap_low=False.
 
+  The sensor is an input_device.InputDevice:  the pin is sampled by the
+engine of the device (polled every "sleep_time", GPIO edge events or an
+input hub, see input_device) and the callback functions are run by it.
+
 
 Software API:
 
-  Sensor(pin, tap_low)
+  Sensor(pin, tap_low, sleep_time=0.1, dispatcher=None, engine=None, hub=None)
     - Provide pin that the sensor monitors
+    - engine:  input_device.POLL / EDGE / HUB (None for the default engine)
     
     wait_for_tap()
       - Wait for the sensor to be tapped 
       - Function consumes time
+      - With EDGE / HUB a tap made since the last wait counts
+
+    discard()
+      - Drop the taps queued before the test starts
         
     is_tapped()
       - Return a boolean value (i.e. True/False) on if sensor is tapped
@@ -61,8 +70,17 @@ Software API:
     get_tap_time
       - Return the time the sensor was last tapped
 
+    get_tap_onset_ns() / get_tap_release_ns()
+      - Return the time.monotonic_ns() when the sensor was last tapped / released
+
     cleanup()
       - Clean up HW
+
+    set_dispatcher(dispatcher)
+      - Run the callback functions on a callback_dispatch.CallbackDispatcher
+        (worker thread / event loop) instead of inside the polling loops, so
+        a slow callback does not delay the next edge (None to run them
+        inline)
       
     Callback Functions:
       These functions will be called at the various times during a sensor 
@@ -89,6 +107,8 @@ import time
 
 import Adafruit_BBIO.GPIO as GPIO
 
+import input_device as INPUT_DEVICE
+
 # ------------------------------------------------------------------------
 # Constants
 # ------------------------------------------------------------------------
@@ -106,15 +126,14 @@ LOW           = GPIO.LOW
 # Functions / Classes
 # ------------------------------------------------------------------------
 
-class Sensor():
+class Sensor(INPUT_DEVICE.InputDevice):
     """ Sensor Class """
-    pin                           = None
-    
     untapped_value               = None
     tapped_value                 = None
     
-    sleep_time                    = None
     tap_time                      = None
+    tap_onset_ns                  = None
+    tap_release_ns                = None
 
     tapped_callback              = None
     tapped_callback_value        = None
@@ -125,40 +144,22 @@ class Sensor():
     on_release_callback           = None
     on_release_callback_value     = None
     
+    # (while active, while inactive, on activation, on release)
+    CALLBACKS                     = ("tapped_callback", "untapped_callback",
+                                     "on_tap_callback", "on_release_callback")
     
-    def __init__(self, pin=None, tap_low=True, sleep_time=0.1):
+    
+    def __init__(self, pin=None, tap_low=True, sleep_time=0.1, dispatcher=None,
+                 engine=None, hub=None):
         """ Initialize variables and set up the sensor """
-        if (pin == None):
-            raise ValueError("Pin not provided for Sensor()")
-        else:
-            self.pin = pin
-        
         # For pull up resistor configuration:    tap_low = True
         # For pull down resistor configuration:  tap_low = False
-        if tap_low:
-            self.untapped_value = HIGH
-            self.tapped_value   = LOW
-        else:
-            self.untapped_value = LOW
-            self.tapped_value   = HIGH
+        INPUT_DEVICE.InputDevice.__init__(self, pin, tap_low, sleep_time, dispatcher,
+                                          engine, hub)
         
-        # By default sleep time is "0.1" seconds
-        self.sleep_time      = sleep_time
-        self.tap_duration  = 0.0        
-
-        # Initialize the hardware components        
-        self._setup()
-    
-    # End def
-    
+        self.untapped_value = self.inactive_value
+        self.tapped_value   = self.active_value
     
-    def _setup(self):
-        """ Setup the hardware components. """
-        # Initialize sensor
-        # Set up the sensor
-        GPIO.setup(self.pin, GPIO.IN )
-        pass
-
     # End def
 
 
@@ -168,9 +169,7 @@ class Sensor():
            Returns:  True  - Sensor is tapped
                      False - Sensor is not tapped
         """
-        #   Compare input value of the GPIO pin of the sensor (i.e. self.pin) to the "tapped value" of the class 
-        
-        return GPIO.input(self.pin)==self.tapped_value;
+        return self.is_active()
 
     # End def
 
@@ -187,51 +186,25 @@ class Sensor():
            Arguments:  None
            Returns:    None
         """
-        tap_time = None
-        
-        # Wait for sensor tap
-        #   Execute the untapped callback function based on the sleep time
-        #   Update while loop condition to compare the input value of the  
-        #   GPIO pin of the sensor (i.e. self.pin) to the "untapped value" 
-        #   of the class (i.e. we are executing the while loop while the 
-        #   sensor is not being tapped)
-        #
-        while(GPIO.input(self.pin)==self.untapped_value):
+        self.wait_for_cycle()
         
-            if self.untapped_callback is not None:
-                self.untapped_callback_value = self.untapped_callback()
-            
-            time.sleep(self.sleep_time)
-            
+    # End def
 
-        
-        # Executed the on tap callback function
-        if self.on_tap_callback is not None:
-            self.on_tap_callback_value = self.on_tap_callback()
-        
-        # Wait for sensor release
-        #   Execute the tapped callback function based on the sleep time
-        #
-        # HW#4 TODO: (one line of code)
-        #   When the input value of the GPIO pin of the sensor (self.pin) equals the "tapped value" 
-        #   of the class (i.e. while the sensor is being tapped), update the tap time
-
-        while(GPIO.input(self.pin)==self.tapped_value):
-        
-            if self.tapped_callback is not None:
-                self.tapped_callback_value = self.tapped_callback()
-                
-            time.sleep(self.sleep_time)
-        
-        # Record the tap time
-        self.tap_time = time.time()
 
-        # Executed the on release callback function
-        if self.on_release_callback is not None:
-            self.on_release_callback_value = self.on_release_callback()        
-        
+    def _on_active(self, timestamp_ns):
+        """ Record the onset time (before the on tap callback) """
+        self.tap_onset_ns = timestamp_ns
+    
     # End def
 
+
+    def _on_inactive(self, timestamp_ns):
+        """ Record the tap time (before the on release callback) """
+        self.tap_release_ns = timestamp_ns
+        self.tap_time       = time.time()
+    
+    # End def
+    
     
     def get_tap_time(self):
         """ Return the most recent tap time """
@@ -240,10 +213,16 @@ class Sensor():
     # End def
     
     
-    def cleanup(self):
-        """ Clean up the sensor hardware. """
-        # Nothing to do for GPIO
-        pass
+    def get_tap_onset_ns(self):
+        """ Return the monotonic time (ns) of the most recent tap onset """
+        return self.tap_onset_ns
+    
+    # End def
+    
+    
+    def get_tap_release_ns(self):
+        """ Return the monotonic time (ns) of the most recent tap release """
+        return self.tap_release_ns
     
     # End def
     
@@ -0,0 +1,720 @@
+"""
+--------------------------------------------------------------------------
+Session Store
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Session Store
+
+  Append-only on-disk store of TapFreq test sessions.  A store is a directory
+with two files:
+
+    sessions.dat  - One record per session:
+                      header   - magic, payload length, CRC32 of the payload
+                      payload  - session id, patient id, start time, stats
+                                 and the tap columns of the TapSession
+    sessions.idx  - One fixed size entry per record:
+                      session id, patient id, start time, offset, length
+
+  Records are written by a background thread so that append() never waits
+on the disk.  The data file is fsync'ed once per batch of records (or once
+per "sync_interval" seconds) and only then are the index entries of the
+batch written and fsync'ed, so the index never points at data that is not
+on disk.  When a store is opened, records after the last index entry are
+verified with their checksum and indexed, and a torn record at the end of
+the data file is truncated.
+
+  Sessions are looked up by session id, patient id or start time in
+O(log n) using sorted in-memory views of the index, and are read through an
+mmap of the data file so the tap columns are not copied.
+
+Software API:
+
+  SessionStore(path, sync_batch=32, sync_interval=1.0, encoding=ENCODING_RAW)
+    - Provide the directory of the store (created if needed)
+    - Tap timestamps are written raw (ENCODING_RAW) or delta / varint
+      compressed with tap_codec (ENCODING_DELTA)
+
+    append(session, stats, patient_id=0)
+      - Queue a TapSession and its TapStats to be written
+      - Returns the session id
+
+    flush()
+      - Wait until every queued session is written and on disk
+
+      If the writer thread fails (e.g. disk full), the sessions queued from
+      then on are lost and append() / flush() / close() raise its error.
+
+    get(session_id)
+      - Return the StoredSession with the session id (None if not found)
+
+    read(entry) / read_stats(entry)
+      - Return the StoredSession / TapStats of an index entry
+
+    find_patient(patient_id)
+      - Return the index entries of a patient ordered by session id
+
+    find_time(start, end)
+      - Return the index entries with start <= start_time < end
+
+    entries()
+      - Return all index entries ordered by session id
+
+    close()
+      - Write the queued sessions and close the files
+
+  read_entries(path)
+    - Return the valid index entries of the store at path, with the same
+      checks as the recovery of SessionStore, without changing its files
+      (e.g. for readers in other processes)
+
+"""
+import bisect
+import collections
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import tap_analysis as TAP_ANALYSIS
+import tap_codec as TAP_CODEC
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+DATA_FILE      = "sessions.dat"
+INDEX_FILE     = "sessions.idx"
+
+MAGIC          = b"TAPS"
+
+# Record header:  magic, payload length, CRC32 of payload
+HEADER         = struct.Struct("<4sII")
+
+# Payload header: session id, patient id, start time, encoding, tap count,
+#                 stats (count, mean, stdev, minimum, maximum)
+PAYLOAD        = struct.Struct("<QQdBIIdddd")
+
+# Index entry:    session id, patient id, start time, offset, length
+INDEX_ENTRY    = struct.Struct("<QQdQI")
+
+# Encoding of the tap columns
+ENCODING_RAW   = 0                # int64 arrays (read without copy)
+ENCODING_DELTA = 1                # tap_codec blocks (length prefixed)
+
+# Length of an encoded column
+COLUMN_LENGTH  = struct.Struct("<I")
+
+# Writer thread wake up without a queued item
+TIMEOUT        = object()
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+IndexEntry    = collections.namedtuple("IndexEntry",
+                                       ["session_id", "patient_id", "start_time", "offset", "length"])
+
+StoredSession = collections.namedtuple("StoredSession",
+                                       ["session_id", "patient_id", "start_time", "stats",
+                                        "onset_ns", "release_ns", "sensor_id", "flags"])
+
+
+def _encode_column(column, encoding):
+    """ Return the bytes of a timestamp column """
+    if encoding == ENCODING_RAW:
+        return column.tobytes()
+
+    encoded = TAP_CODEC.encode(column, compress=True)
+
+    return COLUMN_LENGTH.pack(len(encoded)) + encoded
+
+# End def
+
+
+def encode_record(session_id, patient_id, session, stats, encoding=ENCODING_RAW):
+    """ Return the bytes of the record of a session """
+    count   = len(session)
+    payload = b"".join((PAYLOAD.pack(session_id, patient_id, session.start_time,
+                                     encoding, count, *stats),
+                        _encode_column(session.onset_ns, encoding),
+                        _encode_column(session.release_ns, encoding),
+                        session.sensor_id.tobytes(),
+                        session.flags.tobytes()))
+
+    return HEADER.pack(MAGIC, len(payload), zlib.crc32(payload)) + payload
+
+# End def
+
+
+def decode_record(buffer, offset):
+    """ Return the StoredSession of the record at offset of buffer.
+
+        The tap columns of ENCODING_RAW records are memoryviews of buffer
+        (no copy), the timestamps of ENCODING_DELTA records are decoded into
+        arrays.
+    """
+    view = memoryview(buffer)[offset + HEADER.size:]
+
+    (session_id, patient_id, start_time, encoding, count,
+     *stats) = PAYLOAD.unpack_from(view)
+
+    start      = PAYLOAD.size
+
+    if encoding == ENCODING_RAW:
+        onset_ns   = view[start:start + 8 * count].cast("q")
+        start     += 8 * count
+        release_ns = view[start:start + 8 * count].cast("q")
+        start     += 8 * count
+    elif encoding == ENCODING_DELTA:
+        columns = []
+
+        for i in range(2):
+            (length,) = COLUMN_LENGTH.unpack_from(view, start)
+            start    += COLUMN_LENGTH.size
+            columns.append(TAP_CODEC.decode(view[start:start + length]))
+            start    += length
+
+        (onset_ns, release_ns) = columns
+    else:
+        raise ValueError("Unknown encoding {0} for session {1}".format(encoding, session_id))
+
+    sensor_id  = view[start:start + count]
+    start     += count
+    flags      = view[start:start + count]
+
+    return StoredSession(session_id, patient_id, start_time, TAP_ANALYSIS.TapStats(*stats),
+                         onset_ns, release_ns, sensor_id, flags)
+
+# End def
+
+
+def check_record(buffer, offset, end):
+    """ Return the length of the valid record at offset (None if not valid) """
+    if offset + HEADER.size > end:
+        return None
+
+    (magic, length, crc) = HEADER.unpack_from(buffer, offset)
+
+    if (magic != MAGIC) or (offset + HEADER.size + length > end):
+        return None
+
+    start = offset + HEADER.size
+
+    if zlib.crc32(buffer[start:start + length]) != crc:
+        return None
+
+    return HEADER.size + length
+
+# End def
+
+
+def _scan(data_path, data_size, raw):
+    """ Validate the index of a store against its data file
+
+        raw - Content of the index file
+
+        Returns (entries, missing, data_end):  the index entries within the
+        data, the entries of the valid records after them that are not
+        indexed and the end of the valid data
+    """
+    # Drop a torn index entry and entries past the end of the data
+    entries   = []
+    data_end  = 0
+
+    for fields in INDEX_ENTRY.iter_unpack(raw[:len(raw) - (len(raw) % INDEX_ENTRY.size)]):
+        entry = IndexEntry(*fields)
+
+        if entry.offset + entry.length > data_size:
+            break
+
+        entries.append(entry)
+        data_end = entry.offset + entry.length
+
+    # Records that were written but not indexed before a crash
+    missing = []
+
+    if data_size > data_end:
+        with open(data_path, "rb") as data_file:
+            buffer = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                while True:
+                    length = check_record(buffer, data_end, data_size)
+
+                    if length is None:
+                        break
+
+                    record = decode_record(buffer, data_end)
+                    missing.append(IndexEntry(record.session_id, record.patient_id,
+                                              record.start_time, data_end, length))
+                    del record
+                    data_end += length
+            finally:
+                buffer.close()
+
+    return (entries, missing, data_end)
+
+# End def
+
+
+def read_entries(path):
+    """ Return the valid index entries of the store at path (read only) """
+    data_path = os.path.join(path, DATA_FILE)
+
+    try:
+        data_size = os.path.getsize(data_path)
+
+        with open(os.path.join(path, INDEX_FILE), "rb") as index_file:
+            raw = index_file.read()
+    except FileNotFoundError:
+        return []
+
+    (entries, missing, data_end) = _scan(data_path, data_size, raw)
+
+    return entries + missing
+
+# End def
+
+
+class SessionStore():
+    """ Session Store Class """
+    path              = None
+    sync_batch        = None
+    sync_interval     = None
+    encoding          = None
+
+    data_file         = None
+    index_file        = None
+    data_size         = None
+
+    def __init__(self, path, sync_batch=32, sync_interval=1.0, encoding=ENCODING_RAW):
+        """ Open the store and start the writer thread """
+        self.path          = path
+        self.encoding      = encoding
+        self.sync_batch    = sync_batch
+        self.sync_interval = sync_interval
+
+        os.makedirs(path, exist_ok=True)
+
+        self._lock          = threading.Lock()
+        self._map           = None
+        self._map_size      = 0
+
+        # Sorted views of the index
+        self._entries       = []          # Sorted by session id
+        self._patients      = []          # Sorted (patient id, session id, position)
+        self._times         = []          # Sorted (start time, session id, position)
+
+        self._recover()
+
+        self._next_id       = (self._entries[-1].session_id + 1) if self._entries else 1
+
+        self._error         = None        # Error of the writer thread
+        self._queue         = queue.Queue()
+        self._writer        = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    # End def
+
+
+    def _recover(self):
+        """ Load the index and repair the end of the files after a crash """
+        data_path  = os.path.join(self.path, DATA_FILE)
+        index_path = os.path.join(self.path, INDEX_FILE)
+
+        with open(data_path, "ab") as data_file:
+            data_size = data_file.tell()
+
+        with open(index_path, "ab+") as index_file:
+            index_file.seek(0)
+            raw = index_file.read()
+
+        (entries, missing, data_end) = _scan(data_path, data_size, raw)
+
+        # Index the records that were not indexed and remove the torn end of the files
+        with open(data_path, "rb+") as data_file:
+            data_file.truncate(data_end)
+            os.fsync(data_file.fileno())
+
+        with open(index_path, "rb+") as index_file:
+            index_file.truncate(len(entries) * INDEX_ENTRY.size)
+            index_file.seek(0, os.SEEK_END)
+            for entry in missing:
+                index_file.write(INDEX_ENTRY.pack(*entry))
+            os.fsync(index_file.fileno())
+
+        self.data_size  = data_end
+        self.data_file  = open(data_path, "ab")
+        self.index_file = open(index_path, "ab")
+
+        for entry in entries + missing:
+            self._add_entry(entry)
+
+    # End def
+
+
+    def _add_entry(self, entry):
+        """ Add an index entry to the sorted views """
+        position = len(self._entries)
+
+        self._entries.append(entry)
+        bisect.insort(self._patients, (entry.patient_id, entry.session_id, position))
+        bisect.insort(self._times, (entry.start_time, entry.session_id, position))
+
+    # End def
+
+
+    def append(self, session, stats, patient_id=0):
+        """ Queue a session to be written and return its session id """
+        self._check_error()
+
+        with self._lock:
+            session_id     = self._next_id
+            self._next_id += 1
+
+        # Copy the columns now so the caller may reuse the session
+        self._queue.put((session_id, patient_id, session.start_time,
+                         encode_record(session_id, patient_id, session, stats, self.encoding)))
+
+        return session_id
+
+    # End def
+
+
+    def flush(self):
+        """ Wait until every queued session is written and on disk """
+        self._check_error()
+
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+        self._check_error()
+
+    # End def
+
+
+    def _check_error(self):
+        """ Raise the error of the writer thread (if it failed) """
+        if self._error is not None:
+            raise self._error
+
+    # End def
+
+
+    def _write_loop(self):
+        """ Write queued records and fsync them in batches """
+        pending  = []
+        deadline = None
+
+        while True:
+            if pending:
+                timeout = max(0.0, deadline - time.monotonic())
+            else:
+                timeout = None
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = TIMEOUT
+
+            try:
+                # Records queued after a failure are dropped
+                if isinstance(item, tuple) and (self._error is None):
+                    (session_id, patient_id, start_time, record) = item
+
+                    self.data_file.write(record)
+                    pending.append(IndexEntry(session_id, patient_id, start_time,
+                                              self.data_size, len(record)))
+                    self.data_size += len(record)
+
+                    if deadline is None:
+                        deadline = time.monotonic() + self.sync_interval
+
+                # Sync when the batch is full, the interval is over or on
+                # flush() / close()
+                if pending and ((not isinstance(item, tuple)) or (len(pending) >= self.sync_batch)):
+                    self._sync(pending)
+                    pending  = []
+                    deadline = None
+
+            except Exception as error:
+                # Keep running so that flush() / close() do not wait forever
+                self._error = error
+                pending     = []
+                deadline    = None
+
+            if isinstance(item, threading.Event):
+                item.set()
+
+            if item is None:
+                return
+
+    # End def
+
+
+    def _sync(self, pending):
+        """ fsync the data, then write and fsync the index of the batch """
+        self.data_file.flush()
+        os.fsync(self.data_file.fileno())
+
+        for entry in pending:
+            self.index_file.write(INDEX_ENTRY.pack(*entry))
+
+        self.index_file.flush()
+        os.fsync(self.index_file.fileno())
+
+        with self._lock:
+            for entry in pending:
+                self._add_entry(entry)
+
+    # End def
+
+
+    def _buffer(self, end):
+        """ Return an mmap of the data file that covers end """
+        if self._map_size < end:
+            with open(os.path.join(self.path, DATA_FILE), "rb") as data_file:
+                # The old map is released once no StoredSession uses it
+                self._map      = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._map_size = len(self._map)
+
+        return self._map
+
+    # End def
+
+
+    def get(self, session_id):
+        """ Return the StoredSession with the session id (None if not found) """
+        with self._lock:
+            position = bisect.bisect_left(self._entries, (session_id,))
+
+            if (position == len(self._entries)) or (self._entries[position].session_id != session_id):
+                return None
+
+            entry = self._entries[position]
+
+        return self.read(entry)
+
+    # End def
+
+
+    def read(self, entry):
+        """ Return the StoredSession of an index entry """
+        with self._lock:
+            buffer = self._buffer(entry.offset + entry.length)
+
+        return decode_record(buffer, entry.offset)
+
+    # End def
+
+
+    def read_stats(self, entry):
+        """ Return the TapStats of an index entry (the taps are not read) """
+        with self._lock:
+            buffer = self._buffer(entry.offset + entry.length)
+
+        fields = PAYLOAD.unpack_from(buffer, entry.offset + HEADER.size)
+
+        return TAP_ANALYSIS.TapStats(*fields[5:])
+
+    # End def
+
+
+    def find_patient(self, patient_id):
+        """ Return the index entries of a patient ordered by session id """
+        with self._lock:
+            start = bisect.bisect_left(self._patients, (patient_id,))
+            end   = bisect.bisect_left(self._patients, (patient_id + 1,))
+
+            return [self._entries[position] for (_, _, position) in self._patients[start:end]]
+
+    # End def
+
+
+    def find_time(self, start, end):
+        """ Return the index entries with start <= start_time < end """
+        with self._lock:
+            first = bisect.bisect_left(self._times, (start,))
+            last  = bisect.bisect_left(self._times, (end,))
+
+            return [self._entries[position] for (_, _, position) in self._times[first:last]]
+
+    # End def
+
+
+    def entries(self):
+        """ Return all index entries ordered by session id """
+        with self._lock:
+            return list(self._entries)
+
+    # End def
+
+
+    def close(self):
+        """ Write the queued sessions and close the files """
+        if self._writer is None:
+            return
+
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+
+        self.data_file.close()
+        self.index_file.close()
+
+        self._check_error()
+
+    # End def
+
+# End class
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import random
+    import tempfile
+
+    import tap_session as TAP_SESSION
+
+    print("Session Store Test")
+
+    path  = tempfile.mkdtemp()
+    store = SessionStore(path)
+
+    # Store sessions of 100 patients
+    start = time.perf_counter()
+
+    for i in range(1000):
+        session  = TAP_SESSION.TapSession(start_time=1700000000.0 + i * 60)
+        tap_ns   = 0
+
+        for j in range(random.randint(2, 100)):
+            tap_ns += random.randint(100000000, 500000000)
+            session.append(tap_ns - 30000000, tap_ns)
+
+        stats = TAP_ANALYSIS.analyze(session.frequencies())
+        store.append(session, stats, patient_id=i % 100)
+
+    store.flush()
+    elapsed = time.perf_counter() - start
+
+    print("    1000 sessions stored in {0:.3f} s".format(elapsed))
+
+    stored = store.get(500)
+    assert stored.session_id == 500
+    assert stored.patient_id == 499 % 100
+    assert TAP_ANALYSIS.analyze_release_ns(stored.release_ns) == stored.stats
+    del stored
+
+    assert len(store.find_patient(7)) == 10
+    assert len(store.find_time(1700000000.0, 1700000000.0 + 10 * 60)) == 10
+    assert store.get(5000) is None
+
+    store.close()
+
+    # Lose the last index entry and tear the last record of the data file
+    with open(os.path.join(path, INDEX_FILE), "rb+") as index_file:
+        index_file.truncate(999 * INDEX_ENTRY.size)
+
+    with open(os.path.join(path, DATA_FILE), "ab") as data_file:
+        data_file.write(HEADER.pack(MAGIC, 1000, 0) + b"torn")
+
+    # Read only:  the same entries, the files are not changed
+    size = os.path.getsize(os.path.join(path, DATA_FILE))
+    assert [entry.session_id for entry in read_entries(path)] == list(range(1, 1001))
+    assert os.path.getsize(os.path.join(path, DATA_FILE)) == size
+
+    store = SessionStore(path)
+    assert len(store.entries()) == 1000
+    assert store.get(1000).session_id == 1000
+
+    # New sessions continue after the recovered ones
+    assert store.append(session, stats, patient_id=1) == 1001
+    store.close()
+
+    # The recovered entry was appended to the index file
+    store = SessionStore(path)
+    assert [entry.session_id for entry in store.entries()] == list(range(1, 1002))
+    store.close()
+
+    # Raw and compressed records can be mixed in a store
+    store = SessionStore(path, encoding=ENCODING_DELTA)
+    store.append(session, stats, patient_id=1)
+    store.flush()
+
+    (raw, compressed) = (store.get(1001), store.get(1002))
+    assert list(raw.release_ns) == list(compressed.release_ns)
+    assert raw.stats == compressed.stats
+    print("    Record size raw {0} bytes, compressed {1} bytes".format(
+          store.entries()[-2].length, store.entries()[-1].length))
+    del raw
+    store.close()
+
+    # A failed write is raised by flush() and the following calls
+    class FullFile():
+        """ Data file of a full disk """
+        def __init__(self, data_file):
+            self.data_file = data_file
+
+        def write(self, data):
+            raise OSError(28, "No space left on device")
+
+        def __getattr__(self, name):
+            return getattr(self.data_file, name)
+
+    store           = SessionStore(path)
+    store.data_file = FullFile(store.data_file)
+    store.append(session, stats, patient_id=1)
+
+    for function in (store.flush, lambda: store.append(session, stats), store.close):
+        try:
+            function()
+            assert False, "No error raised"
+        except OSError as error:
+            assert error.errno == 28
+
+    assert len(SessionStore(path).entries()) == 1002
+
+    print("Test Complete")
@@ -0,0 +1,263 @@
+"""
+--------------------------------------------------------------------------
+TapFreq Stations
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+TapFreq Stations
+
+  Runs several independent TapFreq stations (each with its own button,
+sensor, LED, buzzer and LCD) from one process.  Every station is a Proj
+driven by its own TapTestMachine, and all machines run in one asyncio event
+loop:
+
+    - Button and sensor edges are timestamped by the GPIO event thread, so
+      a station that is busy never delays the taps of another station
+    - Each LCD writes on its own thread, so the busy-waits of one display
+      never block the loop or another display
+    - LED / buzzer cues are tasks on the loop
+
+  The stations share one session store and one set of patient aggregates;
+the sensor id column of every session is the station id.  A station whose
+machine fails is reset (Proj.reset():  cues off, input queues dropped) and
+restarted without stopping the other stations.
+
+  The pins of every station are listed once in the STATIONS table below.
+
+Software API:
+
+  StationManager(stations=STATIONS, store_path=STORE_PATH)
+    - Create one Proj per station of the table
+
+    await run()
+      - Run every station until cancelled
+
+    close()
+      - Clean up the stations and close the store
+
+  station_pins(stations=STATIONS)
+    - Return the pinmux.configure() table of the pins in the stations
+
+Usage:
+
+  python3 stations.py [--stations N] [--store PATH]
+
+"""
+import argparse
+import asyncio
+import os
+import traceback
+
+import patient_aggregates as PATIENT_AGGREGATES
+import pinmux as PINMUX
+import proj as PROJ
+import proj_fsm as PROJ_FSM
+import session_store as SESSION_STORE
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+STORE_PATH    = PROJ.STORE_PATH
+
+# Seconds before a failed station is restarted
+RESTART_DELAY = 2.0
+
+# Proj arguments of every station (station 1 uses the Proj defaults)
+STATIONS = (
+    {},
+    {"button": "P2_20", "sensor": "P2_22", "led": "P2_24", "buzzer": "P1_36",
+     "rs": "P1_6", "enable": "P1_8", "d4": "P1_10", "d5": "P1_12",
+     "d6": "P1_29", "d7": "P1_31"},
+)
+
+# Proj argument of a pin:  pinmux mode, use
+PIN_ROLES = (
+    ("button", "gpio", "button"),
+    ("sensor", "gpio", "sensor"),
+    ("led",    "gpio", "LED"),
+    ("buzzer", "pwm",  "buzzer"),
+    ("rs",     "gpio", "LCD rs"),
+    ("enable", "gpio", "LCD enable"),
+    ("d4",     "gpio", "LCD d4"),
+    ("d5",     "gpio", "LCD d5"),
+    ("d6",     "gpio", "LCD d6"),
+    ("d7",     "gpio", "LCD d7"),
+)
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _pinmux_name(pin):
+    """ Return the pinmux name of a pin ("P1_6" -> "P1_06") """
+    (header, number) = pin.split("_")
+
+    return "{0}_{1:02d}".format(header, int(number))
+
+# End def
+
+
+def station_pins(stations=STATIONS):
+    """ Return the pinmux table (pin, mode, use) of the pins of the
+        stations (the pins of the Proj defaults are in pinmux.PINS)
+    """
+    pins = []
+
+    for (station_id, arguments) in enumerate(stations, 1):
+        for (argument, mode, use) in PIN_ROLES:
+            if argument in arguments:
+                pins.append((_pinmux_name(arguments[argument]), mode,
+                             "Station {0} {1}".format(station_id, use)))
+
+    return tuple(pins)
+
+# End def
+
+
+class StationManager():
+    """ TapFreq Station Manager Class """
+    stations       = None
+    store          = None
+    aggregates     = None
+
+    def __init__(self, stations=STATIONS, store_path=STORE_PATH):
+        """ Create one Proj per station sharing one session store """
+        self.stations = []
+
+        if store_path is not None:
+            self.store      = SESSION_STORE.SessionStore(store_path,
+                                                         encoding=SESSION_STORE.ENCODING_DELTA)
+            self.aggregates = PATIENT_AGGREGATES.PatientAggregates.load(self._aggregates_path())
+            self.aggregates.catch_up(self.store)
+
+        for (station_id, pins) in enumerate(stations, 1):
+            proj            = PROJ.Proj(station_id=station_id, **pins)
+            proj.store      = self.store
+            proj.aggregates = self.aggregates
+
+            self.stations.append(proj)
+
+    # End def
+
+
+    def _aggregates_path(self):
+        """ Return the path of the patient aggregates snapshot """
+        return os.path.join(self.store.path, PATIENT_AGGREGATES.AGGREGATES_FILE)
+
+    # End def
+
+
+    async def run(self):
+        """ Run every station until cancelled """
+        await asyncio.gather(*(self._supervise(proj) for proj in self.stations))
+
+    # End def
+
+
+    async def _supervise(self, proj):
+        """ Run the machine of a station and restart it if it fails """
+        while True:
+            machine = None
+
+            try:
+                # Outputs and queues as the failed machine left them
+                proj.reset()
+
+                machine = PROJ_FSM.TapTestMachine(proj)
+                await machine.run(count=None)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                print("Station {0} failed, restarting:".format(proj.station_id))
+                traceback.print_exc()
+            finally:
+                if machine is not None:
+                    machine.close()
+
+            await asyncio.sleep(RESTART_DELAY)
+
+    # End def
+
+
+    def close(self):
+        """ Clean up the stations and close the store """
+        for proj in self.stations:
+            # The store is shared:  it is closed once, below
+            proj.store = None
+
+            try:
+                proj.cleanup()
+            except Exception:
+                print("Station {0} cleanup failed:".format(proj.station_id))
+                traceback.print_exc()
+
+        if self.store is not None:
+            self.store.close()
+            self.aggregates.save(self._aggregates_path())
+
+    # End def
+
+# End class
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Run several TapFreq stations")
+    parser.add_argument("--stations", type=int, default=len(STATIONS),
+                        help="Number of stations of the table to run")
+    parser.add_argument("--store", default=STORE_PATH, help="Directory of the session store")
+    args = parser.parse_args()
+
+    print("Program Start")
+
+    PINMUX.configure(PINMUX.PINS + station_pins(STATIONS[0:args.stations]))
+
+    manager = StationManager(STATIONS[0:args.stations], args.store)
+
+    try:
+        asyncio.run(manager.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.close()
+
+    print("Program Complete")
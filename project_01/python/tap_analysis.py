@@ -0,0 +1,138 @@
+"""
+--------------------------------------------------------------------------
+Tap Analysis
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Tap Analysis
+
+  Computes the statistics shown at the end of a TapFreq test (average,
+standard deviation, minimum and maximum tap frequency).  This is the math
+used by Proj.run so that stored sessions can be analyzed the same way.
+
+Software API:
+
+  TapStats(count, mean, stdev, minimum, maximum)
+    - Named tuple of the results (NaN if there are no frequencies)
+
+  analyze(freq_list)
+    - Return the TapStats of a list of tap frequencies (Hz)
+
+  analyze_release_ns(release_ns, flags=None, include_late=True, max_freq=None)
+    - Return the TapStats of a sequence of tap release times (ns)
+    - Taps flagged FLAG_LATE are skipped if include_late is False
+    - Frequencies above max_freq (e.g. contact bounce) are skipped
+
+"""
+import collections
+
+import tap_session as TAP_SESSION
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+NAN           = float("nan")
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+TapStats = collections.namedtuple("TapStats", ["count", "mean", "stdev", "minimum", "maximum"])
+
+
+def analyze(freq_list):
+    """ Return the TapStats of a list of tap frequencies (Hz) """
+    if not freq_list:
+        return TapStats(0, NAN, NAN, NAN, NAN)
+
+    max_freq   = max(freq_list)
+    min_freq   = min(freq_list)
+    mean_freq  = sum(freq_list) / len(freq_list)
+    stdev_freq = (sum([((i - mean_freq) ** 2) for i in freq_list]) / len(freq_list)) ** 0.5
+
+    return TapStats(len(freq_list), mean_freq, stdev_freq, min_freq, max_freq)
+
+# End def
+
+
+def analyze_release_ns(release_ns, flags=None, include_late=True, max_freq=None):
+    """ Return the TapStats of a sequence of tap release times (ns)
+
+        release_ns   - Release time of each tap in ns
+        flags        - TapSession flags of each tap (None for no flags)
+        include_late - Include the taps released after the window ended
+        max_freq     - Skip frequencies above this value (None for no limit)
+    """
+    if (flags is not None) and (not include_late):
+        release_ns = [release_ns[i] for i in range(len(release_ns))
+                      if not (flags[i] & TAP_SESSION.FLAG_LATE)]
+
+    freq_list = [1e9 / (release_ns[i] - release_ns[i - 1])
+                 for i in range(1, len(release_ns))]
+
+    if max_freq is not None:
+        freq_list = [freq for freq in freq_list if freq <= max_freq]
+
+    return analyze(freq_list)
+
+# End def
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    print("Tap Analysis Test")
+
+    stats = analyze_release_ns([0, 250000000, 500000000, 1000000000])
+    print("    {0}".format(stats))
+
+    assert stats.count == 3
+    assert stats.minimum == 2.0
+    assert stats.maximum == 4.0
+
+    assert analyze([]).count == 0
+
+    flags = [TAP_SESSION.FLAG_FIRST, 0, 0, TAP_SESSION.FLAG_LATE]
+    assert analyze_release_ns([0, 250000000, 500000000, 1000000000], flags,
+                              include_late=False).count == 2
+    assert analyze_release_ns([0, 250000000, 500000000, 1000000000],
+                              max_freq=3.0).count == 1
+
+    print("Test Complete")
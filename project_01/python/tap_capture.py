@@ -0,0 +1,441 @@
+"""
+--------------------------------------------------------------------------
+Isolated Tap Capture
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Isolated Tap Capture
+
+  Polls the sensor in a dedicated child process so that LCD busy-waits and
+analysis code in the main process (which hold the GIL) cannot delay the tap
+timestamps.  The child timestamps every tap with time.monotonic_ns() (the
+same clock in every process) and publishes it through a ring buffer in
+multiprocessing.shared_memory; the main process reads the ring in place.
+
+  The ring is an array of int64 in shared memory:
+
+    [0]          - Number of taps written (only the child writes it)
+    [1]          - Stop request (only the main process writes it)
+    [2 + 2 * i]  - Onset time (ns) of slot i
+    [3 + 2 * i]  - Release time (ns) of slot i
+
+  A tap is written to its slot before the count is incremented, so the
+reader never sees a partially written tap.  If the reader falls more than
+"capacity" taps behind, the oldest taps are lost and counted in "overruns".
+
+  The child is pinned to one core with os.sched_setaffinity when a core is
+given and the call is available (the PocketBeagle has a single core, so
+there the isolation is from the GIL, not from other processes).
+
+Software API:
+
+  TapCapture(pin, tapped_value=LOW, capacity=1024, poll_time=0.001,
+             cpu=None, isolated=True, read=None)
+    - isolated=False polls on a thread of this process instead (for
+      comparison)
+    - read is the function of the pin returning its level (default
+      GPIO.input)
+
+    start() / close()
+      - Start / stop the capture
+
+    discard()
+      - Skip the taps that have not been read
+
+    read_into(session, flags=FLAG_NONE)
+      - Append the unread taps to a TapSession, returns the number of taps
+
+    wait_for_tap(timeout=None)
+      - Wait for the next tap, returns (onset_ns, release_ns) or None
+      - Drop-in for Sensor.wait_for_tap() with get_tap_onset_ns() /
+        get_tap_release_ns()
+
+    interrupt() / clear_interrupt()
+      - Make the current (or next) wait_for_tap() raise
+        input_device.Interrupted / drop an interrupt that was not consumed
+
+Usage:
+
+  python3 tap_capture.py --benchmark
+    - Timestamp jitter of synthetic taps under a synthetic display load,
+      polled on a thread and in an isolated process
+
+"""
+import multiprocessing
+import multiprocessing.shared_memory
+import os
+import threading
+import time
+
+import Adafruit_BBIO.GPIO as GPIO
+
+import input_device as INPUT_DEVICE
+import tap_session as TAP_SESSION
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+HIGH          = GPIO.HIGH
+LOW           = GPIO.LOW
+
+# Ring header (int64 words)
+WRITTEN       = 0
+STOP          = 1
+HEADER_WORDS  = 2
+
+# Sleep between polls of the ring by the reader (s)
+READ_POLL     = 0.001
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _capture(ring, capacity, pin, tapped_value, poll_time, cpu, read):
+    """ Poll the pin and write every tap to the ring (capture process) """
+    if (cpu is not None) and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError:
+            pass
+
+    tapped   = (read(pin) == tapped_value)
+    onset_ns = time.monotonic_ns()
+    written  = ring[WRITTEN]
+
+    while not ring[STOP]:
+        level = (read(pin) == tapped_value)
+
+        if level != tapped:
+            now_ns = time.monotonic_ns()
+            tapped = level
+
+            if level:
+                onset_ns = now_ns
+            else:
+                slot = HEADER_WORDS + 2 * (written % capacity)
+                ring[slot]     = onset_ns
+                ring[slot + 1] = now_ns
+
+                # Publish the tap after it is written
+                written       += 1
+                ring[WRITTEN]  = written
+
+        time.sleep(poll_time)
+
+# End def
+
+
+class TapCapture():
+    """ Isolated Tap Capture Class """
+    pin            = None
+    tapped_value   = None
+    capacity       = None
+    isolated       = None
+
+    overruns       = None
+    tap_onset_ns   = None
+    tap_release_ns = None
+
+    def __init__(self, pin, tapped_value=LOW, capacity=1024, poll_time=0.001,
+                 cpu=None, isolated=True, read=None):
+        """ Create the shared ring of the capture """
+        self.pin          = pin
+        self.tapped_value = tapped_value
+        self.capacity     = capacity
+        self.isolated     = isolated
+        self.overruns     = 0
+
+        self._poll_time   = poll_time
+        self._cpu         = cpu
+        self._read        = GPIO.input if read is None else read
+        self._worker      = None
+        self._next        = 0
+        self._interrupt   = threading.Event()
+
+        size              = (HEADER_WORDS + 2 * capacity) * 8
+        self._shm         = multiprocessing.shared_memory.SharedMemory(create=True, size=size)
+        self._ring        = self._shm.buf.cast("q")
+        self._ring[WRITTEN] = 0
+        self._ring[STOP]    = 0
+
+    # End def
+
+
+    def start(self):
+        """ Start the capture process (or thread) """
+        arguments = (self._ring, self.capacity, self.pin, self.tapped_value,
+                     self._poll_time, self._cpu, self._read)
+
+        if self.isolated:
+            # Fork so the child shares the mapping of the ring
+            context      = multiprocessing.get_context("fork")
+            self._worker = context.Process(target=_capture, args=arguments, daemon=True)
+        else:
+            self._worker = threading.Thread(target=_capture, args=arguments, daemon=True)
+
+        self._worker.start()
+
+    # End def
+
+
+    def _unread(self):
+        """ Return the first unread tap and the number of taps written """
+        written = self._ring[WRITTEN]
+
+        if written - self._next > self.capacity:
+            self.overruns += written - self._next - self.capacity
+            self._next     = written - self.capacity
+
+        return (self._next, written)
+
+    # End def
+
+
+    def discard(self):
+        """ Skip the taps that have not been read """
+        self._next = self._ring[WRITTEN]
+
+    # End def
+
+
+    def read_into(self, session, flags=TAP_SESSION.FLAG_NONE):
+        """ Append the unread taps to a TapSession, returns the number of taps """
+        (first, written) = self._unread()
+        ring             = self._ring
+
+        for number in range(first, written):
+            slot = HEADER_WORDS + 2 * (number % self.capacity)
+            session.append(ring[slot], ring[slot + 1], 0, flags)
+
+        self._next = written
+
+        return written - first
+
+    # End def
+
+
+    def wait_for_tap(self, timeout=None):
+        """ Wait for the next tap, returns (onset_ns, release_ns) or None """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            (first, written) = self._unread()
+
+            if first < written:
+                break
+
+            if self._interrupt.is_set():
+                self._interrupt.clear()
+                raise INPUT_DEVICE.Interrupted()
+
+            if (deadline is not None) and (time.monotonic() >= deadline):
+                return None
+
+            time.sleep(READ_POLL)
+
+        slot                = HEADER_WORDS + 2 * (first % self.capacity)
+        self.tap_onset_ns   = self._ring[slot]
+        self.tap_release_ns = self._ring[slot + 1]
+        self._next          = first + 1
+
+        return (self.tap_onset_ns, self.tap_release_ns)
+
+    # End def
+
+
+    def interrupt(self):
+        """ Make the current (or next) wait_for_tap() raise Interrupted """
+        self._interrupt.set()
+
+    # End def
+
+
+    def clear_interrupt(self):
+        """ Drop an interrupt that no wait has consumed """
+        self._interrupt.clear()
+
+    # End def
+
+
+    def get_tap_onset_ns(self):
+        """ Return the monotonic time (ns) of the onset of the last tap read """
+        return self.tap_onset_ns
+
+    # End def
+
+
+    def get_tap_release_ns(self):
+        """ Return the monotonic time (ns) of the release of the last tap read """
+        return self.tap_release_ns
+
+    # End def
+
+
+    def close(self):
+        """ Stop the capture and free the ring """
+        if self._worker is not None:
+            self._ring[STOP] = 1
+            self._worker.join()
+            self._worker = None
+
+        self._ring.release()
+        self._shm.close()
+        self._shm.unlink()
+
+    # End def
+
+# End class
+
+
+class SyntheticTaps():
+    """ Pin levels of taps on a fixed schedule (benchmark input) """
+
+    def __init__(self, start_ns, period_ns, hold_ns, tapped_value=LOW):
+        """ Taps start every period_ns from start_ns and last hold_ns """
+        self.start_ns     = start_ns
+        self.period_ns    = period_ns
+        self.hold_ns      = hold_ns
+        self.tapped_value = tapped_value
+
+    # End def
+
+
+    def __call__(self, pin):
+        """ Return the level of the pin now """
+        elapsed_ns = time.monotonic_ns() - self.start_ns
+
+        if (elapsed_ns >= 0) and ((elapsed_ns % self.period_ns) < self.hold_ns):
+            return self.tapped_value
+
+        return HIGH if self.tapped_value == LOW else LOW
+
+    # End def
+
+    def error_ns(self, timestamp_ns, offset_ns=0):
+        """ Return the delay of a timestamp after the nearest scheduled edge """
+        elapsed_ns = timestamp_ns - self.start_ns - offset_ns
+
+        return elapsed_ns - round(elapsed_ns / self.period_ns) * self.period_ns
+
+    # End def
+
+# End class
+
+
+def _display_load(stop):
+    """ Busy-wait like LCD.write8 until stop is set (benchmark load) """
+    while not stop.is_set():
+        # One "character": 8 bit writes with 1 us busy-waits each
+        for bit in range(8):
+            end = time.perf_counter() + 1e-6
+
+            while time.perf_counter() < end:
+                pass
+
+        # A little pure Python work per character (formatting, analysis)
+        sum(i * i for i in range(200))
+
+# End def
+
+
+def jitter(isolated, taps=50, period=0.1, hold=0.03, load=True):
+    """ Return the release timestamp errors (ns) of synthetic taps """
+    start_ns = time.monotonic_ns() + 200000000
+    schedule = SyntheticTaps(start_ns, int(period * 1e9), int(hold * 1e9))
+    capture  = TapCapture("SYNTHETIC", isolated=isolated, read=schedule)
+    stop     = threading.Event()
+    session  = TAP_SESSION.TapSession()
+
+    if load:
+        threading.Thread(target=_display_load, args=(stop,), daemon=True).start()
+
+    capture.start()
+
+    try:
+        while len(session) < taps:
+            capture.wait_for_tap()
+            session.append(capture.get_tap_onset_ns(), capture.get_tap_release_ns())
+    finally:
+        stop.set()
+        capture.close()
+
+    return sorted(schedule.error_ns(release_ns, schedule.hold_ns)
+                  for release_ns in session.release_ns)
+
+# End def
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import sys
+
+    if "--benchmark" in sys.argv:
+        print("Tap Capture Jitter Benchmark (50 taps at 10 Hz)")
+
+        for (name, isolated, load) in (("thread, idle     ", False, False),
+                                       ("thread, LCD load ", False, True),
+                                       ("process, LCD load", True,  True)):
+            errors = jitter(isolated, load=load)
+
+            print("    {0}: median {1:6.2f} ms  p95 {2:6.2f} ms  max {3:6.2f} ms".format(
+                  name, errors[len(errors) // 2] / 1e6,
+                  errors[int(len(errors) * 0.95)] / 1e6, errors[-1] / 1e6))
+
+    else:
+        print("Tap Capture Test")
+
+        schedule = SyntheticTaps(time.monotonic_ns(), 50000000, 20000000)
+        capture  = TapCapture("SYNTHETIC", capacity=4, read=schedule)
+        capture.start()
+
+        assert capture.wait_for_tap(timeout=1.0) is not None
+        (onset_ns, release_ns) = (capture.get_tap_onset_ns(), capture.get_tap_release_ns())
+        assert 10000000 < (release_ns - onset_ns) < 30000000
+
+        # Falling behind by more than the capacity loses the oldest taps
+        time.sleep(0.5)
+        session = TAP_SESSION.TapSession()
+        count   = capture.read_into(session)
+        assert count == len(session) == 4
+        assert capture.overruns > 0
+
+        capture.close()
+        print("Test Complete")
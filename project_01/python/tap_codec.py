@@ -0,0 +1,382 @@
+"""
+--------------------------------------------------------------------------
+Tap Timestamp Codec
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Tap Timestamp Codec
+
+  Compresses a column of tap timestamps (int64 ns).  Each timestamp is stored
+as the difference to the previous tap, zigzag encoded (so negative
+differences stay small) and packed as a varint (7 bits per byte).  Taps
+100 ms apart take 4 bytes instead of 8.
+
+  Timestamps are grouped in blocks of "block_size" taps.  Every block starts
+with a header holding its first timestamp, so a block can be decoded on its
+own and a decoder can seek to a time by reading the block headers only.
+Blocks can optionally be zlib compressed (kept only if smaller).
+
+    block   - header   - first timestamp, tap count, payload length, flags
+              payload  - varints of the differences after the first timestamp
+
+Software API:
+
+  StreamEncoder(block_size=256, compress=False)
+    - Encoder fed one timestamp at a time (e.g. from the capture loop)
+
+    add(timestamp_ns)
+      - Add a timestamp
+
+    extend(timestamps_ns)
+      - Add a sequence of timestamps
+
+    finish()
+      - Return the encoded bytes of every timestamp added
+
+  BlockDecoder(buffer)
+    - Provide the encoded bytes (only the block headers are read)
+
+    __len__()
+      - Return the number of timestamps
+
+    decode()
+      - Return every timestamp as an array("q")
+
+    read_from(offset_ns)
+      - Return the timestamps at or after first timestamp + offset_ns,
+        decoding only the blocks from that time on
+
+  encode(timestamps_ns, block_size=256, compress=False)
+    - Return the encoded bytes of a sequence of timestamps
+
+  decode(buffer)
+    - Return the timestamps of encoded bytes as an array("q")
+
+"""
+import bisect
+import struct
+import zlib
+
+from array import array
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+# Block header:  first timestamp, tap count, payload length, flags
+BLOCK_HEADER    = struct.Struct("<qIIB")
+
+# Block flags
+FLAG_ZLIB       = 0x01
+
+INT64_MASK      = 0xFFFFFFFFFFFFFFFF
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _pack_varints(deltas, out):
+    """ Append the zigzag varints of deltas to the bytearray out """
+    for delta in deltas:
+        value = ((delta << 1) ^ (delta >> 63)) & INT64_MASK
+
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+
+        out.append(value)
+
+# End def
+
+
+def _unpack_varints(payload, first, count, out):
+    """ Append first and the count - 1 timestamps of payload to the array out """
+    out.append(first)
+
+    value     = first
+    shift     = 0
+    zigzag    = 0
+
+    for byte in payload:
+        zigzag |= (byte & 0x7F) << shift
+
+        if byte & 0x80:
+            shift += 7
+            continue
+
+        value += (zigzag >> 1) ^ -(zigzag & 1)
+        out.append(value)
+
+        shift  = 0
+        zigzag = 0
+
+    if len(out) < count:
+        raise ValueError("Truncated tap timestamp block")
+
+# End def
+
+
+class StreamEncoder():
+    """ Stream Encoder Class """
+    block_size     = None
+    compress       = None
+
+    def __init__(self, block_size=256, compress=False):
+        """ Initialize the encoder """
+        if (block_size < 1):
+            raise ValueError("Block size must be at least 1 for StreamEncoder()")
+
+        self.block_size = block_size
+        self.compress   = compress
+
+        self._out       = bytearray()
+        self._payload   = bytearray()
+        self._first     = None
+        self._previous  = None
+        self._count     = 0
+
+    # End def
+
+
+    def add(self, timestamp_ns):
+        """ Add a timestamp """
+        if self._count == 0:
+            self._first = timestamp_ns
+        else:
+            _pack_varints((timestamp_ns - self._previous,), self._payload)
+
+        self._previous  = timestamp_ns
+        self._count    += 1
+
+        if self._count == self.block_size:
+            self._flush_block()
+
+    # End def
+
+
+    def extend(self, timestamps_ns):
+        """ Add a sequence of timestamps """
+        for timestamp_ns in timestamps_ns:
+            self.add(timestamp_ns)
+
+    # End def
+
+
+    def _flush_block(self):
+        """ Append the current block to the output """
+        payload = bytes(self._payload)
+        flags   = 0
+
+        if self.compress:
+            compressed = zlib.compress(payload)
+
+            if len(compressed) < len(payload):
+                payload = compressed
+                flags   = FLAG_ZLIB
+
+        self._out += BLOCK_HEADER.pack(self._first, self._count, len(payload), flags)
+        self._out += payload
+
+        self._payload = bytearray()
+        self._count   = 0
+
+    # End def
+
+
+    def finish(self):
+        """ Return the encoded bytes of every timestamp added """
+        if self._count:
+            self._flush_block()
+
+        return bytes(self._out)
+
+    # End def
+
+# End class
+
+
+class BlockDecoder():
+    """ Block Decoder Class """
+    buffer         = None
+    blocks         = None
+    firsts         = None
+
+    def __init__(self, buffer):
+        """ Read the block headers of the buffer """
+        self.buffer = memoryview(buffer)
+        self.blocks = []             # (first, count, payload offset, length, flags)
+        self.firsts = []
+
+        offset = 0
+
+        while offset < len(self.buffer):
+            (first, count, length, flags) = BLOCK_HEADER.unpack_from(self.buffer, offset)
+            offset += BLOCK_HEADER.size
+
+            self.blocks.append((first, count, offset, length, flags))
+            self.firsts.append(first)
+
+            offset += length
+
+    # End def
+
+
+    def __len__(self):
+        """ Return the number of timestamps """
+        return sum(block[1] for block in self.blocks)
+
+    # End def
+
+
+    def _decode_block(self, index, out):
+        """ Append the timestamps of a block to the array out """
+        (first, count, offset, length, flags) = self.blocks[index]
+        payload = self.buffer[offset:offset + length]
+
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+
+        block = array("q")
+        _unpack_varints(payload, first, count, block)
+        out.extend(block)
+
+    # End def
+
+
+    def decode(self):
+        """ Return every timestamp as an array("q") """
+        out = array("q")
+
+        for index in range(len(self.blocks)):
+            self._decode_block(index, out)
+
+        return out
+
+    # End def
+
+
+    def read_from(self, offset_ns):
+        """ Return the timestamps at or after first timestamp + offset_ns """
+        out = array("q")
+
+        if not self.blocks:
+            return out
+
+        timestamp = self.firsts[0] + offset_ns
+
+        # Last block that starts at or before the time
+        index = max(0, bisect.bisect_right(self.firsts, timestamp) - 1)
+
+        self._decode_block(index, out)
+
+        # Drop the timestamps of the first block before the time
+        start = bisect.bisect_left(out, timestamp)
+        del out[:start]
+
+        for index in range(index + 1, len(self.blocks)):
+            self._decode_block(index, out)
+
+        return out
+
+    # End def
+
+# End class
+
+
+def encode(timestamps_ns, block_size=256, compress=False):
+    """ Return the encoded bytes of a sequence of timestamps """
+    encoder = StreamEncoder(block_size, compress)
+    encoder.extend(timestamps_ns)
+
+    return encoder.finish()
+
+# End def
+
+
+def decode(buffer):
+    """ Return the timestamps of encoded bytes as an array("q") """
+    return BlockDecoder(buffer).decode()
+
+# End def
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    print("Tap Timestamp Codec Test")
+
+    # 10 minutes of tapping at ~5 Hz with jitter
+    timestamps = array("q")
+    tap_ns     = time.monotonic_ns()
+
+    for i in range(3000):
+        tap_ns += random.randint(150000000, 250000000)
+        timestamps.append(tap_ns)
+
+    for compress in (False, True):
+        start   = time.perf_counter()
+        encoded = encode(timestamps, compress=compress)
+        encode_time = time.perf_counter() - start
+
+        start   = time.perf_counter()
+        decoded = decode(encoded)
+        decode_time = time.perf_counter() - start
+
+        assert decoded == timestamps
+
+        print("    zlib={0}: {1:.2f} bytes per tap (raw 8), "
+              "encode {2:.0f} taps/s, decode {3:.0f} taps/s".format(
+                  compress, len(encoded) / len(timestamps),
+                  len(timestamps) / encode_time, len(timestamps) / decode_time))
+
+    # Seek to 5 minutes into the session
+    decoder = BlockDecoder(encode(timestamps, compress=True))
+    offset  = 5 * 60 * 1000000000
+    tail    = decoder.read_from(offset)
+
+    assert list(tail) == [t for t in timestamps if t >= timestamps[0] + offset]
+    assert len(decoder) == len(timestamps)
+
+    # Negative differences (e.g. two sensors) still decode
+    assert list(decode(encode([10, 5, -3, 2 ** 40, 0]))) == [10, 5, -3, 2 ** 40, 0]
+
+    print("Test Complete")
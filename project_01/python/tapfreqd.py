@@ -0,0 +1,304 @@
+"""
+--------------------------------------------------------------------------
+TapFreq Daemon
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+TapFreq Daemon
+
+  Keeps one Proj (hardware, LCD and session store) initialized in a warm
+interpreter and runs tests on request, so the time from a request to the
+"TAP NOW" cue is the 5 second countdown instead of the startup of the
+"run" script.
+
+  Requests are sent over a Unix domain socket, one JSON object per line,
+and every request gets one JSON object per line back:
+
+    {"command": "start", "patient_id": 12}
+        -> {"ok": true, "state": "COUNTDOWN"}
+    {"command": "status"}
+        -> {"ok": true, "state": "IDLE", "tests": 3, "patient_id": 12}
+    {"command": "results"}                       (last test)
+    {"command": "results", "session_id": 42}     (any stored test)
+        -> {"ok": true, "session_id": 42, "patient_id": 12,
+            "start_time": ..., "stats": {"count": ..., "mean": ..., ...}}
+
+  Errors are returned as {"ok": false, "error": "..."}.
+
+Usage:
+
+  python3 tapfreqd.py serve [--socket PATH] [--store PATH]
+  python3 tapfreqd.py start [--patient ID] [--socket PATH]
+  python3 tapfreqd.py status [--socket PATH]
+  python3 tapfreqd.py results [--session ID] [--socket PATH]
+
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import socket
+import traceback
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+SOCKET_PATH    = "/run/tapfreq.sock"
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _stats_dict(stats):
+    """ Return TapStats as a JSON compatible dict (NaN as None) """
+    return {name: (None if (isinstance(value, float) and math.isnan(value)) else value)
+            for (name, value) in stats._asdict().items()}
+
+# End def
+
+
+class Daemon():
+    """ TapFreq Daemon Class """
+    proj           = None
+    machine        = None
+    socket_path    = None
+
+    test           = None
+    tests          = None
+
+    def __init__(self, proj, socket_path=SOCKET_PATH):
+        """ Initialize the daemon for an initialized Proj """
+        self.proj        = proj
+        self.socket_path = socket_path
+        self.tests       = 0
+
+    # End def
+
+
+    async def serve(self):
+        """ Serve requests until SIGINT / SIGTERM """
+        # Import here so the client does not need the hardware libraries
+        import proj_fsm as PROJ_FSM
+
+        loop         = asyncio.get_running_loop()
+        stop         = asyncio.Event()
+        self.machine = PROJ_FSM.TapTestMachine(self.proj, show_results=False)
+
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop.set)
+
+        # Remove a socket left behind by a previous daemon
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+
+        await self.machine.lcd.message("READY")
+
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            if self.test is not None:
+                self.test.cancel()
+
+            self.machine.close()
+            os.unlink(self.socket_path)
+
+    # End def
+
+
+    async def _handle(self, reader, writer):
+        """ Answer the requests of one connection """
+        try:
+            while True:
+                line = await reader.readline()
+
+                if not line:
+                    break
+
+                try:
+                    response = self.handle_request(json.loads(line))
+                except Exception as error:
+                    response = {"ok": False, "error": str(error)}
+
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    # End def
+
+
+    def handle_request(self, request):
+        """ Return the response of a request """
+        import proj_fsm as PROJ_FSM
+
+        command = request.get("command")
+
+        if command == "start":
+            if (self.test is not None) and (not self.test.done()):
+                return {"ok": False, "error": "test running", "state": self.machine.state}
+
+            self.proj.patient_id = int(request.get("patient_id", self.proj.patient_id))
+            self.machine.state   = PROJ_FSM.COUNTDOWN
+            self.test            = asyncio.ensure_future(
+                self.machine.run(count=1, start=PROJ_FSM.COUNTDOWN))
+            self.test.add_done_callback(self._test_done)
+
+            return {"ok": True, "state": self.machine.state}
+
+        if command == "status":
+            return {"ok": True, "state": self.machine.state, "tests": self.tests,
+                    "patient_id": self.proj.patient_id}
+
+        if command == "results":
+            return self._results(request.get("session_id"))
+
+        return {"ok": False, "error": "unknown command {0!r}".format(command)}
+
+    # End def
+
+
+    def _test_done(self, test):
+        """ Count the finished tests, log the tests that failed """
+        import proj_fsm as PROJ_FSM
+
+        if test.cancelled():
+            return
+
+        error = test.exception()
+
+        if error is None:
+            self.tests += 1
+            return
+
+        # The next "start" request must find the machine idle
+        print("Test failed:")
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+        self.machine.state = PROJ_FSM.IDLE
+
+    # End def
+
+
+    def _results(self, session_id):
+        """ Return the response of a results request """
+        if session_id is None:
+            if self.machine.last_stats is None:
+                return {"ok": False, "error": "no results yet"}
+
+            return {"ok": True, "session_id": self.machine.last_session_id,
+                    "patient_id": self.machine.last_patient_id,
+                    "start_time": self.machine.last_start_time,
+                    "stats": _stats_dict(self.machine.last_stats)}
+
+        if self.proj.store is None:
+            return {"ok": False, "error": "no session store"}
+
+        stored = self.proj.store.get(int(session_id))
+
+        if stored is None:
+            return {"ok": False, "error": "unknown session {0}".format(session_id)}
+
+        return {"ok": True, "session_id": stored.session_id, "patient_id": stored.patient_id,
+                "start_time": stored.start_time, "stats": _stats_dict(stored.stats)}
+
+    # End def
+
+# End class
+
+
+def request(command, socket_path=SOCKET_PATH, **arguments):
+    """ Send a request to the daemon and return the response """
+    arguments["command"] = command
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(arguments).encode() + b"\n")
+
+        with client.makefile("rb") as response:
+            return json.loads(response.readline())
+
+# End def
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="TapFreq daemon and client")
+    parser.add_argument("command", choices=["serve", "start", "status", "results"])
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Path of the control socket")
+    parser.add_argument("--store", default=None, help="Directory of the session store (serve)")
+    parser.add_argument("--patient", type=int, default=None, help="Patient id (start)")
+    parser.add_argument("--session", type=int, default=None, help="Session id (results)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        import pinmux as PINMUX
+        import proj as PROJ
+
+        print("TapFreq daemon start")
+
+        PINMUX.configure()
+
+        proj = PROJ.Proj(store_path=args.store or PROJ.STORE_PATH)
+
+        try:
+            asyncio.run(Daemon(proj, args.socket).serve())
+        finally:
+            proj.cleanup()
+
+        print("TapFreq daemon stop")
+
+    else:
+        arguments = {}
+
+        if args.patient is not None:
+            arguments["patient_id"] = args.patient
+
+        if args.session is not None:
+            arguments["session_id"] = args.session
+
+        print(json.dumps(request(args.command, args.socket, **arguments), indent=2))
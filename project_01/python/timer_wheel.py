@@ -0,0 +1,346 @@
+"""
+--------------------------------------------------------------------------
+Timer Wheel
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Timer Wheel
+
+  One scheduler thread for the one-shot and periodic actions of every driver
+(LED blinks and flashes, LCD flashing, the countdown, ...), so none of them
+needs its own thread or a sleep in the caller.
+
+  The timers are kept in a hashed timing wheel:  "slots" lists, one per
+tick, and a timer due in n ticks is put in slot (now + n) % slots with
+(n - 1) // slots extra rounds.  Adding or cancelling a timer is O(1) and a
+tick only looks at the timers of one slot, whatever the number of timers.
+Ticks run on absolute deadlines (start + n * tick) and periodic timers are
+rescheduled from their due tick, so they do not drift.  When there are no
+timers, the thread sleeps until one is added (no idle wake ups).
+
+  Actions run on the wheel thread and must be short:  a slow action delays
+the actions of the following ticks.
+
+Software API:
+
+  TimerWheel(tick=0.01, slots=256)
+    start() / stop()
+
+    call_later(delay, function, *args)
+      - Call function(*args) once after delay seconds; returns a Timer
+
+    call_every(interval, function, *args, count=None, delay=None)
+      - Call function(*args) every interval seconds (count times, None for
+        until cancelled), the first time after delay (default interval)
+
+    Timer.cancel()
+      - Cancel the timer (any thread)
+
+  default_wheel()
+    - Return the shared wheel of the process (started on first use)
+
+"""
+import threading
+import time
+import traceback
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+DEFAULT_TICK  = 0.01              # s
+DEFAULT_SLOTS = 256
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# Shared wheel of the process (see default_wheel())
+shared_wheel  = None
+shared_lock   = threading.Lock()
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class Timer():
+    """ Timer Class """
+    __slots__ = ("function", "args", "interval", "count", "due", "rounds", "cancelled")
+
+    def __init__(self, function, args, interval=None, count=None):
+        """ Initialize the timer (interval in ticks for periodic timers) """
+        self.function  = function
+        self.args      = args
+        self.interval  = interval
+        self.count     = count
+        self.due       = None
+        self.rounds    = 0
+        self.cancelled = False
+
+    # End def
+
+
+    def cancel(self):
+        """ Cancel the timer (it is removed from the wheel when its slot is reached) """
+        self.cancelled = True
+
+    # End def
+
+# End class
+
+
+class TimerWheel():
+    """ Timer Wheel Class """
+    tick           = None
+    slots          = None
+    late_ticks     = None
+
+    def __init__(self, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS):
+        """ Initialize the wheel """
+        self.tick       = tick
+        self.slots      = [[] for i in range(slots)]
+        self.late_ticks = 0
+
+        self._now       = 0               # Last tick processed
+        self._base      = None            # perf_counter() of tick 0
+        self._timers    = 0               # Timers in the wheel
+        self._condition = threading.Condition()
+        self._stopped   = False
+        self._thread    = None
+
+    # End def
+
+
+    def start(self):
+        """ Start the wheel thread """
+        self._stopped = False
+        self._thread  = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # End def
+
+
+    def stop(self):
+        """ Stop the wheel thread (pending timers are dropped) """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # End def
+
+
+    def _ticks(self, seconds):
+        """ Return a delay in ticks (at least one) """
+        return max(1, int(round(seconds / self.tick)))
+
+    # End def
+
+
+    def call_later(self, delay, function, *args):
+        """ Call function(*args) once after delay seconds """
+        timer = Timer(function, args)
+
+        with self._condition:
+            self._add(timer, self._now + self._ticks(delay))
+
+        return timer
+
+    # End def
+
+
+    def call_every(self, interval, function, *args, count=None, delay=None):
+        """ Call function(*args) every interval seconds """
+        timer = Timer(function, args, self._ticks(interval), count)
+
+        with self._condition:
+            self._add(timer, self._now + self._ticks(interval if delay is None else delay))
+
+        return timer
+
+    # End def
+
+
+    def _add(self, timer, due):
+        """ Put a timer in the slot of its due tick (lock held) """
+        ticks        = max(1, due - self._now)
+        timer.due    = self._now + ticks
+        timer.rounds = (ticks - 1) // len(self.slots)
+
+        self.slots[timer.due % len(self.slots)].append(timer)
+        self._timers += 1
+
+        # Wake the thread if the wheel was empty
+        if self._timers == 1:
+            self._condition.notify_all()
+
+    # End def
+
+
+    def _run(self):
+        """ Process the ticks on absolute deadlines (wheel thread) """
+        while True:
+            with self._condition:
+                while (self._timers == 0) and (not self._stopped):
+                    self._base = None
+                    self._condition.wait()
+
+                if self._stopped:
+                    return
+
+                # Restart the clock after an idle period
+                if self._base is None:
+                    self._base = time.perf_counter() - self._now * self.tick
+
+            wait = self._base + (self._now + 1) * self.tick - time.perf_counter()
+
+            if wait > 0:
+                with self._condition:
+                    if self._condition.wait_for(lambda: self._stopped, wait):
+                        return
+            elif wait < -self.tick:
+                self.late_ticks += 1
+
+            self._process()
+
+    # End def
+
+
+    def _process(self):
+        """ Run the timers of the next tick """
+        with self._condition:
+            self._now += 1
+            slot       = self.slots[self._now % len(self.slots)]
+            due        = []
+            kept       = []
+
+            for timer in slot:
+                if timer.cancelled:
+                    self._timers -= 1
+                elif timer.rounds > 0:
+                    timer.rounds -= 1
+                    kept.append(timer)
+                else:
+                    self._timers -= 1
+                    due.append(timer)
+
+            slot[:] = kept
+
+        for timer in due:
+            if timer.cancelled:
+                continue
+
+            try:
+                timer.function(*timer.args)
+            except Exception:
+                traceback.print_exc()
+
+            if timer.interval is None:
+                continue
+
+            if timer.count is not None:
+                timer.count -= 1
+
+                if timer.count <= 0:
+                    continue
+
+            # From the due tick, so periodic timers do not drift
+            with self._condition:
+                if not timer.cancelled:
+                    self._add(timer, timer.due + timer.interval)
+
+    # End def
+
+# End class
+
+
+def default_wheel():
+    """ Return the shared wheel of the process (started on first use) """
+    global shared_wheel
+
+    with shared_lock:
+        if shared_wheel is None:
+            shared_wheel = TimerWheel()
+            shared_wheel.start()
+
+    return shared_wheel
+
+# End def
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    print("Timer Wheel Test")
+
+    wheel = TimerWheel()
+    wheel.start()
+
+    # 1000 periodic timers at 10 Hz and some one-shots on one thread
+    counts = [0] * 1000
+    times  = []
+
+    def count(i):
+        counts[i] += 1
+
+    timers = [wheel.call_every(0.1, count, i) for i in range(1000)]
+    wheel.call_every(0.1, lambda: times.append(time.perf_counter()), count=20)
+    cancelled = wheel.call_later(0.5, counts.append, "cancelled")
+    cancelled.cancel()
+    long_delay = wheel.call_later(2.7, counts.append, "long")   # > slots ticks
+
+    time.sleep(3.0)
+
+    for timer in timers:
+        timer.cancel()
+
+    print("    {0} threads, {1}-{2} calls per timer, late ticks {3}".format(
+          threading.active_count(), min(counts[0:1000]), max(counts[0:1000]),
+          wheel.late_ticks))
+
+    # No drift:  20 ticks of 0.1 s take 1.9 s from the first
+    drift = (times[-1] - times[0]) - 1.9
+    print("    Drift over 20 periods: {0:+.2f} ms".format(drift * 1e3))
+
+    assert len(times) == 20
+    assert abs(drift) < 0.01
+    assert "cancelled" not in counts
+    assert counts[-1] == "long"
+
+    wheel.stop()
+
+    print("Test Complete")
@@ -0,0 +1,271 @@
+"""
+--------------------------------------------------------------------------
+Sliding Window Statistics
+--------------------------------------------------------------------------
+License:
+Copyright 2024 Gloria Ni
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software without
+specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+--------------------------------------------------------------------------
+
+Sliding Window Statistics
+
+  Keeps the count, mean, minimum and maximum of the values seen during the
+last "window" seconds (e.g. the tap frequencies of the last 5 seconds) so
+they can be shown live while the patient is still tapping.
+
+  Every value is stored once with its timestamp and removed once it is older
+than the window, so memory is bounded by the number of values in the window.
+The minimum and maximum are kept in monotonic deques and the mean in a
+running sum, so each add() / expire() costs amortized O(1).
+
+Software API:
+
+  SlidingWindowStats(window=5.0)
+    - Provide the length of the window (same units as the timestamps)
+
+    add(value, timestamp)
+      - Add a value and drop every value older than the window
+
+    expire(now)
+      - Drop every value older than the window without adding a value
+
+    count() / mean() / minimum() / maximum()
+      - Return the statistics of the values in the window
+      - mean() / minimum() / maximum() return None if the window is empty
+
+    rate()
+      - Return the number of values per unit of time in the window
+
+    reset()
+      - Remove all values
+
+"""
+import time
+
+from collections import deque
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Global variables
+# ------------------------------------------------------------------------
+
+# None
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class SlidingWindowStats():
+    """ Sliding Window Statistics Class """
+    window       = None
+
+    values       = None
+    min_deque    = None
+    max_deque    = None
+    total        = None
+
+    def __init__(self, window=5.0):
+        """ Initialize variables """
+        if (window <= 0):
+            raise ValueError("Window must be positive for SlidingWindowStats()")
+
+        self.window    = window
+
+        # Values in the window as (timestamp, value), oldest first
+        self.values    = deque()
+
+        # Monotonic deques of (timestamp, value):  values increase from the
+        # front of min_deque and decrease from the front of max_deque, so
+        # the front is always the minimum / maximum of the window
+        self.min_deque = deque()
+        self.max_deque = deque()
+
+        self.total     = 0.0
+
+    # End def
+
+
+    def add(self, value, timestamp=None):
+        """ Add a value to the window
+
+            value     - Value to add
+            timestamp - Time of the value (default time.time())
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        self.values.append((timestamp, value))
+        self.total += value
+
+        # Values that can never be the minimum / maximum again are dropped
+        while self.min_deque and (self.min_deque[-1][1] >= value):
+            self.min_deque.pop()
+        self.min_deque.append((timestamp, value))
+
+        while self.max_deque and (self.max_deque[-1][1] <= value):
+            self.max_deque.pop()
+        self.max_deque.append((timestamp, value))
+
+        self.expire(timestamp)
+
+    # End def
+
+
+    def expire(self, now=None):
+        """ Drop the values that are older than the window
+
+            now       - Current time (default time.time())
+        """
+        if now is None:
+            now = time.time()
+
+        cutoff = now - self.window
+
+        while self.values and (self.values[0][0] <= cutoff):
+            self.total -= self.values.popleft()[1]
+
+        while self.min_deque and (self.min_deque[0][0] <= cutoff):
+            self.min_deque.popleft()
+
+        while self.max_deque and (self.max_deque[0][0] <= cutoff):
+            self.max_deque.popleft()
+
+        # Do not let rounding errors of the running sum build up
+        if not self.values:
+            self.total = 0.0
+
+    # End def
+
+
+    def count(self):
+        """ Return the number of values in the window """
+        return len(self.values)
+
+    # End def
+
+
+    def mean(self):
+        """ Return the mean of the window (None if the window is empty) """
+        if not self.values:
+            return None
+
+        return self.total / len(self.values)
+
+    # End def
+
+
+    def minimum(self):
+        """ Return the minimum of the window (None if the window is empty) """
+        if not self.min_deque:
+            return None
+
+        return self.min_deque[0][1]
+
+    # End def
+
+
+    def maximum(self):
+        """ Return the maximum of the window (None if the window is empty) """
+        if not self.max_deque:
+            return None
+
+        return self.max_deque[0][1]
+
+    # End def
+
+
+    def rate(self):
+        """ Return the number of values per unit of time in the window """
+        return len(self.values) / self.window
+
+    # End def
+
+
+    def reset(self):
+        """ Remove all values from the window """
+        self.values.clear()
+        self.min_deque.clear()
+        self.max_deque.clear()
+        self.total = 0.0
+
+    # End def
+
+# End class
+
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import random
+
+    print("Sliding Window Statistics Test")
+
+    stats = SlidingWindowStats(window=5.0)
+
+    # Compare against a brute force computation on random tap frequencies
+    samples   = []
+    timestamp = 0.0
+
+    for i in range(10000):
+        timestamp += random.uniform(0.05, 1.0)
+        value      = random.uniform(1.0, 8.0)
+
+        stats.add(value, timestamp)
+        samples.append((timestamp, value))
+
+        window = [v for (t, v) in samples[-200:] if t > timestamp - 5.0]
+
+        assert stats.count() == len(window)
+        assert stats.minimum() == min(window)
+        assert stats.maximum() == max(window)
+        assert abs(stats.mean() - (sum(window) / len(window))) < 1e-9
+
+    # Values expire even if no new value arrives
+    stats.expire(timestamp + 5.0)
+    assert stats.count() == 0
+    assert stats.mean() is None
+
+    # Time the update
+    start = time.perf_counter()
+
+    for i in range(100000):
+        stats.add(random.uniform(1.0, 8.0), i * 0.1)
+
+    elapsed = time.perf_counter() - start
+
+    print("    {0:.2f} us per add()".format(elapsed * 1e6 / 100000))
+    print("    {0} values held for a 5 s window at 10 Hz".format(stats.count()))
+
+    print("Test Complete")
@@ -1,6 +1,7 @@
-import Adafruit_BBIO.GPIO as GPIO
 import time
 
+import usr_led as USR_LED
+
 """
 --------------------------------------------------------------------------
 Blink LED
@@ -14,6 +15,9 @@ Simple function that will for each cycle
 
 Operations:
   - Blinks USR3 LED at a frequency of 5 Hz
+  - The blinking is done by the kernel "timer" LED trigger (usr_led.py), so
+    the program exits and the LED keeps blinking without using the CPU
+  - Without the trigger, the LED is toggled from Python until Ctrl-C
 
 Error conditions:
   -None
@@ -23,12 +27,12 @@ Error conditions:
 """
 
 if __name__ == "__main__":
-    GPIO.setup("USR%d" % 3, GPIO.OUT)
-
-    while True:
-
-        GPIO.output("USR%d" % 3, GPIO.HIGH)
-        time.sleep(0.1)
-    
-        GPIO.output("USR%d" % 3, GPIO.LOW)
-        time.sleep(0.1)
\ No newline at end of file
+    led = USR_LED.UsrLED(3)
+    led.blink(100, 100)
+
+    if led.software:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            led.off()
@@ -0,0 +1,334 @@
+"""
+--------------------------------------------------------------------------
+USR LED Driver
+--------------------------------------------------------------------------
+License:
+Copyright 2024 - Gloria Ni
+
+Drives the USR0 - USR3 LEDs of the PocketBeagle through the kernel LED
+triggers in sysfs, so blinking costs no user space CPU:
+
+  /sys/class/leds/beaglebone:green:usr<N>/trigger      none, timer, heartbeat,
+                                                       oneshot, ...
+  /sys/class/leds/beaglebone:green:usr<N>/delay_on     ms (timer, oneshot)
+  /sys/class/leds/beaglebone:green:usr<N>/delay_off    ms (timer, oneshot)
+  /sys/class/leds/beaglebone:green:usr<N>/shot         fire a oneshot
+  /sys/class/leds/beaglebone:green:usr<N>/brightness   0 / 1
+
+When a trigger is not available (no sysfs entry for the LED, or a kernel
+without the trigger), the LED falls back to toggling from a Python thread,
+through the "brightness" file or the USR<N> GPIO.
+
+Software API:
+
+  UsrLED(number, root=LEDS_ROOT)
+    triggers()
+      - Return the list of available triggers (read once)
+
+    blink(delay_on, delay_off)
+      - Blink with the "timer" trigger (ms)
+
+    heartbeat()
+      - Blink with the "heartbeat" trigger
+
+    oneshot(delay_on, delay_off=0)
+      - Turn on once for delay_on ms with the "oneshot" trigger
+
+    on() / off()
+      - Stop the trigger and set the LED
+
+    software
+      - True if the last blink / heartbeat / oneshot fell back to software
+
+Usage:
+
+  python3 usr_led.py --test    - Self test on a fake sysfs tree
+
+--------------------------------------------------------------------------
+"""
+import os
+import threading
+import time
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+LEDS_ROOT     = "/sys/class/leds"
+LED_NAME      = "beaglebone:green:usr{0}"
+
+# Software heartbeat:  (on, off) steps in ms
+HEARTBEAT     = ((70, 100), (70, 760))
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _gpio():
+    """ Return the GPIO module (only the fallback without sysfs needs it) """
+    import Adafruit_BBIO.GPIO as GPIO
+
+    return GPIO
+
+# End def
+
+
+class UsrLED():
+    """ USR LED Class """
+    number     = None
+    path       = None
+    software   = None
+
+    def __init__(self, number, root=LEDS_ROOT):
+        """ Provide the number of the USR LED (0 - 3) """
+        self.number    = number
+        self.path      = os.path.join(root, LED_NAME.format(number))
+        self.software  = False
+
+        self._stop     = threading.Event()
+        self._thread   = None
+        self._triggers = None
+
+        if not os.path.isdir(self.path):
+            GPIO = _gpio()
+            GPIO.setup("USR{0}".format(number), GPIO.OUT)
+
+    # End def
+
+
+    def _write(self, name, value):
+        """ Write an attribute of the LED """
+        with open(os.path.join(self.path, name), "w") as attribute:
+            attribute.write(str(value))
+
+    # End def
+
+
+    def triggers(self):
+        """ Return the list of available triggers """
+        if self._triggers is None:
+            try:
+                with open(os.path.join(self.path, "trigger")) as trigger:
+                    text = trigger.read()
+            except OSError:
+                text = ""
+
+            # The current trigger is shown in brackets, e.g. "none [timer] heartbeat"
+            self._triggers = [name.strip("[]") for name in text.split()]
+
+        return self._triggers
+
+    # End def
+
+
+    def _trigger(self, name, **attributes):
+        """ Select a kernel trigger; returns False if it is not available """
+        self._stop_software()
+
+        if name not in self.triggers():
+            return False
+
+        self._write("trigger", name)
+
+        for (attribute, value) in attributes.items():
+            self._write(attribute, value)
+
+        self.software = False
+
+        return True
+
+    # End def
+
+
+    def blink(self, delay_on, delay_off):
+        """ Blink delay_on ms on, delay_off ms off """
+        if not self._trigger("timer", delay_on=delay_on, delay_off=delay_off):
+            self._start_software([(delay_on, delay_off)], True)
+
+    # End def
+
+
+    def heartbeat(self):
+        """ Blink a heartbeat """
+        if not self._trigger("heartbeat"):
+            self._start_software(HEARTBEAT, True)
+
+    # End def
+
+
+    def oneshot(self, delay_on, delay_off=0):
+        """ Turn the LED on once for delay_on ms """
+        if self._trigger("oneshot", delay_on=delay_on, delay_off=delay_off):
+            self._write("shot", 1)
+        else:
+            self._start_software([(delay_on, delay_off)], False)
+
+    # End def
+
+
+    def on(self):
+        """ Stop the trigger and turn the LED on """
+        self._set_trigger_none()
+        self._set(True)
+
+    # End def
+
+
+    def off(self):
+        """ Stop the trigger and turn the LED off """
+        self._set_trigger_none()
+        self._set(False)
+
+    # End def
+
+
+    def _set_trigger_none(self):
+        """ Stop any kernel or software trigger """
+        self._stop_software()
+
+        if "none" in self.triggers():
+            self._write("trigger", "none")
+
+    # End def
+
+
+    def _set(self, on):
+        """ Set the LED through sysfs or GPIO """
+        if os.path.isdir(self.path):
+            self._write("brightness", 1 if on else 0)
+        else:
+            GPIO = _gpio()
+            GPIO.output("USR{0}".format(self.number), GPIO.HIGH if on else GPIO.LOW)
+
+    # End def
+
+
+    def _start_software(self, steps, repeat):
+        """ Toggle the LED from a thread (no kernel trigger) """
+        self._stop_software()
+
+        if os.path.isdir(self.path) and ("none" in self.triggers()):
+            self._write("trigger", "none")
+
+        self.software = True
+        self._stop.clear()
+        self._thread  = threading.Thread(target=self._software, args=(steps, repeat),
+                                         daemon=True)
+        self._thread.start()
+
+    # End def
+
+
+    def _software(self, steps, repeat):
+        """ Toggle the LED on absolute deadlines (software trigger thread) """
+        deadline = time.monotonic()
+
+        while True:
+            for (delay_on, delay_off) in steps:
+                for (on, delay) in ((True, delay_on), (False, delay_off)):
+                    self._set(on)
+                    deadline += delay / 1000.0
+
+                    if self._stop.wait(max(0.0, deadline - time.monotonic())):
+                        return
+
+            if not repeat:
+                return
+
+    # End def
+
+
+    def _stop_software(self):
+        """ Stop the software trigger thread """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    # End def
+
+# End class
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    if "--test" in sys.argv:
+        print("USR LED Test")
+
+        def fake_led(root, number, triggers):
+            """ Create the sysfs files of a LED """
+            path = os.path.join(root, LED_NAME.format(number))
+            os.makedirs(path)
+
+            for (name, value) in (("trigger", triggers), ("brightness", "0"),
+                                  ("delay_on", "500"), ("delay_off", "500"), ("shot", "")):
+                with open(os.path.join(path, name), "w") as attribute:
+                    attribute.write(value)
+
+            return path
+
+        def read(path, name):
+            with open(os.path.join(path, name)) as attribute:
+                return attribute.read()
+
+        root = tempfile.mkdtemp()
+
+        # Kernel triggers:  the settings are written, no thread is started
+        path = fake_led(root, 3, "[none] timer heartbeat oneshot")
+        led  = UsrLED(3, root)
+
+        led.blink(100, 100)
+        assert (read(path, "trigger"), read(path, "delay_on"), read(path, "delay_off")) == \
+               ("timer", "100", "100")
+        assert not led.software and (threading.active_count() == 1)
+
+        led.heartbeat()
+        assert read(path, "trigger") == "heartbeat"
+
+        led.oneshot(50)
+        assert (read(path, "trigger"), read(path, "shot")) == ("oneshot", "1")
+
+        led.on()
+        assert (read(path, "trigger"), read(path, "brightness")) == ("none", "1")
+
+        # No timer trigger:  software blinking through "brightness"
+        path = fake_led(root, 2, "[none]")
+        led  = UsrLED(2, root)
+
+        led.blink(20, 20)
+        assert led.software
+
+        # The fake file is empty while the thread rewrites it (a sysfs
+        # attribute is never empty):  such reads are skipped
+        levels = set()
+        for i in range(20):
+            levels.add(read(path, "brightness"))
+            time.sleep(0.005)
+
+        levels.discard("")
+
+        led.off()
+        assert levels == {"0", "1"} and (read(path, "brightness") == "0")
+        assert threading.active_count() == 1
+
+        print("Test Complete")
+
+    else:
+        # Blink USR3 at 5 Hz in the kernel and exit
+        led = UsrLED(3)
+        led.blink(100, 100)
+
+        if led.software:
+            print("No timer trigger, blinking from Python (Ctrl-C to exit)")
+
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                led.off()